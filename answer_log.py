@@ -0,0 +1,174 @@
+"""
+История ответов пользователей с отложенной записью.
+Ответ только добавляется в буфер в памяти, а фоновый поток записывает буфер в таблицу answers пачками —
+каждые batch_size ответов или каждые flush_interval секунд — и в той же транзакции обновляет
+сводную статистику в таблице user_stats.
+"""
+import atexit
+import logging
+import threading
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple
+
+import sqlalchemy as sq
+from sqlalchemy.orm import Session
+
+from db import Answer, AnswerStats, UserStats, Words, dialect_insert, get_user_stats
+from scheduler import utcnow
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+
+class AnswerEvent(NamedTuple):
+    user_id: int
+    word_id: int
+    correct: bool
+    answered_at: datetime
+
+
+def apply_answers(stats: AnswerStats, answers: Iterable[bool]) -> AnswerStats:
+    """
+    Добавляет к статистике ответы в порядке их поступления.
+    :param stats: Статистика до ответов.
+    :param answers: Признаки верности ответов.
+    :return: Обновленная статистика.
+    """
+    total, correct, streak, best_streak = stats
+    for ok in answers:
+        total += 1
+        if ok:
+            correct += 1
+            streak += 1
+            best_streak = max(best_streak, streak)
+        else:
+            streak = 0
+    return AnswerStats(total, correct, streak, best_streak)
+
+
+class AnswerLog:
+    """
+    Буфер истории ответов. record не обращается к базе данных; статистика пользователя складывается
+    из записанной в user_stats и еще не записанных ответов из буфера.
+    """
+
+    def __init__(self, engine: sq.engine.Engine, batch_size: int = 500, flush_interval: float = 0.5) -> None:
+        """
+        :param engine: Движок SQLAlchemy.
+        :param batch_size: Количество ответов, при котором запись начинается досрочно.
+        :param flush_interval: Интервал записи в секундах.
+        """
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Ответы, ожидающие записи, и ответы, которые пишутся прямо сейчас
+        self._pending: List[AnswerEvent] = []
+        self._flushing: List[AnswerEvent] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='answer-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, user_id: int, word_id: int, correct: bool) -> None:
+        """
+        Добавляет ответ в буфер.
+        :param user_id: Идентификатор пользователя.
+        :param word_id: Идентификатор слова карточки.
+        :param correct: True, если ответ верный.
+        """
+        event = AnswerEvent(user_id, word_id, correct, utcnow())
+        with self._lock:
+            self._pending.append(event)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def pending(self) -> int:
+        """
+        :return: Количество ответов, еще не записанных в базу данных.
+        """
+        with self._lock:
+            return len(self._pending) + len(self._flushing)
+
+    def stats(self, user_id: int) -> AnswerStats:
+        """
+        Возвращает статистику пользователя с учетом ответов, еще не записанных в базу данных.
+        Чтение выполняется между записями пачек, чтобы ответы не учитывались дважды.
+        :param user_id: Идентификатор пользователя.
+        """
+        with self._flush_lock:
+            with Session(self.engine) as session:
+                stored = get_user_stats(session, user_id)
+            with self._lock:
+                answers = [event.correct for event in self._pending if event.user_id == user_id]
+        return apply_answers(stored, answers)
+
+    def flush(self) -> int:
+        """
+        Записывает накопленные ответы и обновляет статистику пользователей одной транзакцией.
+        Строки статистики блокируются на время обновления, поэтому несколько процессов бота не теряют ответы.
+        При ошибке ответы возвращаются в буфер и будут записаны при следующей попытке.
+        :return: Количество записанных ответов.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, []
+            by_user: Dict[int, List[bool]] = defaultdict(list)
+            for event in self._flushing:
+                by_user[event.user_id].append(event.correct)
+            users = sorted(by_user)
+            try:
+                with Session(self.engine) as session, session.begin():
+                    # Слово могло быть удалено, пока ответ ждал записи: такой ответ удалился бы вместе со словом
+                    word_ids = {event.word_id for event in self._flushing}
+                    existing = set(session.scalars(sq.select(Words.id).where(Words.id.in_(word_ids))))
+                    rows = [event._asdict() for event in self._flushing if event.word_id in existing]
+                    if rows:
+                        session.execute(sq.insert(Answer), rows)
+                    session.execute(
+                        dialect_insert(session, UserStats.__table__).on_conflict_do_nothing(index_elements=['user_id']),
+                        [{'user_id': user_id} for user_id in users]
+                    )
+                    current = session.execute(
+                        sq.select(UserStats.user_id, UserStats.answers, UserStats.correct, UserStats.streak,
+                                  UserStats.best_streak)
+                        .where(UserStats.user_id.in_(users)).order_by(UserStats.user_id).with_for_update()
+                    ).all()
+                    session.execute(sq.update(UserStats), [
+                        {'user_id': row.user_id, **apply_answers(AnswerStats(*row[1:]), by_user[row.user_id])._asdict()}
+                        for row in current
+                    ])
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = self._flushing
+                raise
+            finally:
+                with self._lock:
+                    count = len(self._flushing)
+                    self._flushing = []
+            return count
+
+    def close(self) -> None:
+        """
+        Останавливает фоновую запись и записывает оставшиеся ответы.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать историю ответов')
@@ -0,0 +1,420 @@
+"""
+Асинхронный режим бота: AsyncTeleBot и асинхронный движок SQLAlchemy с настраиваемым пулом соединений.
+Включается настройкой BOT_MODE = 'async'; медленный запрос или отправка сообщения
+одному пользователю не блокирует обработку сообщений остальных.
+Как и в main.py, импорт модуля ничего не создает: компоненты создаются при первом обращении к ним,
+а прием обновлений запускает AsyncBotApp.run().
+"""
+import asyncio
+import io
+import logging
+import threading
+
+from types import ModuleType
+from typing import Collection, List, Optional, Set
+
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from telebot import asyncio_filters, asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_storage import StateMemoryStorage, StateStorageBase
+
+import db_async
+import settings
+import webhook
+from answer_log import AnswerLog
+from cache import lazy_property
+from chat_state import ChatStateStore
+from db import Caches, Card
+from dispatcher import AsyncChatDispatcher, attach_async
+from importer import parse_rows
+from metrics import Gauge, instrument, instrument_engine, start_http_server, timed_send
+from outbox import AsyncOutbox
+from prefetch import CardPrefetcher
+from scheduler import attempt_grade
+from state_storage import AsyncStateDBStorage, StateDBStorage
+from ui import *
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+
+class AsyncBotApp:
+    """
+    Асинхронное приложение бота: обработчики сообщений и компоненты, которые они используют.
+    Повторяет устройство main.BotApp: настройки передаются при создании, движки, бот и фоновые потоки
+    создаются при первом обращении.
+    """
+
+    def __init__(self, config: ModuleType) -> None:
+        """
+        :param config: Настройки: модуль settings или результат settings.load_config.
+        """
+        self.config = config
+        self._lock = threading.RLock()
+        self.chats: ChatStateStore = ChatStateStore(max_chats=100_000, idle_ttl=24 * 3600)
+        # Пулы слов и кэш пользователей принадлежат приложению и передаются функциям db через сессию
+        self.caches: Caches = Caches(pool_ttl=config.WORD_POOL_TTL)
+        self.prefetch_tasks: Set[asyncio.Task] = set()
+
+    def created(self, name: str) -> bool:
+        """
+        :return: True, если компонент с указанным именем уже создан.
+        """
+        return name in self.__dict__
+
+    @lazy_property
+    def engine(self) -> AsyncEngine:
+        engine = create_async_engine(self.config.ASYNC_DSN, **self.config.engine_options(self.config.ASYNC_DSN))
+        instrument_engine(engine.sync_engine, self.config.SLOW_QUERY_MS / 1000)
+        return engine
+
+    @lazy_property
+    def Session(self) -> async_sessionmaker:
+        return async_sessionmaker(bind=self.engine, info={'caches': self.caches})
+
+    @lazy_property
+    def sync_engine(self) -> Engine:
+        # Запись состояний и истории ответов выполняется в фоновых потоках, поэтому для нее используется синхронный движок
+        return create_engine(self.config.DSN, **self.config.engine_options(self.config.DSN))
+
+    @lazy_property
+    def state_storage(self) -> StateStorageBase:
+        if self.config.BOT_STATE_STORAGE == 'db':
+            return AsyncStateDBStorage(StateDBStorage(self.sync_engine, flush_interval=self.config.STATE_FLUSH_INTERVAL))
+        return StateMemoryStorage()
+
+    @lazy_property
+    def answer_log(self) -> AnswerLog:
+        return AnswerLog(self.sync_engine, batch_size=self.config.ANSWER_FLUSH_SIZE,
+                         flush_interval=self.config.ANSWER_FLUSH_INTERVAL)
+
+    @lazy_property
+    def bot(self) -> AsyncTeleBot:
+        if self.config.TG_API_URL:
+            asyncio_helper.API_URL = self.config.TG_API_URL
+        bot = AsyncTeleBot(self.config.TG_TOKEN, state_storage=self.state_storage)
+        self.register_handlers(bot)
+        return bot
+
+    @lazy_property
+    def outbox(self) -> AsyncOutbox:
+        # Ответы отправляются фоновыми задачами с соблюдением лимитов Telegram, подряд идущие тексты склеиваются
+        return AsyncOutbox(timed_send(self.bot.send_message), global_rate=self.config.OUTBOX_GLOBAL_RATE,
+                           chat_rate=self.config.OUTBOX_CHAT_RATE, chat_burst=self.config.OUTBOX_CHAT_BURST,
+                           senders=self.config.OUTBOX_SENDERS)
+
+    @lazy_property
+    def prefetcher(self) -> CardPrefetcher:
+        # Следующие карточки собираются в фоновых задачах, пока пользователь отвечает на текущую
+        return CardPrefetcher(self.caches.sampler.version, depth=self.config.PREFETCH_DEPTH,
+                              max_age=self.config.PREFETCH_MAX_AGE)
+
+    def register_handlers(self, bot: AsyncTeleBot) -> None:
+        """
+        Регистрирует обработчики сообщений. Порядок важен: последний обработчик принимает любой текст.
+        :param bot: Бот, которому передаются обработчики.
+        """
+        bot.register_message_handler(self.create_cards, commands=['cards', 'start'])
+        bot.register_message_handler(self.next_cards, func=lambda message: message.text == Command.NEXT)
+        bot.register_message_handler(self.handle_delete_word, func=lambda message: message.text == Command.DELETE_WORD)
+        bot.register_message_handler(self.process_delete_word, state=MyStates.deleting_word, content_types=['text'])
+        bot.register_message_handler(self.handle_add_word, func=lambda message: message.text == Command.ADD_WORD)
+        bot.register_message_handler(self.process_add_word, state=MyStates.adding_word, content_types=['text'])
+        bot.register_message_handler(self.handle_import, content_types=['document'])
+        bot.register_message_handler(self.help_command, commands=['help'])
+        bot.register_message_handler(self.stats_command, commands=['stats'])
+        bot.register_message_handler(self.message_reply, func=lambda message: True, content_types=['text'])
+        bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+
+    async def initialize_user(self, session, username: str) -> int:
+        """
+        Функция для получения идентификатора пользователя с добавлением нового пользователя в базу данных.
+        :param session: Асинхронная сессия базы данных.
+        :param username: Имя пользователя.
+        :return: Идентификатор пользователя
+        """
+        user_id = self.caches.user_ids.get(username)
+        if user_id is None:
+            user_id = await db_async.upsert_user(session, username)
+        return user_id
+
+    async def prefetch_card(self, user_id: int, exclude: Collection[int]) -> Optional[Card]:
+        """
+        Собирает карточку в фоновой задаче.
+        :param user_id: Идентификатор пользователя.
+        :param exclude: Идентификаторы слов, которые не должны попасть в карточку.
+        """
+        async with self.Session() as session:
+            return await db_async.build_card(session, user_id, exclude)
+
+    async def collect_garbage(self) -> None:
+        """
+        Периодически удаляет слова, на которые больше не ссылается ни один пользователь. Выполняется в фоновой задаче.
+        """
+        while True:
+            await asyncio.sleep(self.config.WORD_GC_INTERVAL)
+            try:
+                async with self.Session() as session:
+                    removed = await db_async.collect_orphan_words(session, self.config.WORD_GC_BATCH)
+                if removed:
+                    logger.info('Удалено слов без ссылок: %s', removed)
+            except Exception:
+                logger.exception('Не удалось удалить слова без ссылок')
+
+    @instrument
+    async def create_cards(self, message: types.Message) -> None:
+        """
+        Обработчик команд: /cards или /start
+        """
+        async with self.Session() as session:
+            await self.initialize_user(session, message.from_user.username)
+
+        cid: int = message.chat.id
+        state, created = self.chats.get(cid)
+        if created:
+            self.outbox.send_message(cid, f"Hello, {message.from_user.username}, let study English...")
+
+        await self.update_buttons(message)
+
+    async def update_buttons(self, message: types.Message) -> None:
+        """
+        Функция для обновления кнопок с новыми словами.
+        """
+        state, _ = self.chats.get(message.chat.id)
+        recent = state.recent_ids()
+        async with self.Session() as session:
+            user_id = await self.initialize_user(session, message.from_user.username)
+            card = self.prefetcher.take(user_id, recent) or await db_async.build_card(session, user_id, recent)
+        word_id, target_word, translate, others = card
+        state.push_recent(word_id)
+
+        state.set_card(word_id, target_word.capitalize(), translate.capitalize(), card_options(target_word, others))
+
+        bot = self.bot
+        greeting = f"Выбери перевод слова:\n🇷🇺 {translate.capitalize()}"
+        self.outbox.send_message(message.chat.id, greeting, reply_markup=create_markup(card_buttons(state)))
+        await bot.set_state(message.from_user.id, MyStates.target_word, message.chat.id)
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['word_id'] = word_id
+            data['target_word'] = target_word.capitalize()
+            data['translate_word'] = translate.capitalize()
+            # Перемешанные варианты сохраняются как есть, чтобы восстановленная карточка показала те же кнопки
+            data['card_options'] = list(state.buttons)
+        if self.prefetcher.depth:
+            task = asyncio.create_task(self.prefetcher.fill_async(user_id, state.recent_ids(), self.prefetch_card))
+            self.prefetch_tasks.add(task)
+            task.add_done_callback(self.prefetch_tasks.discard)
+
+    @instrument
+    async def next_cards(self, message: types.Message) -> None:
+        """
+        Обработчик команды "Дальше ⏭"
+        """
+        await self.update_buttons(message)
+
+    @instrument
+    async def handle_delete_word(self, message: types.Message) -> None:
+        """
+        Обработчик команды "Удалить слово🔙". Запрашивает у пользователя слово которое планируем удалить.
+        """
+        self.outbox.send_message(message.chat.id, f'{message.from_user.username}, введите слово которое хотите '
+                                                  f'удалить (или несколько слов через пробел)')
+        await self.bot.set_state(message.from_user.id, MyStates.deleting_word, message.chat.id)
+
+    @instrument
+    async def process_delete_word(self, message: types.Message) -> None:
+        """
+        Функция для обработки удаления слов
+        :param message: Сообщение пользователя, содержащее слово или несколько слов для удаления
+        """
+        words: List[str] = split_words(message.text)
+        if not words:
+            self.outbox.send_message(message.chat.id, 'Произошла ошибка!\n, Повторите ввод, указав слово которое хотите удалить.')
+            return
+        logger.info(words)
+        async with self.Session() as session:
+            user_id = await self.initialize_user(session, message.from_user.username)
+            deleted = await db_async.delete_words(session, words, user_id)
+        missing = [word for word in words if word not in deleted]
+        self.outbox.send_message(message.chat.id, show_deleted(message.from_user.username, deleted, missing))
+        await self.update_buttons(message)
+
+    @instrument
+    async def handle_add_word(self, message: types.Message) -> None:
+        """
+        Обработчик команды "Добавить слово ➕". Запрашивает у пользователя слово и его перевод.
+        """
+        self.outbox.send_message(message.chat.id, f'{message.from_user.username}, введите слово и его перевод')
+        await self.bot.set_state(message.from_user.id, MyStates.adding_word, message.chat.id)
+
+    @instrument
+    async def process_add_word(self, message: types.Message) -> None:
+        """
+        Функция для обработки добавления пары слово-перевод
+        """
+        income_words = message.text.strip().lower().split(' ', 1)
+        if len(income_words) != 2:
+            self.outbox.send_message(message.chat.id, 'Произошла ошибка!\n Повторите ввод, указав слово и его перевод снова через пробел.')
+            return
+        word, translate = income_words
+        async with self.Session() as session:
+            user_id = await self.initialize_user(session, message.from_user.username)
+            result = await db_async.add_word(session, word, translate, user_id)
+            if result is None:
+                self.outbox.send_message(message.chat.id, f'Не удалось добавить слово <{word.capitalize()}>, попробуйте ещё раз.')
+            else:
+                count, status = result
+                if status:
+                    self.outbox.send_message(message.chat.id, f'Слово <{word.capitalize()}> и его перевод <{translate.capitalize()}> добавлены!')
+                    self.outbox.send_message(message.chat.id, f'Количество изучаемых пользователем слов: {count}')
+                else:
+                    self.outbox.send_message(message.chat.id, f'Слово <{word.capitalize()}> уже есть!')
+        await self.update_buttons(message)
+
+    @instrument
+    async def handle_import(self, message: types.Message) -> None:
+        """
+        Обработчик загрузки словаря из CSV/TSV файла с парами слово-перевод.
+        """
+        bot = self.bot
+        document: types.Document = message.document
+        if not (document.file_name or '').lower().endswith(IMPORT_EXTENSIONS):
+            self.outbox.send_message(message.chat.id, f'Поддерживаются только файлы {", ".join(IMPORT_EXTENSIONS)}')
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_SIZE:
+            self.outbox.send_message(message.chat.id, f'Файл слишком большой, максимум {IMPORT_MAX_SIZE // 2 ** 20} МБ')
+            return
+        file: types.File = await bot.get_file(document.file_id)
+        content: bytes = await bot.download_file(file.file_path)
+        lines = io.StringIO(content.decode('utf-8-sig', errors='replace'), newline='')
+        async with self.Session() as session:
+            user_id = await self.initialize_user(session, message.from_user.username)
+            result = await db_async.import_words(session, user_id, parse_rows(lines))
+            count = await db_async.count_user_word(session, user_id)
+        self.outbox.send_message(message.chat.id, show_hint(f'Загружено строк: {result.rows}',
+                                                         f'Добавлено в словарь: {result.links_added}',
+                                                         f'Пропущено: {result.skipped}',
+                                                         f'Количество изучаемых пользователем слов: {count}'))
+        await self.update_buttons(message)
+
+    @instrument
+    async def help_command(self, message: types.Message) -> None:
+        """
+        Обработчик команды /help. Выводит справку по работе бота
+        """
+        self.outbox.send_message(message.chat.id, HELP_TEXT, parse_mode="Markdown")
+        await self.update_buttons(message)
+
+    @instrument
+    async def stats_command(self, message: types.Message) -> None:
+        """
+        Обработчик команды /stats. Выводит статистику ответов и самые трудные слова
+        """
+        async with self.Session() as session:
+            user_id = await self.initialize_user(session, message.from_user.username)
+            hardest = await db_async.hardest_words(session, user_id)
+        stats = await asyncio.to_thread(self.answer_log.stats, user_id)
+        self.outbox.send_message(message.chat.id, show_stats(stats, hardest))
+
+    @instrument
+    async def message_reply(self, message: types.Message) -> None:
+        """
+        Обработчик текстовых сообщений от пользователя. Проверяет правильность перевода слова.
+        """
+        text: str = message.text
+        valid: bool = False
+        state, _ = self.chats.get(message.chat.id)
+        if state.target_word is None:
+            # Состояние чата было вытеснено: восстанавливаем карточку из хранилища состояний бота
+            async with self.bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+                state.set_card(data.get('word_id'), data['target_word'], data['translate_word'],
+                               tuple(data.get('card_options')
+                                     or card_options(data['target_word'], data.get('other_words', []))))
+        if text == state.target_word:
+            hint: str = show_hint("Отлично!❤", show_target({'target_word': state.target_word,
+                                                             'translate_word': state.translate}))
+            valid = True
+        else:
+            state.mark_wrong(text)
+            hint: str = show_hint("Допущена ошибка!", f"Попробуй ещё раз вспомнить слово 🇷🇺{state.translate.capitalize()}")
+        if state.word_id is not None:
+            quality = attempt_grade(valid, state.mistakes)
+            async with self.Session() as session:
+                user_id = await self.initialize_user(session, message.from_user.username)
+                self.answer_log.record(user_id, state.word_id, valid)
+                if quality is not None:
+                    await db_async.record_answer(session, user_id, state.word_id, quality)
+        self.outbox.send_message(message.chat.id, hint, reply_markup=create_markup(card_buttons(state)))
+        if valid:
+            await self.next_cards(message)
+
+    async def main(self) -> None:
+        """
+        Подготавливает базу данных и запускает прием обновлений: опрос Telegram или вебхук.
+        """
+        config = self.config
+        logger.info('Start telegram bot (async)...')
+        await db_async.bootstrap(self.engine, self.caches)
+        bot = self.bot
+        if config.METRICS_PORT:
+            start_http_server(config.METRICS_PORT, config.METRICS_HOST)
+        gc_task = asyncio.create_task(self.collect_garbage()) if config.WORD_GC_INTERVAL else None
+        # Обновления чата обрабатываются по порядку; очереди ограничены тем же объемом, что и в режиме sync
+        queue_size, max_pending = config.BOT_QUEUE_SIZE, config.BOT_WORKERS * config.BOT_QUEUE_SIZE
+        if config.BOT_TRANSPORT == 'webhook':
+            dispatcher = AsyncChatDispatcher(lambda update: bot.process_new_updates([update]), queue_size, max_pending)
+        else:
+            dispatcher = attach_async(bot, queue_size, max_pending)
+        outbox = self.outbox
+        Gauge('bot_outbox_depth', 'Сообщений в очереди отправки', lambda: outbox.stats()['depth'])
+        Gauge('bot_dispatcher_pending', 'Обновлений в очередях обработки', dispatcher.pending)
+        try:
+            if config.BOT_TRANSPORT == 'webhook':
+                await webhook.serve_async(bot, dispatcher.submit, config.WEBHOOK_HOST, config.WEBHOOK_PORT,
+                                          config.WEBHOOK_PATH,
+                                          webhook.resolve_secret(config.WEBHOOK_SECRET, config.WEBHOOK_URL),
+                                          config.WEBHOOK_URL)
+            else:
+                await bot.infinity_polling(skip_pending=True)
+        finally:
+            if gc_task is not None:
+                gc_task.cancel()
+            await dispatcher.stop()
+            await self.close()
+
+    async def close(self) -> None:
+        """
+        Останавливает созданные компоненты: очередь сообщений, сессию бота, запись состояний и истории ответов, движки.
+        """
+        if self.created('outbox'):
+            await self.outbox.stop()
+        if self.created('bot'):
+            await self.bot.close_session()
+        if self.created('state_storage') and isinstance(self.state_storage, AsyncStateDBStorage):
+            await self.state_storage.close()
+        if self.created('answer_log'):
+            await asyncio.to_thread(self.answer_log.close)
+        if self.created('engine'):
+            await self.engine.dispose()
+        if self.created('sync_engine'):
+            self.sync_engine.dispose()
+
+    def run(self) -> None:
+        """
+        Запускает цикл событий и прием обновлений до остановки бота.
+        """
+        asyncio.run(self.main())
+
+
+def create_app(config: ModuleType = settings) -> AsyncBotApp:
+    """
+    Создает асинхронное приложение бота без подключения к базе данных и Telegram.
+    :param config: Настройки: модуль settings или settings.load_config.
+    :return: Приложение; прием обновлений запускается методом run.
+    """
+    return AsyncBotApp(config)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    create_app().run()
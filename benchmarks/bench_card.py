@@ -0,0 +1,59 @@
+"""
+Проверка количества запросов и задержки при сборке карточки через db.build_card.
+Завершается с ошибкой, если в прогретом состоянии карточка требует больше одного запроса.
+
+Запуск из корня проекта:
+    python benchmarks/bench_card.py --size 10000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import sqlalchemy as sq
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from benchmarks.bench_sampler import fill  # noqa: E402
+
+MAX_QUERIES_PER_CARD: int = 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL', 'sqlite:///bench_card.sqlite3'))
+    parser.add_argument('--size', type=int, default=10_000)
+    parser.add_argument('--rounds', type=int, default=500)
+    args = parser.parse_args()
+
+    engine = sq.create_engine(args.dsn)
+    Session = sessionmaker(bind=engine)
+    fill(engine, args.size)
+    db.default_caches.clear()
+
+    queries = []
+    sq.event.listen(engine, 'before_cursor_execute', lambda *_: queries.append(1))
+
+    recent = []
+    timings = []
+    with Session() as session:
+        db.build_card(session, 2, recent)
+        for _ in range(args.rounds):
+            queries.clear()
+            start = time.perf_counter()
+            card = db.build_card(session, 2, recent)
+            timings.append(time.perf_counter() - start)
+            if len(queries) > MAX_QUERIES_PER_CARD:
+                raise SystemExit(f'build_card выполнил {len(queries)} запросов')
+            recent = (recent + [card.word_id])[-5:]
+
+    timings.sort()
+    print(f'words={args.size} p50={statistics.median(timings) * 1000:.3f}ms '
+          f'p99={timings[int(len(timings) * 0.99) - 1] * 1000:.3f}ms queries/card<={MAX_QUERIES_PER_CARD}')
+
+
+if __name__ == '__main__':
+    main()
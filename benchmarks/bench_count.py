@@ -0,0 +1,57 @@
+"""
+Сравнение подсчета слов пользователя: COUNT по соединению words и user_words против счетчика в таблице users.
+
+Запуск из корня проекта:
+    python benchmarks/bench_count.py --sizes 100 10000 1000000
+"""
+import argparse
+import os
+import sys
+
+import sqlalchemy as sq
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.elements import or_
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from db import INITIAL_USER_ID, UserWord, Words  # noqa: E402
+from benchmarks.bench_sampler import fill, measure  # noqa: E402
+
+
+def join_count(session, recent):
+    return (
+        session.query(Words)
+        .join(UserWord)
+        .filter(or_(UserWord.user_id == INITIAL_USER_ID, UserWord.user_id == 2))
+        .count()
+    )
+
+
+def counter(session, recent):
+    return db.count_user_word(session, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL', 'sqlite:///bench_count.sqlite3'))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10_000, 100_000])
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    engine = sq.create_engine(args.dsn)
+    Session = sessionmaker(bind=engine)
+    print(f'{"слов":>10} {"COUNT, мс":>12} {"счетчик, мс":>12}')
+    for size in args.sizes:
+        fill(engine, size)
+        with Session() as session:
+            db.refresh_word_counts(session)
+            session.commit()
+            assert join_count(session, ()) == counter(session, ()) == size
+            joined = measure(session, join_count, args.rounds)
+            stored = measure(session, counter, args.rounds)
+        print(f'{size:>10} {joined:>12.3f} {stored:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Масштабирование диспетчера обновлений по числу рабочих потоков.
+Обработчик имитирует ввод-вывод (запрос к базе и отправку сообщения) задержкой,
+дополнительно проверяется, что порядок обновлений внутри каждого чата сохраняется.
+
+Запуск из корня проекта:
+    python benchmarks/bench_dispatcher.py --workers 1 2 4 8 16
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telebot import types  # noqa: E402
+
+from benchmarks.fake_bot_api import text_update  # noqa: E402
+from dispatcher import ChatDispatcher  # noqa: E402
+
+
+def run(workers: int, chats: int, updates: int, delay: float) -> float:
+    """
+    Прогоняет updates обновлений от chats чатов и возвращает пропускную способность в обновлениях в секунду.
+    """
+    seen = defaultdict(list)
+    done = threading.Event()
+    counter = [0]
+    lock = threading.Lock()
+
+    def handler(update: types.Update) -> None:
+        time.sleep(delay)
+        seen[update.message.chat.id].append(update.update_id)
+        with lock:
+            counter[0] += 1
+            if counter[0] == updates:
+                done.set()
+
+    batch = [types.Update.de_json(text_update(i + 1, 1000 + i % chats, 'x')) for i in range(updates)]
+    dispatcher = ChatDispatcher(handler, workers=workers, queue_size=100)
+    start = time.perf_counter()
+    for update in batch:
+        dispatcher.submit(update)
+    done.wait()
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+
+    for ids in seen.values():
+        assert ids == sorted(ids), 'нарушен порядок обновлений внутри чата'
+    return updates / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--delay', type=float, default=0.005, help='время обработки одного обновления в секундах')
+    args = parser.parse_args()
+
+    base = None
+    for workers in args.workers:
+        rate = run(workers, args.chats, args.updates, args.delay)
+        base = base or rate / workers
+        print(f'workers={workers:>3} {rate:9.1f} обновлений/с  эффективность {rate / (base * workers):6.1%}')
+
+
+if __name__ == '__main__':
+    main()
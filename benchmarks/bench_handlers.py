@@ -0,0 +1,198 @@
+"""
+Замер горячих путей бота: реальные обработчики main.py получают синтетические обновления Telegram
+через bot.process_new_updates. База данных — локальная SQLite или Postgres (--dsn), Bot API — поддельный сервер.
+Для каждого размера словаря печатает p50/p99 задержки, количество запросов к базе на обновление
+и пропускную способность, а результаты сохраняет в JSON для сравнения запусков.
+
+Запуск из корня проекта:
+    python benchmarks/bench_handlers.py --sizes 10 1000 100000 1000000
+    python benchmarks/bench_handlers.py --compare benchmarks/results/before.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import sqlalchemy as sq  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from telebot import types  # noqa: E402
+
+import db  # noqa: E402
+from benchmarks.fake_bot_api import FakeBotAPI, text_update  # noqa: E402
+from chat_state import ChatStateStore  # noqa: E402
+from main import create_app  # noqa: E402
+from settings import load_config  # noqa: E402
+from ui import Command  # noqa: E402
+
+USERNAME = 'bench'
+CHUNK = 50_000
+
+# Приложение бота, создается после настройки окружения
+app: Any = None
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def populate(app: Any, size: int) -> None:
+    """
+    Создает схему с начальными данными и словарь пользователя bench из size слов и сбрасывает кэши приложения.
+    """
+    engine = app.engine
+    db.Base.metadata.drop_all(engine)
+    db.bootstrap(engine, app.caches)
+    with app.Session() as session:
+        user_id = db.upsert_user(session, USERNAME, commit=False)
+        first = (session.scalar(sq.select(sq.func.max(db.Words.id))) or 0) + 1
+        for start in range(0, size, CHUNK):
+            ids = range(first + start, first + min(start + CHUNK, size))
+            session.execute(sq.insert(db.Words), [
+                {'id': i, 'target_word': f'word{i}', 'translate': f'слово{i}'} for i in ids
+            ])
+            session.execute(sq.insert(db.UserWord), [{'user_id': user_id, 'word_id': i} for i in ids])
+        db.refresh_word_counts(session, [user_id])
+        session.commit()
+
+
+def scenario(chats: int, rounds: int):
+    """
+    Последовательность действий пользователей: /start, затем по кругу "Дальше", неверный и верный ответ,
+    добавление и удаление слова. Возвращает метку замера, чат и функцию, создающую текст сообщения.
+    """
+    for chat_id in range(1000, 1000 + chats):
+        yield 'create_cards', chat_id, lambda chat_id: '/start'
+    for n in range(rounds):
+        for chat_id in range(1000, 1000 + chats):
+            yield 'next_cards', chat_id, lambda chat_id: Command.NEXT
+            yield 'message_reply (ошибка)', chat_id, lambda chat_id: 'zzz'
+            yield 'message_reply', chat_id, lambda chat_id: app.chats.get(chat_id)[0].target_word
+            yield 'handle_add_word', chat_id, lambda chat_id: Command.ADD_WORD
+            yield 'process_add_word', chat_id, lambda chat_id, n=n: f'bench{chat_id}x{n} перевод'
+            yield 'handle_delete_word', chat_id, lambda chat_id: Command.DELETE_WORD
+            yield 'process_delete_word', chat_id, lambda chat_id, n=n: f'bench{chat_id}x{n}'
+
+
+def run(size: int, chats: int, rounds: int) -> Dict[str, Any]:
+    """
+    Прогоняет сценарий на словаре из size слов и возвращает сводку по каждому обработчику.
+    """
+    populate(app, size)
+    app.chats = ChatStateStore(max_chats=100_000, idle_ttl=24 * 3600)
+    queries = [0]
+    timings: Dict[str, List[float]] = defaultdict(list)
+    counts: Dict[str, List[int]] = defaultdict(list)
+
+    def count_query(*args) -> None:
+        queries[0] += 1
+
+    event.listen(app.engine, 'before_cursor_execute', count_query)
+    update_id = 0
+    start = time.perf_counter()
+    try:
+        for label, chat_id, text in scenario(chats, rounds):
+            update_id += 1
+            update = types.Update.de_json(text_update(update_id, chat_id, text(chat_id), USERNAME))
+            queries[0] = 0
+            began = time.perf_counter()
+            app.bot.process_new_updates([update])
+            timings[label].append(time.perf_counter() - began)
+            counts[label].append(queries[0])
+    finally:
+        event.remove(app.engine, 'before_cursor_execute', count_query)
+    elapsed = time.perf_counter() - start
+
+    handlers = {
+        label: {
+            'updates': len(values),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'queries': sum(counts[label]) / len(counts[label]),
+        }
+        for label, values in timings.items()
+    }
+    return {'size': size, 'updates': update_id, 'throughput': update_id / elapsed, 'handlers': handlers}
+
+
+def environment(dsn: str) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlalchemy': sq.__version__,
+        'database': sq.engine.make_url(dsn).get_backend_name(),
+        'machine': platform.machine(),
+    }
+
+
+def report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(f'\nслов: {result["size"]}, обновлений: {result["updates"]}, {result["throughput"]:.1f} обновлений/с')
+    print(f'{"обработчик":<24} {"p50, мс":>9} {"p99, мс":>9} {"запросов":>9}')
+    for label, stats in result['handlers'].items():
+        line = f'{label:<24} {stats["p50_ms"]:>9.2f} {stats["p99_ms"]:>9.2f} {stats["queries"]:>9.1f}'
+        before = (baseline or {}).get('handlers', {}).get(label)
+        if before:
+            line += f'   p50 {stats["p50_ms"] / before["p50_ms"]:>5.2f}x от базового'
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', help='база данных, по умолчанию временная SQLite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100_000])
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=20, help='повторов сценария на чат')
+    parser.add_argument('--output', help='файл результатов, по умолчанию benchmarks/results/handlers-<дата>.json')
+    parser.add_argument('--compare', help='файл результатов предыдущего запуска для сравнения')
+    args = parser.parse_args()
+
+    dsn = args.dsn or f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="bench-handlers-"), "bot.sqlite3")}'
+    api = FakeBotAPI().start()
+    os.environ.update(DATABASE_URL=dsn, TG_TOKEN='123456:bench', TG_API_URL=api.api_url,
+                      OUTBOX_GLOBAL_RATE='1000000', OUTBOX_CHAT_RATE='1000000', OUTBOX_CHAT_BURST='1000000')
+    global app
+    app = create_app(load_config())
+    logging.getLogger('__BOT__').setLevel(logging.WARNING)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = {result['size']: result for result in json.load(file)['results']}
+
+    results = []
+    try:
+        for size in args.sizes:
+            result = run(size, args.chats, args.rounds)
+            report(result, baseline.get(size))
+            results.append(result)
+    finally:
+        app.outbox.stop(timeout=5)
+        api.stop()
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'handlers-{time.strftime("%Y%m%d-%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump({'environment': environment(dsn), 'chats': args.chats, 'rounds': args.rounds,
+                   'results': results}, file, ensure_ascii=False, indent=2)
+    print(f'\nРезультаты сохранены в {output}')
+
+
+if __name__ == '__main__':
+    main()
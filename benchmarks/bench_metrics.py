@@ -0,0 +1,49 @@
+"""
+Накладные расходы встроенных метрик: декоратор обработчика и учет запросов к базе данных.
+
+Запуск из корня проекта:
+    python benchmarks/bench_metrics.py --calls 200000 --queries 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+import sqlalchemy as sq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+def per_call(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200_000)
+    parser.add_argument('--queries', type=int, default=20_000)
+    args = parser.parse_args()
+
+    def handler() -> None:
+        pass
+
+    plain = per_call(handler, args.calls)
+    wrapped = per_call(metrics.instrument(handler), args.calls)
+    print(f'обработчик: {plain:.2f} мкс без метрик, {wrapped:.2f} мкс с метриками, +{wrapped - plain:.2f} мкс')
+
+    for label, instrumented in (('без метрик', False), ('с метриками', True)):
+        engine = sq.create_engine('sqlite://')
+        if instrumented:
+            metrics.instrument_engine(engine)
+        with engine.connect() as connection:
+            statement = sq.text('SELECT 1')
+            print(f'запрос {label}: {per_call(lambda: connection.execute(statement), args.queries):.2f} мкс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Отправка сообщений через очереди Outbox и AsyncOutbox против прямых вызовов bot.send_message на поддельном Bot API,
+который отвечает 429 на каждый N-й запрос. Каждое действие пользователя порождает несколько сообщений подряд,
+как в process_add_word. Проверяется, что ни одно сообщение не потеряно, порядок внутри чата сохранен,
+а лимит на чат не превышен.
+
+Запуск из корня проекта:
+    python benchmarks/bench_outbox.py --chats 50 --actions 3 --flood-every 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot  # noqa: E402
+from telebot import apihelper, asyncio_helper  # noqa: E402
+from telebot.async_telebot import AsyncTeleBot  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI  # noqa: E402
+from outbox import AsyncOutbox, Outbox  # noqa: E402
+
+PER_ACTION = ('Слово добавлено!', 'Количество изучаемых слов: 10', 'Выбери перевод слова')
+
+
+def messages(chats: int, actions: int):
+    for action in range(actions):
+        for chat_id in range(1000, 1000 + chats):
+            for text in PER_ACTION:
+                yield chat_id, f'{text} #{action}'
+
+
+def check(api: FakeBotAPI, chats: int, actions: int, chat_rate: float, chat_burst: float) -> str:
+    by_chat = defaultdict(list)
+    for sent in api.sent:
+        by_chat[int(sent['chat_id'])].append(sent)
+    delivered = sum(sent['text'].count('\n') + 1 for sent in api.sent)
+    worst = 0
+    for chat_id, sent in by_chat.items():
+        texts = '\n'.join(s['text'] for s in sent).split('\n')
+        assert texts == [t for c, t in messages(chats, actions) if c == chat_id], f'нарушен порядок в чате {chat_id}'
+        stamps = [s['sent_at'] for s in sent]
+        for i, start in enumerate(stamps):
+            worst = max(worst, sum(1 for t in stamps[i:] if t - start < 1.0))
+    assert worst <= chat_burst + chat_rate, f'превышен лимит на чат: {worst} сообщений за секунду'
+    return f'доставлено текстов {delivered}, запросов {len(api.sent)}, 429 {api.rejected}, максимум в чат за 1 с {worst}'
+
+
+def run_direct(args) -> None:
+    api = FakeBotAPI(latency=args.latency, flood_every=args.flood_every, retry_after=1).start()
+    apihelper.API_URL = api.api_url
+    bot = telebot.TeleBot('1:direct', threaded=False)
+    lost = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.senders) as pool:
+        for future in [pool.submit(bot.send_message, c, t) for c, t in messages(args.chats, args.actions)]:
+            try:
+                future.result()
+            except apihelper.ApiTelegramException:
+                lost += 1
+    elapsed = time.perf_counter() - start
+    api.stop()
+    print(f'напрямую: {elapsed:6.2f} с, запросов {len(api.sent)}, 429 {api.rejected}, потеряно {lost}')
+
+
+def run_outbox(args) -> None:
+    api = FakeBotAPI(latency=args.latency, flood_every=args.flood_every, retry_after=1).start()
+    apihelper.API_URL = api.api_url
+    bot = telebot.TeleBot('1:outbox', threaded=False)
+    outbox = Outbox(bot.send_message, global_rate=args.global_rate, chat_rate=args.chat_rate,
+                    chat_burst=args.chat_burst, senders=args.senders)
+    start = time.perf_counter()
+    for chat_id, text in messages(args.chats, args.actions):
+        outbox.send_message(chat_id, text)
+    outbox.flush()
+    elapsed = time.perf_counter() - start
+    outbox.stop()
+    api.stop()
+    print(f'outbox:   {elapsed:6.2f} с, {check(api, args.chats, args.actions, args.chat_rate, args.chat_burst)}')
+    print(f'          {outbox.stats()}')
+
+
+def run_async_outbox(args) -> None:
+    api = FakeBotAPI(latency=args.latency, flood_every=args.flood_every, retry_after=1).start()
+    asyncio_helper.API_URL = api.api_url
+
+    async def send_all() -> AsyncOutbox:
+        bot = AsyncTeleBot('1:async')
+        outbox = AsyncOutbox(bot.send_message, global_rate=args.global_rate, chat_rate=args.chat_rate,
+                             chat_burst=args.chat_burst, senders=args.senders)
+        for chat_id, text in messages(args.chats, args.actions):
+            outbox.send_message(chat_id, text)
+        await outbox.stop(timeout=None)
+        await bot.close_session()
+        return outbox
+
+    start = time.perf_counter()
+    outbox = asyncio.run(send_all())
+    elapsed = time.perf_counter() - start
+    api.stop()
+    print(f'async:    {elapsed:6.2f} с, {check(api, args.chats, args.actions, args.chat_rate, args.chat_burst)}')
+    print(f'          {outbox.stats()}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--actions', type=int, default=3, help='действий пользователя на чат')
+    parser.add_argument('--flood-every', type=int, default=20, help='отвечать 429 на каждый N-й sendMessage')
+    parser.add_argument('--latency', type=float, default=0.01, help='задержка ответа Bot API в секундах')
+    parser.add_argument('--global-rate', type=float, default=30.0)
+    parser.add_argument('--chat-rate', type=float, default=1.0)
+    parser.add_argument('--chat-burst', type=float, default=3.0)
+    parser.add_argument('--senders', type=int, default=4)
+    args = parser.parse_args()
+
+    run_direct(args)
+    run_outbox(args)
+    run_async_outbox(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Задержка выдачи следующей карточки после верного ответа с заранее собранными карточками и без них.
+Между ответами делается пауза, как у живого пользователя, за которую фоновая сборка успевает подготовить карточку.
+Каждые 10 ответов словарь меняется добавлением и удалением слова, при этом заранее собранные карточки отбрасываются.
+
+Запуск из корня проекта:
+    python benchmarks/bench_prefetch.py --size 100000 --answers 200
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telebot import types  # noqa: E402
+
+from benchmarks import bench_handlers  # noqa: E402
+from benchmarks.bench_handlers import USERNAME, percentile, populate  # noqa: E402
+from benchmarks.fake_bot_api import FakeBotAPI, text_update  # noqa: E402
+from chat_state import ChatStateStore  # noqa: E402
+from main import create_app  # noqa: E402
+from settings import load_config  # noqa: E402
+from ui import Command  # noqa: E402
+
+
+def run(app, depth: int, size: int, chats: int, answers: int, think: float) -> Dict[str, float]:
+    populate(app, size)
+    app.chats = ChatStateStore(max_chats=100_000, idle_ttl=24 * 3600)
+    app.prefetcher.depth = depth
+    update_id = 0
+
+    def send(chat_id: int, text: str) -> float:
+        nonlocal update_id
+        update_id += 1
+        began = time.perf_counter()
+        app.bot.process_new_updates([types.Update.de_json(text_update(update_id, chat_id, text, USERNAME))])
+        return time.perf_counter() - began
+
+    chat_ids = range(1000, 1000 + chats)
+    for chat_id in chat_ids:
+        send(chat_id, '/start')
+    timings: List[float] = []
+    for n in range(answers):
+        time.sleep(think)
+        for chat_id in chat_ids:
+            timings.append(send(chat_id, app.chats.get(chat_id)[0].target_word))
+        if n % 10 == 9:
+            # Добавленное и сразу удаленное слово меняет словарь: заранее собранные карточки должны отброситься
+            chat_id = chat_ids[0]
+            send(chat_id, Command.ADD_WORD)
+            send(chat_id, f'prefetch{n} перевод')
+            send(chat_id, Command.DELETE_WORD)
+            send(chat_id, f'prefetch{n}')
+    return {'p50_ms': percentile(timings, 0.5) * 1000, 'p99_ms': percentile(timings, 0.99) * 1000}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', help='база данных, по умолчанию временная SQLite')
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--chats', type=int, default=1, help='чатов одного пользователя')
+    parser.add_argument('--answers', type=int, default=200, help='верных ответов на чат')
+    parser.add_argument('--think', type=float, default=0.05, help='пауза между ответами в секундах')
+    args = parser.parse_args()
+
+    dsn = args.dsn or f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="bench-prefetch-"), "bot.sqlite3")}'
+    api = FakeBotAPI().start()
+    os.environ.update(DATABASE_URL=dsn, TG_TOKEN='123456:bench', TG_API_URL=api.api_url,
+                      OUTBOX_GLOBAL_RATE='1000000', OUTBOX_CHAT_RATE='1000000', OUTBOX_CHAT_BURST='1000000')
+    app = bench_handlers.app = create_app(load_config())
+    logging.getLogger('__BOT__').setLevel(logging.WARNING)
+    try:
+        for depth in (0, app.config.PREFETCH_DEPTH):
+            result = run(app, depth, args.size, args.chats, args.answers, args.think)
+            print(f'глубина {depth}: верный ответ и следующая карточка p50 {result["p50_ms"]:.2f} мс, '
+                  f'p99 {result["p99_ms"]:.2f} мс')
+        print(f'заранее собранные карточки: {app.prefetcher.stats()}')
+    finally:
+        app.prefetcher.stop()
+        app.outbox.stop(timeout=5)
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
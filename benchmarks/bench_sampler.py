@@ -0,0 +1,99 @@
+"""
+Сравнение задержки сборки карточки: ORDER BY random() против db.build_card, который выбирает слова
+из пулов в памяти. Для build_card печатается также время первой карточки, включающее загрузку пулов.
+
+Запуск из корня проекта:
+    python benchmarks/bench_sampler.py --sizes 100 10000 1000000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import sqlalchemy as sq
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from db import Base, Users, Words, UserWord, INITIAL_USER_ID  # noqa: E402
+
+# Идентификаторы слов word1..word4 из measure
+RECENT_IDS = [2, 3, 4, 5]
+
+
+def fill(engine: sq.engine.Engine, size: int) -> None:
+    """
+    Создает пустую схему и наполняет её size словами, поровну между общим набором и пользователем.
+    """
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sq.insert(Users), [{'id': INITIAL_USER_ID, 'name': 'Initial User'}, {'id': 2, 'name': 'bench'}])
+        chunk = 50_000
+        for start in range(0, size, chunk):
+            stop = min(start + chunk, size)
+            conn.execute(sq.insert(Words), [
+                {'id': i + 1, 'target_word': f'word{i}', 'translate': f'слово{i}'} for i in range(start, stop)
+            ])
+            conn.execute(sq.insert(UserWord), [
+                {'user_id': INITIAL_USER_ID if i % 2 else 2, 'word_id': i + 1} for i in range(start, stop)
+            ])
+
+
+def order_by_random(session, recent):
+    # Целевое слово и три варианта ответа
+    return (
+        session.query(Words)
+        .join(UserWord)
+        .filter(UserWord.user_id.in_([INITIAL_USER_ID, 2]))
+        .filter(Words.target_word.notin_(recent))
+        .order_by(func.random())
+        .limit(4)
+        .all()
+    )
+
+
+def build_card(session, recent):
+    return db.build_card(session, 2, RECENT_IDS)
+
+
+def measure(session, fn, rounds: int) -> float:
+    recent = ['word1', 'word2', 'word3', 'word4']
+    fn(session, recent)
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(session, recent)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL', 'sqlite:///bench_sampler.sqlite3'))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--baseline-limit', type=int, default=100_000,
+                        help='максимальный размер словаря для ORDER BY random()')
+    args = parser.parse_args()
+
+    engine = sq.create_engine(args.dsn)
+    Session = sessionmaker(bind=engine)
+    print(f"{'words':>10} {'random() ms':>12} {'cold ms':>12} {'build_card ms':>14}")
+    for size in args.sizes:
+        fill(engine, size)
+        db.default_caches.clear()
+        with Session() as session:
+            baseline = measure(session, order_by_random, args.rounds) if size <= args.baseline_limit else float('nan')
+            start = time.perf_counter()
+            build_card(session, [])
+            cold = (time.perf_counter() - start) * 1000
+            fast = measure(session, build_card, args.rounds)
+        print(f'{size:>10} {baseline:>12.3f} {cold:>12.3f} {fast:>14.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Время холодного старта бота: каждый замер выполняется в новом процессе интерпретатора.
+Отдельно измеряются импорт main, create_app и обработка первого обновления, при которой создаются
+движок базы данных, бот и фоновые потоки. База — подготовленная заранее SQLite, Bot API — поддельный сервер.
+
+Запуск из корня проекта:
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def child() -> None:
+    """
+    Один холодный старт; печатает длительность этапов в миллисекундах в формате JSON.
+    """
+    began = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    app = main.create_app()
+    created = time.perf_counter()
+
+    from telebot import types
+    from benchmarks.fake_bot_api import text_update
+    from ui import Command
+    app.bot.process_new_updates([types.Update.de_json(text_update(1, 1000, Command.NEXT, 'bench'))])
+    handled = time.perf_counter()
+    print(json.dumps({'import': (imported - began) * 1000, 'create_app': (created - imported) * 1000,
+                      'first_update': (handled - created) * 1000}))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+
+    import sqlalchemy as sq
+    import db
+    from benchmarks.fake_bot_api import FakeBotAPI
+    from benchmarks.load_modes import UNLIMITED_OUTBOX
+
+    dsn = f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="bench-startup-"), "bot.sqlite3")}'
+    db.bootstrap(sq.create_engine(dsn))
+    api = FakeBotAPI().start()
+    env = dict(os.environ, DATABASE_URL=dsn, TG_TOKEN='123456:bench', TG_API_URL=api.api_url, PREFETCH_DEPTH='0',
+               WORD_GC_INTERVAL='0', **UNLIMITED_OUTBOX)
+    runs = []
+    try:
+        for _ in range(args.runs):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], env=env, cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        api.stop()
+    for stage in ('import', 'create_app', 'first_update'):
+        values = sorted(run[stage] for run in runs)
+        print(f'{stage:<14} медиана {values[len(values) // 2]:8.2f} мс, минимум {values[0]:8.2f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Локальный поддельный Bot API сервер для нагрузочных тестов.
+Отдает заранее подготовленные обновления через getUpdates и принимает sendMessage,
+эмулируя сетевую задержку и, при необходимости, ответы 429 Too Many Requests.
+"""
+import itertools
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER: Dict[str, Any] = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+
+
+def text_update(update_id: int, chat_id: int, text: str, username: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Создает обновление Telegram с текстовым сообщением пользователя.
+    :param update_id: Идентификатор обновления.
+    :param chat_id: Идентификатор чата, он же идентификатор пользователя.
+    :param text: Текст сообщения; команды вида /start размечаются как bot_command.
+    :param username: Имя пользователя, по умолчанию user<chat_id>.
+    :return: Обновление в формате Bot API.
+    """
+    username = username or f'user{chat_id}'
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'username': username},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': username, 'username': username},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Бот закрывает соединения при остановке, это не ошибка теста
+        pass
+
+
+class FakeBotAPI:
+    """
+    Поддельный Bot API. Адрес для telebot: apihelper.API_URL = FakeBotAPI.api_url.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 flood_every: int = 0, retry_after: int = 1) -> None:
+        """
+        :param host: Адрес для прослушивания.
+        :param port: Порт, 0 — выбрать свободный.
+        :param latency: Задержка ответа на sendMessage в секундах.
+        :param flood_every: Отвечать 429 на каждый N-й sendMessage, 0 — никогда.
+        :param retry_after: Значение retry_after в ответе 429.
+        """
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.updates: List[Dict[str, Any]] = []
+        self.sent: List[Dict[str, Any]] = []
+        self.rejected: int = 0
+        self.polls: int = 0
+        self._calls = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._server = _QuietServer((host, port), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def api_url(self) -> str:
+        return self.base_url + '/bot{0}/{1}'
+
+    def start(self) -> 'FakeBotAPI':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push_updates(self, updates: List[Dict[str, Any]]) -> None:
+        with self._cond:
+            self.updates.extend(updates)
+            self._cond.notify_all()
+
+    def wait_polling(self, timeout: float = 30.0) -> bool:
+        """
+        Ждет первого обычного запроса getUpdates от бота.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self.polls > 0, timeout)
+
+    def wait_sent(self, count: int, timeout: float = 60.0) -> bool:
+        """
+        Ждет, пока бот отправит count сообщений.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.sent) >= count, timeout)
+
+    def count_text(self, fragment: str) -> int:
+        """
+        Считает вхождения фрагмента во всех отправленных текстах.
+        Бот может склеивать несколько ответов в одно сообщение, поэтому ответы считаются по тексту, а не по запросам.
+        """
+        with self._cond:
+            return sum(sent.get('text', '').count(fragment) for sent in self.sent)
+
+    def wait_text(self, fragment: str, count: int, timeout: float = 60.0) -> bool:
+        """
+        Ждет, пока фрагмент встретится в отправленных текстах count раз.
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: sum(sent.get('text', '').count(fragment) for sent in self.sent) >= count, timeout
+            )
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = min(float(params.get('timeout') or 0), 1.0)
+        if offset < 0:
+            # skip_pending: на момент старта очередь считается пустой
+            return []
+        with self._cond:
+            self.polls += 1
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self.updates and self.updates[-1]['update_id'] >= offset, timeout)
+            return [u for u in self.updates if u['update_id'] >= offset][:limit]
+
+    def _send_message(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.flood_every and next(self._calls) % self.flood_every == 0:
+            with self._cond:
+                self.rejected += 1
+            return None
+        if self.latency:
+            time.sleep(self.latency)
+        chat_id = int(params['chat_id'])
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+        with self._cond:
+            self.sent.append(dict(params, sent_at=time.monotonic()))
+            self._cond.notify_all()
+        return message
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def _params(self) -> Dict[str, Any]:
+                url = urlsplit(self.path)
+                params: Dict[str, Any] = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/json'):
+                    params.update(json.loads(body))
+                elif body and content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode()))
+                return params
+
+            def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                self.do_POST()
+
+            def do_POST(self) -> None:
+                method = urlsplit(self.path).path.rsplit('/', 1)[-1]
+                params = self._params()
+                if method == 'getUpdates':
+                    return self._reply(200, {'ok': True, 'result': api._get_updates(params)})
+                if method == 'sendMessage':
+                    message = api._send_message(params)
+                    if message is None:
+                        return self._reply(429, {
+                            'ok': False, 'error_code': 429,
+                            'description': f'Too Many Requests: retry after {api.retry_after}',
+                            'parameters': {'retry_after': api.retry_after},
+                        })
+                    return self._reply(200, {'ok': True, 'result': message})
+                if method == 'getMe':
+                    return self._reply(200, {'ok': True, 'result': BOT_USER})
+                return self._reply(200, {'ok': True, 'result': True})
+
+        return Handler
@@ -0,0 +1,72 @@
+"""
+Нагрузочное сравнение синхронного и асинхронного режимов бота.
+Бот запускается отдельным процессом (python main.py) против поддельного Bot API и локальной SQLite базы,
+после чего в очередь обновлений выкладываются нажатия "Дальше ⏭" от множества чатов.
+Лимиты очереди исходящих сообщений снимаются, чтобы замерялась обработка обновлений, а не ограничения Telegram.
+
+Запуск из корня проекта:
+    python benchmarks/load_modes.py --chats 50 --updates 1000 --latency 0.02
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI, text_update  # noqa: E402
+from ui import Command  # noqa: E402
+
+CARD_TEXT = 'Выбери перевод слова'
+UNLIMITED_OUTBOX = {'OUTBOX_GLOBAL_RATE': '1000000', 'OUTBOX_CHAT_RATE': '1000000', 'OUTBOX_CHAT_BURST': '1000000'}
+
+
+def run_mode(mode: str, chats: int, updates: int, latency: float, extra_env: dict) -> float:
+    """
+    Запускает бота в указанном режиме и возвращает пропускную способность в обновлениях в секунду.
+    """
+    api = FakeBotAPI(latency=latency).start()
+    workdir = tempfile.mkdtemp(prefix=f'bench-{mode}-')
+    database = os.path.join(workdir, 'bot.sqlite3')
+    env = dict(os.environ, BOT_MODE=mode, TG_TOKEN='123456:fake', TG_API_URL=api.api_url,
+               DATABASE_URL=f'sqlite:///{database}', **UNLIMITED_OUTBOX, **extra_env)
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not api.wait_polling(timeout=30):
+            raise RuntimeError(f'бот в режиме {mode} не начал опрос')
+
+        # Первое обращение каждого чата регистрирует пользователя, в замер не входит
+        api.push_updates([text_update(i + 1, 1000 + i, Command.NEXT) for i in range(chats)])
+        if not api.wait_text(CARD_TEXT, chats, timeout=60):
+            raise RuntimeError(f'бот в режиме {mode} не ответил на прогревочные обновления')
+
+        start = time.perf_counter()
+        api.push_updates([text_update(chats + i + 1, 1000 + i % chats, Command.NEXT) for i in range(updates)])
+        if not api.wait_text(CARD_TEXT, chats + updates, timeout=600):
+            raise RuntimeError(f'бот в режиме {mode} обработал только {api.count_text(CARD_TEXT) - chats} из {updates}')
+        return updates / (time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        api.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'])
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка sendMessage в секундах')
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        rate = run_mode(mode, args.chats, args.updates, args.latency, {})
+        print(f'{mode:>6}: {rate:8.1f} обновлений/с')
+
+
+if __name__ == '__main__':
+    main()
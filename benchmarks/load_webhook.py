@@ -0,0 +1,126 @@
+"""
+Нагрузочный тест приема обновлений через вебхук.
+Бот запускается отдельным процессом с BOT_TRANSPORT=webhook против поддельного Bot API и локальной SQLite базы,
+после чего несколько клиентов отправляют на вебхук нажатия "Дальше ⏭" от множества чатов, как это делает Telegram.
+Измеряется скорость приема запросов и скорость полной обработки до отправки ответа.
+
+Запуск из корня проекта:
+    python benchmarks/load_webhook.py --chats 50 --updates 2000 --clients 8
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI, text_update  # noqa: E402
+from benchmarks.load_modes import CARD_TEXT, UNLIMITED_OUTBOX  # noqa: E402
+from ui import Command  # noqa: E402
+from webhook import SECRET_HEADER  # noqa: E402
+
+SECRET = 'load-test-secret'
+PATH = '/telegram'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_listening(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('вебхук не начал принимать соединения')
+
+
+def post_all(port: int, updates: list, secret: str = SECRET) -> Counter:
+    """
+    Отправляет обновления по одному соединению; на ответ 503 повторяет отправку, как Telegram.
+    :return: Количество ответов по кодам состояния.
+    """
+    statuses = Counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Content-Type': 'application/json', SECRET_HEADER: secret}
+    for update in updates:
+        body = json.dumps(update)
+        while True:
+            connection.request('POST', PATH, body, headers)
+            response = connection.getresponse()
+            response.read()
+            statuses[response.status] += 1
+            if response.status != 503:
+                break
+            time.sleep(0.01)
+    connection.close()
+    return statuses
+
+
+def run_mode(mode: str, chats: int, updates: int, clients: int, latency: float) -> None:
+    api = FakeBotAPI(latency=latency).start()
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix=f'webhook-{mode}-')
+    env = dict(os.environ, BOT_MODE=mode, BOT_TRANSPORT='webhook', TG_TOKEN='123456:fake', TG_API_URL=api.api_url,
+               DATABASE_URL=f'sqlite:///{os.path.join(workdir, "bot.sqlite3")}', WEBHOOK_HOST='127.0.0.1',
+               WEBHOOK_PORT=str(port), WEBHOOK_PATH=PATH, WEBHOOK_SECRET=SECRET,
+               WEBHOOK_URL=f'http://127.0.0.1:{port}{PATH}', **UNLIMITED_OUTBOX)
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_listening(port)
+        rejected = post_all(port, [text_update(1, 999, Command.NEXT)], secret='wrong')
+        assert rejected == {403: 1}, f'запрос с неверным секретом не отклонен: {rejected}'
+
+        # Первое обращение каждого чата регистрирует пользователя, в замер не входит
+        post_all(port, [text_update(i + 1, 1000 + i, Command.NEXT) for i in range(chats)])
+        if not api.wait_text(CARD_TEXT, chats, timeout=60):
+            raise RuntimeError(f'бот в режиме {mode} не ответил на прогревочные обновления')
+
+        batch = [text_update(chats + i + 1, 1000 + i % chats, Command.NEXT) for i in range(updates)]
+        # Обновления одного чата отправляет один клиент, чтобы сохранить их порядок
+        parts = [[u for u in batch if u['message']['chat']['id'] % clients == n] for n in range(clients)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            statuses = sum(pool.map(lambda part: post_all(port, part), parts), Counter())
+        accepted = time.perf_counter() - start
+        if not api.wait_text(CARD_TEXT, chats + updates, timeout=600):
+            raise RuntimeError(f'бот в режиме {mode} обработал только {api.count_text(CARD_TEXT) - chats} из {updates}')
+        handled = time.perf_counter() - start
+        print(f'{mode:>6}: прием {updates / accepted:8.1f} запросов/с, обработка {updates / handled:8.1f} обновлений/с, '
+              f'ответы {dict(statuses)}')
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        api.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'])
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=8, help='количество одновременных соединений')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка sendMessage в секундах')
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        run_mode(mode, args.chats, args.updates, args.clients, args.latency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar('V')
+
+
+class LRUCache(Generic[V]):
+    """
+    Потокобезопасный кэш ограниченного размера с вытеснением давно неиспользуемых записей
+    и временем жизни записи.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: Optional[float] = 3600.0) -> None:
+        """
+        :param maxsize: Максимальное количество записей.
+        :param ttl: Время жизни записи в секундах, None — без ограничения.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, Tuple[V, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Возвращает значение по ключу или None, если записи нет или она устарела.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: V) -> None:
+        """
+        Сохраняет значение, вытесняя самую старую запись при переполнении.
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Удаляет запись по ключу, если она есть.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class lazy_property:
+    """
+    Свойство, значение которого создается при первом обращении и сохраняется в экземпляре.
+    Создание выполняется под блокировкой экземпляра: компонент создается один раз,
+    даже если к нему одновременно обращаются несколько потоков обработки.
+    """
+
+    def __init__(self, factory: Callable[[Any], Any]) -> None:
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+
+    def __get__(self, instance: Any, owner: type) -> Any:
+        if instance is None:
+            return self
+        with instance._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.factory(instance)
+            return instance.__dict__[self.name]
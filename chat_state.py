@@ -0,0 +1,117 @@
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+
+RECENT_SIZE: int = 5
+
+
+class ChatState:
+    """
+    Компактное состояние одного чата: шаг пользователя, последние показанные слова и текущая карточка.
+    """
+    __slots__ = ('step', 'recent', 'recent_pos', 'word_id', 'target_word', 'translate', 'buttons', 'mistakes',
+                 'last_seen')
+
+    def __init__(self) -> None:
+        self.step: int = 0
+        # Кольцевой буфер идентификаторов последних слов, 0 означает пустую ячейку
+        self.recent: array = array('q', bytes(8 * RECENT_SIZE))
+        self.recent_pos: int = 0
+        self.word_id: Optional[int] = None
+        self.target_word: Optional[str] = None
+        self.translate: Optional[str] = None
+        self.buttons: Tuple[str, ...] = ()
+        self.mistakes: int = 0
+        self.last_seen: float = time.monotonic()
+
+    def push_recent(self, word_id: int) -> None:
+        """
+        Запоминает слово как недавно показанное, вытесняя самое старое.
+        :param word_id: Идентификатор слова.
+        """
+        self.recent[self.recent_pos] = word_id
+        self.recent_pos = (self.recent_pos + 1) % RECENT_SIZE
+
+    def recent_ids(self) -> Set[int]:
+        """
+        :return: Множество идентификаторов последних показанных слов.
+        """
+        return {word_id for word_id in self.recent if word_id}
+
+    def set_card(self, word_id: Optional[int], target_word: str, translate: str, buttons: Tuple[str, ...]) -> None:
+        """
+        Сохраняет текущую карточку чата.
+        :param word_id: Идентификатор целевого слова.
+        :param target_word: Целевое слово.
+        :param translate: Перевод целевого слова.
+        :param buttons: Подписи кнопок с вариантами ответа.
+        """
+        self.word_id = word_id
+        self.target_word = target_word
+        self.translate = translate
+        self.buttons = buttons
+        self.mistakes = 0
+
+    def mark_wrong(self, text: str) -> None:
+        """
+        Помечает кнопку с неверным вариантом ответа и учитывает ошибку.
+        :param text: Подпись кнопки, выбранной пользователем.
+        """
+        self.mistakes += 1
+        self.buttons = tuple(button + '❌' if button == text else button for button in self.buttons)
+
+
+class ChatStateStore:
+    """
+    Хранилище состояний чатов с вытеснением неактивных чатов и ограничением общего количества записей.
+    """
+
+    def __init__(self, max_chats: int = 100_000, idle_ttl: float = 24 * 3600) -> None:
+        """
+        :param max_chats: Максимальное количество одновременно хранимых чатов.
+        :param idle_ttl: Время в секундах, после которого неактивный чат вытесняется.
+        """
+        self.max_chats = max_chats
+        self.idle_ttl = idle_ttl
+        self._chats: 'OrderedDict[int, ChatState]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def get(self, chat_id: int) -> Tuple[ChatState, bool]:
+        """
+        Возвращает состояние чата, создавая его при необходимости.
+        :param chat_id: Идентификатор чата.
+        :return: Кортеж из состояния чата и признака того, что состояние только что создано.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._chats.get(chat_id)
+            created = state is None
+            if created:
+                state = ChatState()
+                self._chats[chat_id] = state
+            else:
+                self._chats.move_to_end(chat_id)
+            state.last_seen = now
+            self._evict(now)
+        return state, created
+
+    def _evict(self, now: float) -> None:
+        """
+        Удаляет самые давно активные чаты: просроченные и сверх лимита.
+        Записи упорядочены по времени последней активности, поэтому проверяется только начало очереди.
+        """
+        while self._chats:
+            chat_id, state = next(iter(self._chats.items()))
+            if len(self._chats) > self.max_chats or now - state.last_seen > self.idle_ttl:
+                del self._chats[chat_id]
+            else:
+                break
@@ -1,13 +1,107 @@
+import random
+
 import sqlalchemy as sq
-from sqlalchemy import func
-from sqlalchemy.orm import declarative_base, relationship, Session
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased, declarative_base, relationship, Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql.elements import or_, and_
-from typing import Optional, Tuple, List
+from sqlalchemy.sql.elements import or_
+from typing import Optional, Tuple, List, Dict, Collection, NamedTuple
+
+from cache import LRUCache
+from distractors import DistractorPools
+from sampler import WordSampler
+from scheduler import DEFAULT_EASE, NEW_WORD_DUE, review, utcnow
 
 
 Base = declarative_base()
 
+INITIAL_USER_ID: int = 1
+INITIAL_USER_NAME: str = 'Initial User'
+INITIAL_DATA: List[Dict[str, str]] = [
+    {'target_word': 'red', 'translate': 'красный'},
+    {'target_word': 'blue', 'translate': 'синий'},
+    {'target_word': 'green', 'translate': 'зеленый'},
+    {'target_word': 'I', 'translate': 'я'},
+    {'target_word': 'you', 'translate': 'ты'},
+    {'target_word': 'they', 'translate': 'они'},
+    {'target_word': 'run', 'translate': 'бежать'},
+    {'target_word': 'jump', 'translate': 'прыгать'},
+    {'target_word': 'eat', 'translate': 'есть'},
+    {'target_word': 'cat', 'translate': 'кошка'},
+    {'target_word': 'dog', 'translate': 'собака'},
+    {'target_word': 'elephant', 'translate': 'слон'},
+    {'target_word': 'book', 'translate': 'книга'},
+    {'target_word': 'sun', 'translate': 'солнце'},
+    {'target_word': 'water', 'translate': 'вода'}
+]
+
+# Текущая версия схемы и DDL для обновления существующих баз до каждой версии.
+# Таблицы, которых еще нет, создаются по моделям, поэтому миграции нужны только для изменения существующих таблиц.
+SCHEMA_VERSION: int = 6
+MIGRATIONS: Dict[int, List[str]] = {
+    2: [
+        f"ALTER TABLE user_words ADD COLUMN ease FLOAT NOT NULL DEFAULT {DEFAULT_EASE}",
+        "ALTER TABLE user_words ADD COLUMN interval_days INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_words ADD COLUMN repetitions INTEGER NOT NULL DEFAULT 0",
+        f"ALTER TABLE user_words ADD COLUMN due_at TIMESTAMP NOT NULL DEFAULT '{NEW_WORD_DUE:%Y-%m-%d %H:%M:%S}'",
+        "CREATE INDEX ix_user_words_user_due ON user_words (user_id, due_at)",
+    ],
+    # Счетчик пересчитывается в bootstrap после миграций
+    3: [
+        "ALTER TABLE users ADD COLUMN word_count INTEGER NOT NULL DEFAULT 0",
+    ],
+    # Таблицы answers и user_stats создаются по моделям
+    4: [
+        "CREATE INDEX ix_user_words_user_ease ON user_words (user_id, ease)",
+    ],
+    # Поиск ссылок на слово при сборке мусора
+    5: [
+        "CREATE INDEX ix_user_words_word ON user_words (word_id)",
+    ],
+    # Отметка изменений словаря, по которой бот решает, перечитывать ли пул слов
+    6: [
+        "ALTER TABLE users ADD COLUMN words_version INTEGER NOT NULL DEFAULT 0",
+    ],
+}
+BOOTSTRAP_LOCK_KEY: int = 7_340_001
+# Простое число для перестановки слов с одинаковым сроком повторения в build_card
+TIEBREAK_MODULUS: int = 2_147_483_647
+
+
+
+class Caches:
+    """
+    Кэши в памяти процесса, которыми пользуются функции модуля: пулы слов, индексы похожих слов
+    и идентификаторы пользователей. Каждое приложение держит собственный набор и передает его функциям
+    через Session.info['caches'] (см. session_caches); без него используется набор по умолчанию default_caches.
+    """
+
+    def __init__(self, pool_ttl: Optional[float] = 300.0) -> None:
+        """
+        :param pool_ttl: Время в секундах, через которое пулы слов сверяются с базой данных.
+        """
+        self.sampler: WordSampler = WordSampler(ttl=pool_ttl)
+        self.distractors: DistractorPools = DistractorPools()
+        self.user_ids: LRUCache[int] = LRUCache(maxsize=100_000, ttl=24 * 3600)
+
+    def clear(self) -> None:
+        """
+        Сбрасывает все кэши, например после пересоздания схемы базы данных.
+        """
+        self.sampler.invalidate()
+        self.distractors.invalidate()
+        self.user_ids.clear()
+
+
+default_caches: Caches = Caches()
+
+
+def session_caches(session: Session) -> Caches:
+    """
+    :return: Кэши приложения, которому принадлежит сессия, иначе кэши по умолчанию.
+    """
+    return session.info.get('caches', default_caches)
+
 
 class UserWord(Base):
     """
@@ -17,6 +111,16 @@ class UserWord(Base):
 
     user_id = sq.Column(sq.Integer, sq.ForeignKey('users.id'), primary_key=True)
     word_id = sq.Column(sq.Integer, sq.ForeignKey('words.id'), primary_key=True)
+    # Расписание повторений SM-2; новое слово подлежит повторению сразу
+    ease = sq.Column(sq.Float, nullable=False, default=DEFAULT_EASE, server_default=str(DEFAULT_EASE))
+    interval_days = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+    repetitions = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+    due_at = sq.Column(sq.DateTime, nullable=False, default=NEW_WORD_DUE,
+                       server_default=f'{NEW_WORD_DUE:%Y-%m-%d %H:%M:%S}')
+
+    __table_args__ = (sq.Index('ix_user_words_user_due', 'user_id', 'due_at'),
+                      sq.Index('ix_user_words_user_ease', 'user_id', 'ease'),
+                      sq.Index('ix_user_words_word', 'word_id'))
 
 
 class Users(Base):
@@ -26,6 +130,11 @@ class Users(Base):
     __tablename__ = 'users'
     id = sq.Column(sq.Integer, autoincrement=True, primary_key=True)
     name = sq.Column(sq.String(50), nullable=False, unique=True)
+    # Для общего набора — количество его слов, для остальных пользователей — количество собственных слов,
+    # которых нет в общем наборе. Поддерживается add_word, delete_word и пакетной загрузкой.
+    word_count = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+    # Увеличивается при каждом добавлении или удалении слов пользователя (см. change_word_count)
+    words_version = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
     Words = relationship('UserWord', backref='users')
 
 
@@ -40,6 +149,75 @@ class Words(Base):
     Users = relationship('UserWord', backref='words')
 
 
+class SchemaVersion(Base):
+    """
+    Класс описывающий таблицу примененных версий схемы базы данных
+    """
+    __tablename__ = 'schema_version'
+    version = sq.Column(sq.Integer, primary_key=True)
+    applied_at = sq.Column(sq.DateTime, nullable=False, server_default=sq.func.now())
+
+
+class BotState(Base):
+    """
+    Класс описывающий таблицу состояний диалогов бота
+    """
+    __tablename__ = 'bot_states'
+    key = sq.Column(sq.String(255), primary_key=True)
+    state = sq.Column(sq.String(100))
+    data = sq.Column(sq.Text, nullable=False, server_default='{}')
+    updated_at = sq.Column(sq.DateTime, nullable=False, server_default=sq.func.now())
+
+
+class Answer(Base):
+    """
+    Класс описывающий таблицу истории ответов пользователей
+    """
+    __tablename__ = 'answers'
+    id = sq.Column(sq.BigInteger().with_variant(sq.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    user_id = sq.Column(sq.Integer, sq.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    word_id = sq.Column(sq.Integer, sq.ForeignKey('words.id', ondelete='CASCADE'), nullable=False)
+    correct = sq.Column(sq.Boolean, nullable=False)
+    answered_at = sq.Column(sq.DateTime, nullable=False)
+
+    __table_args__ = (sq.Index('ix_answers_user_answered', 'user_id', 'answered_at'),
+                      sq.Index('ix_answers_word', 'word_id'))
+
+
+class UserStats(Base):
+    """
+    Класс описывающий таблицу сводной статистики ответов пользователя.
+    Поддерживается при записи истории ответов, поэтому /stats не читает историю целиком.
+    """
+    __tablename__ = 'user_stats'
+    user_id = sq.Column(sq.Integer, sq.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    answers = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+    correct = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+    # Текущая и лучшая серии верных ответов подряд
+    streak = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+    best_streak = sq.Column(sq.Integer, nullable=False, default=0, server_default='0')
+
+
+class Card(NamedTuple):
+    """
+    Карточка для тренировки: целевое слово, его перевод и неверные варианты ответа.
+    """
+    word_id: int
+    target_word: str
+    translate: str
+    others: List[str]
+
+
+class AnswerStats(NamedTuple):
+    """
+    Сводная статистика ответов пользователя.
+    """
+    answers: int = 0
+    correct: int = 0
+    streak: int = 0
+    best_streak: int = 0
+
+
 def create_table(engine: sq.engine.Engine) -> None:
     """
     Создаем все таблицы в базе данных, если они еще не существуют.
@@ -47,6 +225,17 @@ def create_table(engine: sq.engine.Engine) -> None:
     Base.metadata.create_all(engine)
 
 
+def dialect_insert(session: Session, model) -> sq.Insert:
+    """
+    Возвращает конструкцию INSERT для диалекта текущей базы данных с поддержкой ON CONFLICT.
+    :param session: Сессия SQLAlchemy.
+    :param model: Модель или таблица, в которую выполняется вставка.
+    :return: Конструкция INSERT.
+    """
+    insert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    return insert(model)
+
+
 def check_user_exist(session: Session, username: str) -> bool:
     """
     Проверяем, существует ли пользователь с указанным именем.
@@ -54,7 +243,23 @@ def check_user_exist(session: Session, username: str) -> bool:
     :param username: Имя пользователя.
     :return: True, если пользователь не существует, иначе False.
     """
-    return session.query(Users).filter_by(name=username).first() is None
+    return get_user_id(session, username) is None
+
+
+def get_user_id(session: Session, username: str) -> Optional[int]:
+    """
+    Возвращает идентификатор пользователя по имени, используя кэш.
+    :param session: Сессия SQLAlchemy.
+    :param username: Имя пользователя.
+    :return: Идентификатор пользователя или None, если пользователь не найден.
+    """
+    user_ids = session_caches(session).user_ids
+    user_id = user_ids.get(username)
+    if user_id is None:
+        user_id = session.query(Users.id).filter_by(name=username).scalar()
+        if user_id is not None:
+            user_ids.set(username, user_id)
+    return user_id
 
 
 def check_word_exist(session: Session, word: str) -> Optional[Words]:
@@ -78,150 +283,454 @@ def add_user(session, username: str) -> Optional[bool]:
     session.add(new_user)
     try:
         session.commit()
+        session_caches(session).user_ids.set(username, new_user.id)
         return True
     except IntegrityError:
         session.rollback()
         return None
 
-def count_user_word(session: Session, current_user: str) -> int:
+def upsert_user(session: Session, username: str, commit: bool = True) -> int:
+    """
+    Добавляет пользователя, если его еще нет, и возвращает его идентификатор одним запросом.
+    :param session: Сессия SQLAlchemy.
+    :param username: Имя пользователя.
+    :param commit: Фиксировать ли транзакцию.
+    :return: Идентификатор пользователя.
+    """
+    insert = dialect_insert(session, Users).values(name=username)
+    user_id = session.scalar(
+        insert.on_conflict_do_update(index_elements=['name'], set_={'name': insert.excluded.name}).returning(Users.id)
+    )
+    if commit:
+        session.commit()
+    session_caches(session).user_ids.set(username, user_id)
+    return user_id
+
+
+def count_user_word(session: Session, user_id: int) -> int:
     """
-    Считает количество слов изучаемых текущим пользователем
+    Считает количество слов изучаемых текущим пользователем: слова общего набора и собственные слова без повторов.
+    Значение берется из счетчиков в таблице пользователей, поэтому не зависит от размера словаря.
     :param session: Сессия SQLAlchemy.
-    :param current_user: Текущий пользователь
+    :param user_id: Идентификатор текущего пользователя
     :return: Количество слов, изучаемых пользователем
     """
-    user = session.query(Users).filter_by(name=current_user).first()
+    shared = sq.select(Users.word_count).where(Users.id == INITIAL_USER_ID).scalar_subquery()
+    if user_id == INITIAL_USER_ID:
+        return session.scalar(sq.select(shared)) or 0
+    return session.scalar(sq.select(Users.word_count + shared).where(Users.id == user_id)) or 0
+
+
+def actual_word_count() -> sq.ScalarSelect:
+    """
+    Выражение, вычисляющее значение счетчика Users.word_count по таблице связей.
+    Используется для пересчета и проверки счетчиков.
+    """
+    own, shared = aliased(UserWord), aliased(UserWord)
     return (
-        session.query(Words)
-        .join(UserWord)
-        .filter(or_(UserWord.user_id == 1, UserWord.user_id == user.id))
-        .count()
+        sq.select(sq.func.count())
+        .select_from(own)
+        .where(own.user_id == Users.id,
+               or_(Users.id == INITIAL_USER_ID,
+                   ~sq.exists().where(shared.user_id == INITIAL_USER_ID, shared.word_id == own.word_id)))
+        .correlate(Users)
+        .scalar_subquery()
     )
 
-def add_word(session: Session, word: str, translate: str, current_user: str) -> Tuple[int, Optional[bool]]:
+
+def refresh_word_counts(session: Session, user_ids: Optional[Collection[int]] = None) -> int:
     """
-    Добавляем новое слово и связываем его с пользователем.
+    Пересчитывает счетчики слов по таблице связей. Фиксация транзакции остается за вызывающим кодом.
     :param session: Сессия SQLAlchemy.
-    :param word: Слово для добавления.
-    :param translate: Перевод слова.
-    :param current_user: Имя пользователя, к которому привязывается слово.
-    :return: True, если слово успешно добавлено, иначе False; Количество изучаемых текущим пользователем слов
+    :param user_ids: Идентификаторы пользователей, по умолчанию все пользователи.
+    :return: Количество обновленных строк.
     """
-    current_word = check_word_exist(session, word)
-    if not current_word:
-        current_word = Words(target_word=word, translate=translate)
-        session.add(current_word)
-        session.flush()
+    update = sq.update(Users).values(word_count=actual_word_count())
+    if user_ids is not None:
+        update = update.where(Users.id.in_(user_ids))
+    return session.execute(update, execution_options={'synchronize_session': False}).rowcount
+
+
+def word_count_mismatches(session: Session) -> List[Tuple[int, int, int]]:
+    """
+    Находит пользователей, у которых сохраненный счетчик слов не совпадает с фактическим.
+    :param session: Сессия SQLAlchemy.
+    :return: Список из идентификатора пользователя, сохраненного и фактического значений.
+    """
+    actual = actual_word_count()
+    return [tuple(row) for row in session.execute(
+        sq.select(Users.id, Users.word_count, actual).where(Users.word_count != actual).order_by(Users.id)
+    )]
 
-    user = session.query(Users).filter_by(name=current_user).first()
 
-    if session.query(UserWord).filter_by(user_id=user.id, word_id=current_word.id).first():
-        return count_user_word(session, current_user), False
+def change_word_count(session: Session, user_id: int, word_ids: Collection[int], sign: int) -> None:
+    """
+    Изменяет счетчик слов пользователя после добавления или удаления связей в текущей транзакции
+    и сдвигает отметку изменений его словаря.
+    Слова общего набора не меняют счетчик обычного пользователя. Изменение самого общего набора
+    затрагивает счетчики всех пользователей, поэтому в этом случае они пересчитываются целиком.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: Идентификатор пользователя.
+    :param word_ids: Идентификаторы добавленных или удаленных слов пользователя.
+    :param sign: 1 при добавлении, -1 при удалении.
+    """
+    if not word_ids:
+        return
+    if user_id == INITIAL_USER_ID:
+        session.flush()
+        refresh_word_counts(session)
+        touch_words(session, INITIAL_USER_ID)
+        return
+    shared = (
+        sq.select(sq.func.count())
+        .select_from(UserWord)
+        .where(UserWord.user_id == INITIAL_USER_ID, UserWord.word_id.in_(word_ids))
+        .scalar_subquery()
+    )
+    session.execute(
+        sq.update(Users).where(Users.id == user_id).values(word_count=Users.word_count + sign * (len(word_ids) - shared),
+                                                          words_version=Users.words_version + 1),
+        execution_options={'synchronize_session': False}
+    )
 
-    user_word = UserWord(user_id=user.id, word_id=current_word.id)
-    session.add(user_word)
 
+def touch_words(session: Session, user_id: int) -> None:
+    """
+    Сдвигает отметку изменений словаря пользователя, чтобы боты перечитали его пул слов.
+    Фиксация транзакции остается за вызывающим кодом.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: Идентификатор пользователя.
+    """
+    session.execute(sq.update(Users).where(Users.id == user_id).values(words_version=Users.words_version + 1),
+                    execution_options={'synchronize_session': False})
+
+def add_word(session: Session, word: str, translate: str, user_id: int) -> Optional[Tuple[int, bool]]:
+    """
+    Добавляем новое слово и связываем его с пользователем.
+    Слово вставляется запросом INSERT ... ON CONFLICT DO UPDATE, который блокирует уже существующую строку
+    до конца транзакции со связью, поэтому collect_orphan_words не может удалить слово между поиском и привязкой.
+    :param session: Сессия SQLAlchemy.
+    :param word: Слово для добавления.
+    :param translate: Перевод слова.
+    :param user_id: Идентификатор пользователя, к которому привязывается слово.
+    :return: Количество изучаемых текущим пользователем слов; True, если слово успешно добавлено, False, если оно
+        уже есть в словаре. None, если слово добавить не удалось.
+    """
     try:
+        insert = dialect_insert(session, Words).values(target_word=word, translate=translate)
+        word_id = session.scalar(
+            insert.on_conflict_do_update(index_elements=['target_word'], set_={'target_word': insert.excluded.target_word})
+            .returning(Words.id)
+        )
+        linked = session.scalar(
+            dialect_insert(session, UserWord).values(user_id=user_id, word_id=word_id)
+            .on_conflict_do_nothing(index_elements=['user_id', 'word_id'])
+            .returning(UserWord.word_id)
+        )
+        if linked is None:
+            session.rollback()
+            return count_user_word(session, user_id), False
+        change_word_count(session, user_id, [word_id], 1)
         session.commit()
-        return count_user_word(session, current_user), True
     except IntegrityError:
         session.rollback()
         return None
+    caches = session_caches(session)
+    caches.sampler.add(user_id, word_id)
+    caches.distractors.add(user_id, [(word_id, word)])
+    return count_user_word(session, user_id), True
 
 
-def delete_word(session: Session, word: str, current_user: str) -> None:
+def delete_words(session: Session, words: Collection[str], user_id: int) -> List[str]:
+    """
+    Удаляем слова из словаря пользователя одним запросом DELETE ... RETURNING, который сразу сообщает,
+    какие из слов были в словаре. Слова, на которые больше никто не ссылается, остаются в таблице words
+    до очередного запуска collect_orphan_words.
+    Слова общего набора обычный пользователь удалить не может: его связь с таким словом хранит только расписание
+    повторений (см. record_answer), поэтому такие слова не удаляются и возвращаются как отсутствующие.
+    :param session: Сессия SQLAlchemy.
+    :param words: Слова для удаления.
+    :param user_id: Идентификатор пользователя.
+    :return: Удаленные слова в порядке перечисления.
+    """
+    if not words:
+        return []
+    # Имена столбцов в RETURNING не уточняются таблицей в SQLite, поэтому подзапросы идут по псевдонимам
+    deleted_word, shared = aliased(Words, name='deleted_word'), aliased(UserWord, name='shared')
+    condition = [UserWord.user_id == user_id,
+                 UserWord.word_id.in_(sq.select(Words.id).where(Words.target_word.in_(words)))]
+    if user_id != INITIAL_USER_ID:
+        condition.append(~sq.exists().where(shared.user_id == INITIAL_USER_ID, shared.word_id == UserWord.word_id))
+    rows = session.execute(
+        sq.delete(UserWord)
+        .where(*condition)
+        .returning(UserWord.word_id,
+                   sq.select(deleted_word.target_word).where(deleted_word.id == UserWord.word_id)
+                   .correlate(UserWord).scalar_subquery()),
+        execution_options={'synchronize_session': False}
+    ).all()
+    word_ids = [word_id for word_id, _ in rows]
+    change_word_count(session, user_id, word_ids, -1)
+    session.commit()
+    caches = session_caches(session)
+    for word_id in word_ids:
+        caches.sampler.remove(user_id, word_id)
+    caches.distractors.remove(user_id, word_ids)
+    deleted = {word for _, word in rows}
+    return [word for word in words if word in deleted]
+
+
+def delete_word(session: Session, word: str, user_id: int) -> bool:
     """
     Удаляем слово для указанного пользователя.
     :param session: Сессия SQLAlchemy.
     :param word: Слово для удаления.
-    :param current_user: Имя пользователя.
+    :param user_id: Идентификатор пользователя.
+    :return: True, если слово было в словаре пользователя.
     """
-    user = session.query(Users).filter_by(name=current_user).first()
-    word_to_delete = session.query(Words).filter_by(target_word=word).first()
-
-    if user and word_to_delete:
-        user_word_relation = session.query(UserWord).filter_by(user_id=user.id, word_id=word_to_delete.id).first()
-        if user_word_relation:
-            session.delete(user_word_relation)
+    return bool(delete_words(session, [word], user_id))
 
-        if not session.query(UserWord).filter_by(word_id=word_to_delete.id).first():
-            session.delete(word_to_delete)
 
+def collect_orphan_words(session: Session, batch_size: int = 1000) -> int:
+    """
+    Удаляет слова, на которые не ссылается ни один пользователь. Удаление идет пачками по batch_size слов,
+    каждая в своей транзакции, чтобы не держать долгие блокировки. Поиск ссылок идет по индексу user_words (word_id).
+    :param session: Сессия SQLAlchemy.
+    :param batch_size: Количество слов, удаляемых одним запросом.
+    :return: Количество удаленных слов.
+    """
+    orphan = aliased(Words)
+    orphans = (
+        sq.select(orphan.id)
+        .where(~sq.exists().where(UserWord.word_id == orphan.id))
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    total = 0
+    while True:
+        deleted = session.scalars(
+            sq.delete(Words).where(Words.id.in_(orphans)).returning(Words.id),
+            execution_options={'synchronize_session': False}
+        ).all()
         session.commit()
+        total += len(deleted)
+        if len(deleted) < batch_size:
+            return total
 
 
-def get_random_word_pair(session: Session, current_user: str, recent_word: List[str]) -> Tuple[Optional[str], Optional[str]]:
+def pool_words(session: Session, user_id: int) -> List[Tuple[int, str]]:
     """
-    Возвращает случайное слово и его перевод из базы данных.
+    :return: Идентификаторы и тексты слов, привязанных к пользователю.
+    """
+    return session.execute(
+        sq.select(UserWord.word_id, Words.target_word).join(Words, Words.id == UserWord.word_id)
+        .where(UserWord.user_id == user_id)
+    ).tuples().all()
+
+
+def load_word_pools(session: Session, user_id: int) -> None:
+    """
+    Загружает в выборщик слов и индекс похожих слов общий пул и пул пользователя, если они еще не загружены.
+    Устаревший пул перечитывается, только если с момента загрузки сдвинулась отметка изменений словаря
+    (Users.words_version); иначе его срок продлевается, и проверка стоит одного запроса по первичному ключу.
     :param session: Сессия SQLAlchemy.
-    :param current_user: Текущий пользовватель
-    :param recent_word: Список последних использованных слов
-    :return: Кортаеж из слова и его перевод. Если слов нет, возвращает (None, None).
+    :param user_id: Идентификатор текущего пользователя
     """
-    user = session.query(Users).filter_by(name=current_user).first()
-    random_word = (
-        session.query(Words)
-        .join(UserWord)
-        .filter(or_(UserWord.user_id == 1, UserWord.user_id == user.id))
-        .filter(Words.target_word.notin_(recent_word))
-        .order_by(func.random())
-        .first()
+    caches = session_caches(session)
+    sampler, distractors = caches.sampler, caches.distractors
+    shared_ready = sampler.has_shared() and distractors.has_shared()
+    user_ready = sampler.has_user(user_id) and distractors.has_user(user_id)
+    if shared_ready and user_ready:
+        return
+    # Отметки читаются до слов: изменение, сделанное между двумя запросами, будет замечено при следующей проверке
+    stamps = dict(session.execute(
+        sq.select(Users.id, Users.words_version).where(Users.id.in_({INITIAL_USER_ID, user_id}))
+    ).tuples().all())
+    if not shared_ready and not (distractors.has_shared() and sampler.renew_shared(stamps.get(INITIAL_USER_ID))):
+        words = pool_words(session, INITIAL_USER_ID)
+        sampler.load_shared((word_id for word_id, _ in words), stamps.get(INITIAL_USER_ID))
+        distractors.load_shared(words)
+    if not user_ready and not (distractors.has_user(user_id) and sampler.renew_user(user_id, stamps.get(user_id))):
+        words = pool_words(session, user_id)
+        sampler.load_user(user_id, (word_id for word_id, _ in words), stamps.get(user_id))
+        distractors.load_user(user_id, words)
+
+
+def build_card(session: Session, user_id: int, recent: Collection[int], n_distractors: int = 3) -> Optional[Card]:
+    """
+    Собирает карточку целиком: целевое слово, его перевод и варианты-отвлекатели.
+    Целевым становится повторявшееся слово, срок повторения которого наступил, иначе случайное слово.
+    Отвлекатели — похожие по написанию слова из общего набора и собственных слов пользователя
+    по индексам похожих слов, недостающие добираются случайными словами.
+    Когда пулы слов пользователя загружены, выполняется ровно один запрос к базе данных.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: Идентификатор текущего пользователя
+    :param recent: Идентификаторы последних использованных слов
+    :param n_distractors: Количество неверных вариантов ответа.
+    :return: Карточка со словом, его переводом и списком неверных вариантов. Если слов нет, возвращает None.
+    """
+    load_word_pools(session, user_id)
+    caches = session_caches(session)
+    ids = caches.sampler.sample(user_id, 1 + n_distractors, recent)
+
+    # Слово, срок повторения которого наступил раньше всех, выбирается по индексу (user_id, due_at)
+    # в том же запросе, что и случайные слова. Слова, которые еще ни разу не повторялись (due_at = NEW_WORD_DUE),
+    # сюда не попадают и показываются случайной выборкой. Слова с одинаковым сроком упорядочиваются перестановкой
+    # идентификаторов со случайным множителем: она одинакова в обоих вхождениях подзапроса, в отличие от random()
+    salt = random.randrange(1, TIEBREAK_MODULUS)
+    due_word_id = (
+        sq.select(UserWord.word_id)
+        .where(UserWord.user_id == user_id, UserWord.due_at > NEW_WORD_DUE, UserWord.due_at <= utcnow(),
+               UserWord.word_id.notin_(recent))
+        .order_by(UserWord.due_at, sq.cast(UserWord.word_id, sq.BigInteger) * salt % TIEBREAK_MODULUS)
+        .limit(1)
+        .scalar_subquery()
     )
-    return (random_word.target_word, random_word.translate) if random_word else (None, None)
+    rows = session.execute(
+        sq.select(Words, (Words.id == due_word_id).label('is_due')).where(or_(Words.id.in_(ids), Words.id == due_word_id))
+    ).all()
+    if not rows:
+        return None
 
+    found = {word.id: word for word, _ in rows}
+    due = next((word for word, is_due in rows if is_due), None)
+    words = [found[word_id] for word_id in ids if word_id in found]
+    target = due or words[0]
+    return Card(target.id, target.target_word, target.translate,
+                pick_distractors(caches.distractors, user_id, target, recent, words, n_distractors))
 
-def get_random_words(session: Session, target_word: str, current_user: str, recent_word: List[str]) -> List[str]:
+
+def pick_distractors(distractors: DistractorPools, user_id: int, target: Words, recent: Collection[int],
+                     fallback: List[Words], k: int) -> List[str]:
+    """
+    Подбирает неверные варианты ответа: сначала похожие на целевое слово из словаря пользователя, затем случайные.
+    :param distractors: Индексы похожих слов.
+    :param user_id: Идентификатор текущего пользователя
+    :param target: Целевое слово.
+    :param recent: Идентификаторы последних использованных слов
+    :param fallback: Случайные слова пользователя.
+    :param k: Количество вариантов.
+    :return: Тексты неверных вариантов.
     """
-    Возвращает список из 4 случайных слов, исключая указанное слово.
+    others = distractors.similar(user_id, target.target_word, k, {target.id, *recent})
+    taken = {word.lower() for word in others} | {target.target_word.lower()}
+    for word in fallback:
+        if len(others) >= k:
+            break
+        if word.target_word.lower() not in taken:
+            taken.add(word.target_word.lower())
+            others.append(word.target_word)
+    return others
+
+
+def record_answer(session: Session, user_id: int, word_id: int, quality: int) -> UserWord:
+    """
+    Обновляет расписание повторений слова после ответа пользователя.
+    Слово из общего набора при первом ответе привязывается к пользователю, чтобы хранить его расписание;
+    счетчик слов пользователя при этом не меняется, так как слово уже учтено в общем наборе.
     :param session: Сессия SQLAlchemy.
-    :param target_word: Текущее целевое слово, которое нужно исключить из выборки.
-    :param current_user: Текущий пользовватель
-    :param recent_word: Список последних использованных слов
-    :return: Список случайных слов входящих привязанных к текущему пользователю и базовых слов
+    :param user_id: Идентификатор пользователя.
+    :param word_id: Идентификатор слова.
+    :param quality: Оценка ответа от 0 до 5.
+    :return: Связь пользователя и слова с обновленным расписанием.
     """
-    user = session.query(Users).filter_by(name=current_user).first()
-    random_words = (
-        session.query(Words.target_word)
-        .join(UserWord)
-        .filter(and_(Words.target_word != target_word, Words.target_word.notin_(recent_word)))
-        .filter(or_(UserWord.user_id == 1, UserWord.user_id == user.id))
-        .order_by(func.random())
-        .limit(3)
-        .all()
-    )
-    return [word.target_word for word in random_words]
+    user_word = session.get(UserWord, (user_id, word_id))
+    if user_word is None:
+        user_word = UserWord(user_id=user_id, word_id=word_id, ease=DEFAULT_EASE, interval_days=0, repetitions=0)
+        session.add(user_word)
+    schedule = review(user_word.ease, user_word.interval_days, user_word.repetitions, quality, utcnow())
+    user_word.ease, user_word.interval_days, user_word.repetitions, user_word.due_at = schedule
+    session.commit()
+    session_caches(session).sampler.add(user_id, word_id)
+    return user_word
+
+
+def get_user_stats(session: Session, user_id: int) -> AnswerStats:
+    """
+    Возвращает сводную статистику ответов пользователя одним запросом по первичному ключу.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: Идентификатор пользователя.
+    :return: Статистика; для пользователя без ответов — нулевая.
+    """
+    row = session.get(UserStats, user_id)
+    if row is None:
+        return AnswerStats()
+    return AnswerStats(row.answers, row.correct, row.streak, row.best_streak)
+
+
+def hardest_words(session: Session, user_id: int, limit: int = 5) -> List[Tuple[str, str, float]]:
+    """
+    Возвращает самые трудные слова пользователя: с наименьшим коэффициентом легкости SM-2.
+    Коэффициент снижается только после ошибок, поэтому слова без ошибок в список не попадают.
+    Выборка идет по индексу (user_id, ease) и читает не больше limit строк.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: Идентификатор пользователя.
+    :param limit: Количество слов.
+    :return: Список из слова, его перевода и коэффициента легкости.
+    """
+    rows = session.execute(
+        sq.select(Words.target_word, Words.translate, UserWord.ease)
+        .join(UserWord, UserWord.word_id == Words.id)
+        .where(UserWord.user_id == user_id, UserWord.ease < DEFAULT_EASE)
+        .order_by(UserWord.ease)
+        .limit(limit)
+    ).all()
+    return [tuple(row) for row in rows]
 
 
 def db_init(session: Session) -> None:
     """
     Инициализирует базу данных начальными данными.
-    Создает пользователя 'Initial User' и добавляет список слов с переводами.
-
-    :param session: Сессия SQLAlchemy.
-    """
-    initial_data = [
-        {'target_word': 'red', 'translate': 'красный'},
-        {'target_word': 'blue', 'translate': 'синий'},
-        {'target_word': 'green', 'translate': 'зеленый'},
-        {'target_word': 'I', 'translate': 'я'},
-        {'target_word': 'you', 'translate': 'ты'},
-        {'target_word': 'they', 'translate': 'они'},
-        {'target_word': 'run', 'translate': 'бежать'},
-        {'target_word': 'jump', 'translate': 'прыгать'},
-        {'target_word': 'eat', 'translate': 'есть'},
-        {'target_word': 'cat', 'translate': 'кошка'},
-        {'target_word': 'dog', 'translate': 'собака'},
-        {'target_word': 'elephant', 'translate': 'слон'},
-        {'target_word': 'book', 'translate': 'книга'},
-        {'target_word': 'sun', 'translate': 'солнце'},
-        {'target_word': 'water', 'translate': 'вода'}
-    ]
-
-    if add_user(session, 'Initial User'):
-        for word_pare in initial_data:
-            word = Words(target_word=word_pare['target_word'], translate=word_pare['translate'])
-            session.add(word)
-            session.commit()
-            user_word = UserWord(user_id=1, word_id=word.id)
-            session.add(user_word)
-            session.commit()
\ No newline at end of file
+    Создает пользователя 'Initial User' и добавляет список слов с переводами пакетными вставками.
+    Повторный вызов ничего не меняет. Фиксация транзакции остается за вызывающим кодом.
+
+    :param session: Сессия SQLAlchemy.
+    """
+    initial_user_id = upsert_user(session, INITIAL_USER_NAME, commit=False)
+    if initial_user_id != INITIAL_USER_ID:
+        raise RuntimeError(f"'{INITIAL_USER_NAME}' должен иметь id={INITIAL_USER_ID}, получен id={initial_user_id}")
+
+    session.execute(
+        dialect_insert(session, Words).on_conflict_do_nothing(index_elements=['target_word']), INITIAL_DATA
+    )
+    word_ids = session.scalars(
+        sq.select(Words.id).where(Words.target_word.in_([word['target_word'] for word in INITIAL_DATA]))
+    ).all()
+    session.execute(
+        dialect_insert(session, UserWord).on_conflict_do_nothing(index_elements=['user_id', 'word_id']),
+        [{'user_id': INITIAL_USER_ID, 'word_id': word_id} for word_id in word_ids]
+    )
+
+
+def bootstrap(engine: sq.engine.Engine, caches: Optional[Caches] = None) -> int:
+    """
+    Однократная подготовка базы данных при старте процесса: создает схему, применяет миграции
+    и заполняет начальные данные в одной транзакции. Повторный запуск ничего не меняет.
+
+    :param engine: Движок SQLAlchemy.
+    :param caches: Кэши приложения, которые сбрасываются после подготовки; по умолчанию default_caches.
+    :return: Версия схемы базы данных.
+    """
+    with Session(engine) as session, session.begin():
+        connection = session.connection()
+        if connection.dialect.name == 'postgresql':
+            # Параллельно стартующие процессы выполняют подготовку по очереди
+            session.execute(sq.text('SELECT pg_advisory_xact_lock(:key)'), {'key': BOOTSTRAP_LOCK_KEY})
+
+        fresh = not sq.inspect(connection).has_table(Words.__tablename__)
+        Base.metadata.create_all(connection)
+        current = session.scalar(sq.select(sq.func.max(SchemaVersion.version))) or 0
+        if current >= SCHEMA_VERSION:
+            return current
+
+        if fresh:
+            # Новая схема создана целиком по моделям, миграции не нужны
+            current = SCHEMA_VERSION
+        for version in range(max(current, 1) + 1, SCHEMA_VERSION + 1):
+            for statement in MIGRATIONS.get(version, []):
+                session.execute(sq.text(statement))
+        db_init(session)
+        refresh_word_counts(session)
+        session.add(SchemaVersion(version=SCHEMA_VERSION))
+    (caches or default_caches).clear()
+    return SCHEMA_VERSION
@@ -0,0 +1,91 @@
+"""
+Асинхронные версии функций модуля db для работы через sqlalchemy.ext.asyncio.
+Каждая функция выполняет синхронную реализацию из db внутри AsyncSession.run_sync,
+поэтому логика запросов, кэши и выборщик слов остаются общими для обоих режимов.
+"""
+from typing import Collection, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+import db
+import importer
+from db import Card, UserWord, Words
+
+
+async def bootstrap(engine: AsyncEngine, caches: Optional[db.Caches] = None) -> int:
+    """
+    Подготавливает схему и начальные данные, см. db.bootstrap.
+    """
+    async with engine.begin() as connection:
+        return await connection.run_sync(db.bootstrap, caches)
+
+
+async def create_table(engine: AsyncEngine) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(db.Base.metadata.create_all)
+
+
+async def check_user_exist(session: AsyncSession, username: str) -> bool:
+    return await session.run_sync(db.check_user_exist, username)
+
+
+async def check_word_exist(session: AsyncSession, word: str) -> Optional[Words]:
+    return await session.run_sync(db.check_word_exist, word)
+
+
+async def get_user_id(session: AsyncSession, username: str) -> Optional[int]:
+    user_id = db.session_caches(session.sync_session).user_ids.get(username)
+    if user_id is None:
+        user_id = await session.run_sync(db.get_user_id, username)
+    return user_id
+
+
+async def add_user(session: AsyncSession, username: str) -> Optional[bool]:
+    return await session.run_sync(db.add_user, username)
+
+
+async def upsert_user(session: AsyncSession, username: str) -> int:
+    return await session.run_sync(db.upsert_user, username)
+
+
+async def count_user_word(session: AsyncSession, user_id: int) -> int:
+    return await session.run_sync(db.count_user_word, user_id)
+
+
+async def add_word(session: AsyncSession, word: str, translate: str,
+                   user_id: int) -> Optional[Tuple[int, bool]]:
+    return await session.run_sync(db.add_word, word, translate, user_id)
+
+
+async def delete_word(session: AsyncSession, word: str, user_id: int) -> bool:
+    return await session.run_sync(db.delete_word, word, user_id)
+
+
+async def delete_words(session: AsyncSession, words: Collection[str], user_id: int) -> List[str]:
+    return await session.run_sync(db.delete_words, words, user_id)
+
+
+async def collect_orphan_words(session: AsyncSession, batch_size: int = 1000) -> int:
+    return await session.run_sync(db.collect_orphan_words, batch_size)
+
+
+async def build_card(session: AsyncSession, user_id: int, recent: Collection[int],
+                     n_distractors: int = 3) -> Optional[Card]:
+    return await session.run_sync(db.build_card, user_id, recent, n_distractors)
+
+
+async def record_answer(session: AsyncSession, user_id: int, word_id: int, quality: int) -> UserWord:
+    return await session.run_sync(db.record_answer, user_id, word_id, quality)
+
+
+async def hardest_words(session: AsyncSession, user_id: int, limit: int = 5) -> List[Tuple[str, str, float]]:
+    return await session.run_sync(db.hardest_words, user_id, limit)
+
+
+async def db_init(session: AsyncSession) -> None:
+    await session.run_sync(db.db_init)
+
+
+async def import_words(session: AsyncSession, user_id: int, rows: Iterable[Optional[Tuple[str, str]]],
+                       chunk_size: int = importer.CHUNK_SIZE) -> importer.ImportResult:
+    return await session.run_sync(importer.import_words, user_id, rows, chunk_size)
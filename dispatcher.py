@@ -0,0 +1,241 @@
+"""
+Параллельная обработка обновлений Telegram с сохранением порядка внутри чата.
+"""
+import asyncio
+import logging
+import queue
+import threading
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import telebot
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+_STOP = object()
+
+
+def update_chat_id(update: types.Update) -> int:
+    """
+    Возвращает идентификатор чата, к которому относится обновление.
+    Обновления без чата распределяются по их идентификатору.
+    :param update: Обновление Telegram.
+    :return: Ключ для выбора обработчика.
+    """
+    message = update.message or update.edited_message
+    if message is None and update.callback_query is not None:
+        message = update.callback_query.message
+    if message is not None:
+        return message.chat.id
+    return update.update_id
+
+
+class ChatDispatcher:
+    """
+    Пул потоков, в котором все обновления одного чата попадают в одну очередь и обрабатываются строго по порядку,
+    а обновления разных чатов обрабатываются параллельно. Очереди ограничены по размеру: при переполнении
+    submit блокирует поставщика обновлений, и опрос Telegram приостанавливается.
+    """
+
+    def __init__(self, handler: Callable[[types.Update], None], workers: int = 8, queue_size: int = 100) -> None:
+        """
+        :param handler: Функция обработки одного обновления.
+        :param workers: Количество рабочих потоков.
+        :param queue_size: Максимальная длина очереди одного потока.
+        """
+        self.handler = handler
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, args=(q,), name=f'dispatcher-{i}', daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def workers(self) -> int:
+        return len(self._queues)
+
+    def pending(self) -> int:
+        """
+        :return: Количество обновлений, ожидающих обработки.
+        """
+        return sum(q.qsize() for q in self._queues)
+
+    def submit(self, update: types.Update, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Ставит обновление в очередь потока, закрепленного за его чатом.
+        :param update: Обновление Telegram.
+        :param block: Ждать ли освобождения места в очереди.
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: True, если обновление принято; False, если очередь переполнена.
+        """
+        try:
+            self._queues[update_chat_id(update) % len(self._queues)].put(update, block, timeout)
+            return True
+        except queue.Full:
+            return False
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        Останавливает рабочие потоки после обработки уже принятых обновлений.
+        """
+        for q in self._queues:
+            q.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self, updates: queue.Queue) -> None:
+        while True:
+            update = updates.get()
+            if update is _STOP:
+                return
+            try:
+                self.handler(update)
+            except Exception:
+                logger.exception('Ошибка при обработке обновления %s', getattr(update, 'update_id', None))
+
+
+class AsyncChatDispatcher:
+    """
+    Асинхронный вариант ChatDispatcher: у каждого чата своя очередь, которую разбирает отдельная задача asyncio,
+    поэтому обновления одного чата обрабатываются строго по порядку, а разных чатов — параллельно.
+    Очередь чата и общее количество принятых, но не обработанных обновлений ограничены:
+    при переполнении submit возвращает False, и вебхук отвечает Telegram 503, а put ждет освобождения места.
+    """
+
+    def __init__(self, handler: Callable[[types.Update], Awaitable[None]], queue_size: int = 100,
+                 max_pending: int = 800) -> None:
+        """
+        :param handler: Корутина обработки одного обновления.
+        :param queue_size: Максимальная длина очереди одного чата.
+        :param max_pending: Максимальное количество обновлений в очередях всех чатов, включая обрабатываемые.
+        """
+        self.handler = handler
+        self.queue_size = queue_size
+        self.max_pending = max_pending
+        self._queues: Dict[int, Deque[types.Update]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._pending: int = 0
+        # Устанавливается после обработки каждого обновления: ожидающие места в очереди проверяют его снова
+        self._freed = asyncio.Event()
+
+    def pending(self) -> int:
+        """
+        :return: Количество обновлений, ожидающих обработки.
+        """
+        return self._pending
+
+    def submit(self, update: types.Update) -> bool:
+        """
+        Ставит обновление в очередь его чата; вызывается из цикла событий.
+        :param update: Обновление Telegram.
+        :return: True, если обновление принято; False, если очередь переполнена.
+        """
+        if self._pending >= self.max_pending:
+            return False
+        chat_id = update_chat_id(update)
+        updates = self._queues.get(chat_id)
+        if updates is None:
+            updates = self._queues[chat_id] = deque()
+            task = asyncio.create_task(self._work(chat_id, updates))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif len(updates) >= self.queue_size:
+            return False
+        updates.append(update)
+        self._pending += 1
+        return True
+
+    async def put(self, update: types.Update) -> None:
+        """
+        Ставит обновление в очередь его чата, дожидаясь освобождения места.
+        :param update: Обновление Telegram.
+        """
+        while not self.submit(update):
+            self._freed.clear()
+            await self._freed.wait()
+
+    async def wait_ready(self) -> None:
+        """
+        Дожидается, пока общее количество ожидающих обновлений станет меньше предела.
+        """
+        while self._pending >= self.max_pending:
+            self._freed.clear()
+            await self._freed.wait()
+
+    async def stop(self) -> None:
+        """
+        Прерывает обработку: отменяет задачи чатов и дожидается их завершения.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _work(self, chat_id: int, updates: Deque[types.Update]) -> None:
+        # Обновление остается в очереди до конца обработки, поэтому новые обновления чата встают за ним
+        while updates:
+            try:
+                await self.handler(updates[0])
+            except Exception:
+                logger.exception('Ошибка при обработке обновления %s', getattr(updates[0], 'update_id', None))
+            finally:
+                updates.popleft()
+                self._pending -= 1
+                self._freed.set()
+        del self._queues[chat_id]
+
+
+def attach(bot: telebot.TeleBot, workers: int = 8, queue_size: int = 100) -> ChatDispatcher:
+    """
+    Подключает диспетчер к боту: обновления, полученные опросом, распределяются по рабочим потокам.
+    Бот должен быть создан с threaded=False, чтобы обработчики выполнялись в потоке диспетчера.
+    :param bot: Экземпляр TeleBot.
+    :param workers: Количество рабочих потоков.
+    :param queue_size: Максимальная длина очереди одного потока.
+    :return: Диспетчер.
+    """
+    process_new_updates = bot.process_new_updates
+    dispatcher = ChatDispatcher(lambda update: process_new_updates([update]), workers, queue_size)
+
+    def dispatch(updates: List[types.Update]) -> None:
+        for update in updates:
+            # Смещение опроса сдвигается здесь, в потоке опроса, до передачи обновления в рабочий поток
+            if update.update_id > bot.last_update_id:
+                bot.last_update_id = update.update_id
+            dispatcher.submit(update)
+
+    bot.process_new_updates = dispatch
+    return dispatcher
+
+
+def attach_async(bot: AsyncTeleBot, queue_size: int = 100, max_pending: int = 800) -> AsyncChatDispatcher:
+    """
+    Подключает асинхронный диспетчер к опросу AsyncTeleBot. Без него бот обрабатывает все сообщения пачки
+    одновременно, и сообщения одного чата могут обогнать друг друга. Пока очереди заполнены, опрос приостанавливается.
+    :param bot: Экземпляр AsyncTeleBot.
+    :param queue_size: Максимальная длина очереди одного чата.
+    :param max_pending: Максимальное количество обновлений в очередях всех чатов.
+    :return: Диспетчер.
+    """
+    process_new_updates, get_updates = bot.process_new_updates, bot.get_updates
+    dispatcher = AsyncChatDispatcher(lambda update: process_new_updates([update]), queue_size, max_pending)
+    # Каждая пачка передается в отдельной задаче; блокировка ставит пачки в очереди в порядке получения
+    lock = asyncio.Lock()
+
+    async def wait_and_get_updates(*args, **kwargs) -> List[types.Update]:
+        await dispatcher.wait_ready()
+        return await get_updates(*args, **kwargs)
+
+    async def dispatch(updates: List[types.Update]) -> None:
+        async with lock:
+            for update in updates:
+                await dispatcher.put(update)
+
+    bot.get_updates = wait_and_get_updates
+    bot.process_new_updates = dispatch
+    return dispatcher
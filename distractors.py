@@ -0,0 +1,218 @@
+"""
+Индексы похожих слов для подбора неверных вариантов ответа.
+Индексы строятся по тем же пулам, что и WordSampler: общий набор слов и собственные слова каждого пользователя,
+поэтому все найденные слова уже входят в словарь пользователя.
+Слова пула раскладываются по корзинам с общим началом (две и три буквы), общим окончанием
+и одинаковой длиной с той же первой буквой. Похожие слова ищутся только в корзинах целевого слова
+и ранжируются по общим парам букв; результат для слова кэшируется до изменения одной из его корзин.
+"""
+import threading
+
+from typing import Collection, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from cache import LRUCache
+
+# Количество слов, просматриваемых в одной корзине: в больших корзинах — последние добавленные
+MAX_SCAN: int = 256
+# Длина списка похожих слов, хранимого для слова
+CANDIDATES: int = 16
+
+# Похожее слово: оценка похожести, идентификатор и текст
+Candidate = Tuple[float, int, str]
+
+
+def bucket_keys(text: str) -> Tuple[str, ...]:
+    """
+    :return: Ключи корзин слова: начало из двух и трех букв, окончание, длина с первой буквой.
+    """
+    text = text.lower()
+    return 'p' + text[:2], 'p' + text[:3], 's' + text[-3:], f'l{len(text)}{text[:1]}'
+
+
+def bigrams(text: str) -> FrozenSet[str]:
+    padded = f'^{text.lower()}$'
+    return frozenset(padded[i:i + 2] for i in range(len(padded) - 1))
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Похожесть написания двух слов: доля общих пар букв (коэффициент Дайса) с небольшим штрафом за разницу длины.
+    """
+    return _similarity(bigrams(a), len(a), b)
+
+
+def _similarity(first: FrozenSet[str], length: int, b: str) -> float:
+    second = bigrams(b)
+    return 2 * len(first & second) / (len(first) + len(second)) - 0.05 * abs(length - len(b))
+
+
+class DistractorIndex:
+    """
+    Индекс похожих слов одного пула.
+    """
+
+    def __init__(self, words: Iterable[Tuple[int, str]] = (), cache_size: int = 10_000) -> None:
+        """
+        :param words: Пары из идентификатора и текста слова.
+        :param cache_size: Максимальное количество слов с вычисленными списками похожих слов.
+        """
+        self._lock = threading.Lock()
+        self._texts: Dict[int, str] = {}
+        # Корзина — упорядоченное множество идентификаторов в порядке добавления
+        self._buckets: Dict[str, Dict[int, None]] = {}
+        # Номер изменения корзины, по которому проверяется актуальность вычисленных списков
+        self._versions: Dict[str, int] = {}
+        self._candidates: LRUCache[Tuple[Tuple[int, ...], List[Candidate]]] = LRUCache(maxsize=cache_size, ttl=None)
+        for word_id, text in words:
+            self._add(word_id, text)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def _bump(self, key: str) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _add(self, word_id: int, text: str) -> None:
+        if word_id in self._texts:
+            return
+        self._texts[word_id] = text
+        for key in bucket_keys(text):
+            self._buckets.setdefault(key, {})[word_id] = None
+            self._bump(key)
+
+    def add(self, words: Iterable[Tuple[int, str]]) -> None:
+        """
+        :param words: Пары из идентификатора и текста слова.
+        """
+        with self._lock:
+            for word_id, text in words:
+                self._add(word_id, text)
+
+    def remove(self, word_ids: Iterable[int]) -> None:
+        """
+        :param word_ids: Идентификаторы удаленных слов.
+        """
+        with self._lock:
+            for word_id in word_ids:
+                text = self._texts.pop(word_id, None)
+                if text is None:
+                    continue
+                for key in bucket_keys(text):
+                    bucket = self._buckets.get(key)
+                    if bucket is not None and word_id in bucket:
+                        del bucket[word_id]
+                        self._bump(key)
+
+    def candidates(self, text: str) -> List[Candidate]:
+        """
+        Возвращает до CANDIDATES самых похожих на text слов пула. Само слово в список не входит.
+        :param text: Текст целевого слова; само слово может и не входить в пул.
+        :return: Похожие слова от самого похожего.
+        """
+        lowered = text.lower()
+        keys = bucket_keys(lowered)
+        with self._lock:
+            versions = tuple(self._versions.get(key, 0) for key in keys)
+            cached = self._candidates.get(lowered)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+            pairs = bigrams(lowered)
+            scored: Dict[int, Candidate] = {}
+            for key in keys:
+                bucket = self._buckets.get(key, {})
+                for n, other in enumerate(reversed(bucket)):
+                    if n == MAX_SCAN:
+                        break
+                    other_text = self._texts[other]
+                    if other not in scored and other_text.lower() != lowered:
+                        scored[other] = (_similarity(pairs, len(lowered), other_text), other, other_text)
+            candidates = sorted(scored.values(), reverse=True)[:CANDIDATES]
+            self._candidates.set(lowered, (versions, candidates))
+            return candidates
+
+
+class DistractorPools:
+    """
+    Индексы похожих слов по пулам WordSampler: общий набор и собственные слова пользователей.
+    Индексы заполняются вместе с пулами в load_word_pools и поддерживаются функциями add_word/delete_words;
+    индексы давно не обращавшихся пользователей вытесняются.
+    """
+
+    def __init__(self, max_users: int = 10_000) -> None:
+        """
+        :param max_users: Максимальное количество индексов пользователей в памяти.
+        """
+        self._lock = threading.Lock()
+        self._shared: Optional[DistractorIndex] = None
+        self._users: LRUCache[DistractorIndex] = LRUCache(maxsize=max_users, ttl=None)
+
+    def has_shared(self) -> bool:
+        return self._shared is not None
+
+    def has_user(self, user: int) -> bool:
+        return self._users.get(user) is not None
+
+    def load_shared(self, words: Iterable[Tuple[int, str]]) -> None:
+        """
+        :param words: Пары из идентификатора и текста слов общего набора.
+        """
+        index = DistractorIndex(words, cache_size=100_000)
+        with self._lock:
+            self._shared = index
+
+    def load_user(self, user: int, words: Iterable[Tuple[int, str]]) -> None:
+        """
+        :param user: Идентификатор пользователя.
+        :param words: Пары из идентификатора и текста слов пользователя.
+        """
+        self._users.set(user, DistractorIndex(words, cache_size=1_000))
+
+    def add(self, user: int, words: Iterable[Tuple[int, str]]) -> None:
+        """
+        Добавляет слова в индекс пользователя, если он уже загружен.
+        """
+        index = self._users.get(user)
+        if index is not None:
+            index.add(words)
+
+    def remove(self, user: int, word_ids: Iterable[int]) -> None:
+        """
+        Удаляет слова из индекса пользователя, если он загружен.
+        """
+        index = self._users.get(user)
+        if index is not None:
+            index.remove(word_ids)
+
+    def invalidate(self, user: Optional[int] = None) -> None:
+        """
+        Сбрасывает индекс пользователя, либо все индексы, если пользователь не указан.
+        """
+        with self._lock:
+            if user is None:
+                self._shared = None
+                self._users.clear()
+            else:
+                self._users.pop(user)
+
+    def similar(self, user: int, text: str, k: int, exclude: Collection[int] = ()) -> List[str]:
+        """
+        Подбирает до k слов из словаря пользователя, похожих на указанное.
+        :param user: Идентификатор пользователя.
+        :param text: Текст целевого слова.
+        :param k: Количество слов.
+        :param exclude: Идентификаторы слов, которые не должны попасть в выборку.
+        :return: Тексты похожих слов от самого похожего.
+        """
+        with self._lock:
+            indexes = [index for index in (self._shared, self._users.get(user)) if index is not None]
+        scored = sorted((candidate for index in indexes for candidate in index.candidates(text)), reverse=True)
+        result: List[str] = []
+        seen = {text.lower()}
+        for _, word_id, other in scored:
+            if word_id in exclude or other.lower() in seen:
+                continue
+            seen.add(other.lower())
+            result.append(other)
+            if len(result) == k:
+                break
+        return result
@@ -0,0 +1,131 @@
+import csv
+
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from db import (INITIAL_USER_ID, Words, UserWord, change_word_count, dialect_insert, refresh_word_counts,
+                session_caches, touch_words)
+
+CHUNK_SIZE: int = 1000
+MAX_WORD_LENGTH: int = 50
+
+
+class ImportResult(NamedTuple):
+    """
+    Итоги загрузки словаря.
+    """
+    rows: int
+    words_added: int
+    links_added: int
+    skipped: int
+
+
+def detect_delimiter(line: str) -> str:
+    """
+    Определяет разделитель столбцов по первой строке файла.
+    :param line: Первая строка файла.
+    :return: Символ разделителя.
+    """
+    for delimiter in ('\t', ';', ','):
+        if delimiter in line:
+            return delimiter
+    return ','
+
+
+def parse_rows(lines: Iterable[str], delimiter: Optional[str] = None) -> Iterator[Optional[Tuple[str, str]]]:
+    """
+    Построчно разбирает CSV/TSV файл с парами слово-перевод.
+    :param lines: Строки файла.
+    :param delimiter: Разделитель столбцов, по умолчанию определяется по первой строке.
+    :return: Пары слово-перевод; None для строк, которые не удалось разобрать.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    if delimiter is None:
+        delimiter = detect_delimiter(first)
+    for row in csv.reader(chain([first], lines), delimiter=delimiter):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if len(row) < 2:
+            yield None
+            continue
+        word, translate = row[0].strip().lower(), row[1].strip().lower()
+        if not word or not translate or len(word) > MAX_WORD_LENGTH or len(translate) > MAX_WORD_LENGTH:
+            yield None
+            continue
+        yield word, translate
+
+
+def import_words(session: Session, user_id: int, rows: Iterable[Optional[Tuple[str, str]]],
+                 chunk_size: int = CHUNK_SIZE) -> ImportResult:
+    """
+    Загружает пары слово-перевод пачками через INSERT ... ON CONFLICT в одной транзакции.
+    Уже существующие слова не перезаписываются, а только привязываются к пользователю.
+    :param session: Сессия SQLAlchemy.
+    :param user_id: Идентификатор пользователя, к которому привязываются слова.
+    :param rows: Пары слово-перевод, None обозначает ошибочную строку.
+    :param chunk_size: Количество строк в одной пачке.
+    :return: Итоги загрузки.
+    """
+    # Одна и та же конструкция для всех пачек: SQLAlchemy компилирует её один раз
+    # и выполняет как executemany с RETURNING, чтобы посчитать реально вставленные строки
+    words_insert = (dialect_insert(session, Words.__table__)
+                    .on_conflict_do_nothing(index_elements=['target_word'])
+                    .returning(Words.__table__.c.id))
+    # Идентификаторы слов пачки берутся через ON CONFLICT DO UPDATE: строки блокируются до фиксации вместе со связями,
+    # и collect_orphan_words не удалит слово между его поиском и привязкой
+    words_lock = dialect_insert(session, Words.__table__)
+    words_lock = (words_lock.on_conflict_do_update(index_elements=['target_word'],
+                                                   set_={'target_word': words_lock.excluded.target_word})
+                  .returning(Words.__table__.c.id))
+    links_insert = (dialect_insert(session, UserWord.__table__)
+                    .on_conflict_do_nothing(index_elements=['user_id', 'word_id'])
+                    .returning(UserWord.__table__.c.word_id))
+    total = words_added = links_added = skipped = 0
+    rows = iter(rows)
+    try:
+        while True:
+            chunk: List[Optional[Tuple[str, str]]] = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            total += len(chunk)
+            pairs = {}
+            for row in chunk:
+                if row is None or row[0] in pairs:
+                    skipped += 1
+                else:
+                    pairs[row[0]] = row[1]
+            if not pairs:
+                continue
+
+            connection = session.connection()
+            added = connection.execute(
+                words_insert, [{'target_word': word, 'translate': translate} for word, translate in pairs.items()]
+            ).all()
+            words_added += len(added)
+
+            ids = connection.execute(
+                words_lock, [{'target_word': word, 'translate': translate} for word, translate in pairs.items()]
+            ).scalars().all()
+            linked = connection.execute(links_insert, [{'user_id': user_id, 'word_id': word_id} for word_id in ids]).all()
+            links_added += len(linked)
+            if user_id != INITIAL_USER_ID:
+                change_word_count(session, user_id, [row.word_id for row in linked], 1)
+        if user_id == INITIAL_USER_ID and links_added:
+            # Изменился общий набор: счетчики всех пользователей пересчитываются один раз в конце
+            refresh_word_counts(session)
+            touch_words(session, INITIAL_USER_ID)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        # Изменение общего набора затрагивает пулы и заранее собранные карточки всех пользователей
+        caches = session_caches(session)
+        caches.sampler.invalidate(None if user_id == INITIAL_USER_ID else user_id)
+        caches.distractors.invalidate(None if user_id == INITIAL_USER_ID else user_id)
+    return ImportResult(total, words_added, links_added, skipped)
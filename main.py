@@ -1,276 +1,411 @@
-import random
+"""
+Бот для изучения английских слов: фабрика приложения create_app и точка входа.
+Импорт модуля ничего не создает и не подключается к внешним сервисам: движок базы данных, бот и фоновые потоки
+создаются при первом обращении к ним, а прием обновлений запускает BotApp.run().
+"""
+import io
 import telebot
 import sqlalchemy
 import logging
+import signal
+import sys
+import threading
+import time
 
-from typing import List, Dict, Set
+from types import ModuleType
+from typing import Collection, List, Optional
 from sqlalchemy.orm import sessionmaker, Session as DBSession
-from sqlalchemy import and_
-from telebot import types, custom_filters, StateMemoryStorage
-from telebot.states import StatesGroup, State
-from config import *
+from telebot import types, custom_filters, apihelper, StateMemoryStorage
+from telebot.storage import StateStorageBase
+import settings
 from db import *
+from ui import *
+from cache import lazy_property
+from chat_state import ChatStateStore
+from dispatcher import ChatDispatcher, attach
+from metrics import Gauge, instrument, instrument_engine, start_http_server, timed_send
+from answer_log import AnswerLog
+from outbox import Outbox
+from prefetch import CardPrefetcher
+from state_storage import StateDBStorage
+from scheduler import attempt_grade
+from importer import import_words, parse_rows
 
-# Инициализация базы данных и бота
-DSN: str = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine: sqlalchemy.engine.Engine = sqlalchemy.create_engine(DSN)
-Session: sessionmaker  = sessionmaker(bind=engine)
-
-logging.basicConfig(level=logging.INFO)
 logger: logging.Logger = logging.getLogger("__BOT__")
 
-logger.info('Start telegram bot...')
-
-state_storage: StateMemoryStorage = StateMemoryStorage()
-bot: telebot.TeleBot = telebot.TeleBot(TG_TOKEN, state_storage=state_storage)
-
-known_users: Set[int] = set()
-userStep: Dict[int, int] = {}
-buttons: List[types.KeyboardButton] = []
-word_list: List[str] = []
-
 
-def show_hint(*lines: str) -> str:
+class BotApp:
     """
-    Функция для отображения подсказки пользовтелю
-    :param lines: Произвольное количество строк, которые будут объединены в одну подсказку.
-    :return: Объединненая строка подсказки
-    """
-    return '\n'.join(lines)
-
-
-def show_target(data: Dict[str, str]) -> str:
+    Приложение бота: обработчики сообщений и компоненты, которые они используют.
+    Несколько процессов могут выполнять один и тот же код обработчиков: каждый процесс вызывает create_app
+    и при первом обращении создает собственные движок с пулом соединений, бота и фоновые потоки.
     """
-    Функция для отображения целевого слова и его перевода.
-    :param data: Словарь содержащий целевое слово и его перевод
-    :return: Строка с целевым словом и переводом
-    """
-    return f"{data['target_word']} -> {data['translate_word']}"
-
-
-class Command:
-    """
-    Класс, содержащий команды для взаимодействия с пользователем
-    """
-    ADD_WORD: str = 'Добавить слово ➕'
-    DELETE_WORD: str = 'Удалить слово🔙'
-    NEXT: str = 'Дальше ⏭'
-
-
-class MyStates(StatesGroup):
-    """
-    Класс для упарвления состоянием бота
-    """
-    target_word: State  = State()
-    translate_word: State  = State()
-    another_words: State  = State()
-
-
-def get_user_step(uid: int) -> int:
-    """
-    Функция для получения текущего шага пользователя.
-    :param uid: Уникальный идентификатор пользователя.
-    :return: Текущий шаг пользователя
-    """
-    if uid not in known_users:
-        known_users.add(uid)
-        userStep[uid] = 0
-        logger.info(f"New user detected: {uid}")
-    return userStep.get(uid, 0)
-
-
-def create_markup(buttons: List[types.KeyboardButton]) -> types.ReplyKeyboardMarkup:
-    """
-    Функция для создания клавиатуры с кнопками.
-    :param buttons: Список кнопок клавиатуры
-    :return:Клавиатура
-    """
-    markup: types.ReplyKeyboardMarkup = types.ReplyKeyboardMarkup(row_width=2)
-    markup.add(*buttons)
-    return markup
-
 
-def initialize_user(session: DBSession, username: str) -> None:
-    """
-    Функция для добавления нового пользователя в базу данных
-    :param session: Сессия базы данных.
-    :param username: Имя пользователя.
-    """
-    if check_user_exist(session, username):
-        add_user(session, username)
+    def __init__(self, config: ModuleType) -> None:
+        """
+        :param config: Настройки: модуль settings или результат settings.load_config.
+        """
+        self.config = config
+        self._lock = threading.RLock()
+        self.chats: ChatStateStore = ChatStateStore(max_chats=100_000, idle_ttl=24 * 3600)
+        # Пулы слов и кэш пользователей принадлежат приложению и передаются функциям db через сессию
+        self.caches: Caches = Caches(pool_ttl=config.WORD_POOL_TTL)
 
+    def created(self, name: str) -> bool:
+        """
+        :return: True, если компонент с указанным именем уже создан.
+        """
+        return name in self.__dict__
+
+    @lazy_property
+    def engine(self) -> sqlalchemy.engine.Engine:
+        engine = sqlalchemy.create_engine(self.config.DSN, **self.config.engine_options(self.config.DSN))
+        instrument_engine(engine, self.config.SLOW_QUERY_MS / 1000)
+        return engine
+
+    @lazy_property
+    def Session(self) -> sessionmaker:
+        return sessionmaker(bind=self.engine, info={'caches': self.caches})
+
+    @lazy_property
+    def state_storage(self) -> StateStorageBase:
+        # Состояния диалогов переживают перезапуск: они читаются из кэша и пачками записываются в таблицу bot_states
+        if self.config.BOT_STATE_STORAGE == 'db':
+            return StateDBStorage(self.engine, flush_interval=self.config.STATE_FLUSH_INTERVAL)
+        return StateMemoryStorage()
+
+    @lazy_property
+    def bot(self) -> telebot.TeleBot:
+        if self.config.TG_API_URL:
+            apihelper.API_URL = self.config.TG_API_URL
+        # Обработчики выполняются в потоках диспетчера, который сохраняет порядок сообщений внутри чата
+        bot = telebot.TeleBot(self.config.TG_TOKEN, state_storage=self.state_storage, threaded=False)
+        self.register_handlers(bot)
+        return bot
+
+    @lazy_property
+    def outbox(self) -> Outbox:
+        # Ответы отправляются фоновыми потоками с соблюдением лимитов Telegram, подряд идущие тексты склеиваются
+        return Outbox(timed_send(self.bot.send_message), global_rate=self.config.OUTBOX_GLOBAL_RATE,
+                      chat_rate=self.config.OUTBOX_CHAT_RATE, chat_burst=self.config.OUTBOX_CHAT_BURST,
+                      senders=self.config.OUTBOX_SENDERS)
+
+    @lazy_property
+    def answer_log(self) -> AnswerLog:
+        # Ответы пользователей копятся в памяти и записываются в историю пачками в фоновом потоке
+        return AnswerLog(self.engine, batch_size=self.config.ANSWER_FLUSH_SIZE,
+                         flush_interval=self.config.ANSWER_FLUSH_INTERVAL)
+
+    @lazy_property
+    def prefetcher(self) -> CardPrefetcher:
+        # Следующие карточки собираются в фоне, пока пользователь отвечает на текущую
+        return CardPrefetcher(self.caches.sampler.version, depth=self.config.PREFETCH_DEPTH, max_age=self.config.PREFETCH_MAX_AGE)
+
+    def register_handlers(self, bot: telebot.TeleBot) -> None:
+        """
+        Регистрирует обработчики сообщений. Порядок важен: последний обработчик принимает любой текст.
+        :param bot: Бот, которому передаются обработчики.
+        """
+        bot.register_message_handler(self.create_cards, commands=['cards', 'start'])
+        bot.register_message_handler(self.next_cards, func=lambda message: message.text == Command.NEXT)
+        bot.register_message_handler(self.handle_delete_word, func=lambda message: message.text == Command.DELETE_WORD)
+        bot.register_message_handler(self.handle_add_word, func=lambda message: message.text == Command.ADD_WORD)
+        bot.register_message_handler(self.handle_import, content_types=['document'])
+        bot.register_message_handler(self.help_command, commands=['help'])
+        bot.register_message_handler(self.stats_command, commands=['stats'])
+        bot.register_message_handler(self.message_reply, func=lambda message: True, content_types=['text'])
+        bot.add_custom_filter(custom_filters.StateFilter(bot))
+
+    def initialize_user(self, session: DBSession, username: str) -> int:
+        """
+        Функция для получения идентификатора пользователя с добавлением нового пользователя в базу данных.
+        Идентификатор берется из кэша, а при промахе пользователь добавляется или находится одним запросом.
+        :param session: Сессия базы данных.
+        :param username: Имя пользователя.
+        :return: Идентификатор пользователя
+        """
+        user_id = self.caches.user_ids.get(username)
+        if user_id is None:
+            user_id = upsert_user(session, username)
+        return user_id
 
-@bot.message_handler(commands=['cards', 'start'])
-def create_cards(message: types.Message) -> None:
-    """
-    Обработчик команд: /cards или /start
-    """
-    create_table(engine)
-    with Session() as session:
-        db_init(session)
-        initialize_user(session, message.from_user.username)
+    def prefetch_card(self, user_id: int, exclude: Collection[int]) -> Optional[Card]:
+        """
+        Собирает карточку в фоновом потоке сборки.
+        :param user_id: Идентификатор пользователя.
+        :param exclude: Идентификаторы слов, которые не должны попасть в карточку.
+        """
+        with self.Session() as session:
+            return build_card(session, user_id, exclude)
 
-    cid: int = message.chat.id
-    if cid not in known_users:
-        known_users.add(cid)
-        userStep[cid] = 0
-        bot.send_message(cid, f"Hello, {message.from_user.username}, let study English...")
+    def collect_garbage(self) -> None:
+        """
+        Периодически удаляет слова, на которые больше не ссылается ни один пользователь. Выполняется в фоновом потоке.
+        """
+        while True:
+            time.sleep(self.config.WORD_GC_INTERVAL)
+            try:
+                with self.Session() as session:
+                    removed = collect_orphan_words(session, self.config.WORD_GC_BATCH)
+                if removed:
+                    logger.info('Удалено слов без ссылок: %s', removed)
+            except Exception:
+                logger.exception('Не удалось удалить слова без ссылок')
+
+    @instrument
+    def create_cards(self, message: types.Message) -> None:
+        """
+        Обработчик команд: /cards или /start
+        """
+        with self.Session() as session:
+            self.initialize_user(session, message.from_user.username)
 
-    update_buttons(message)
+        cid: int = message.chat.id
+        state, created = self.chats.get(cid)
+        if created:
+            self.outbox.send_message(cid, f"Hello, {message.from_user.username}, let study English...")
 
-def update_buttons(message: types.Message) -> None:
-    """
-    Функция для обновления кнопок с новыми словами.
-    """
-    global buttons
-    with Session() as session:
-        target_word, translate = get_random_word_pair(session, message.from_user.username, word_list)
-        word_list.append(target_word)
-        others = get_random_words(session, target_word, message.from_user.username, word_list)
-
-    buttons = [types.KeyboardButton(target_word.capitalize())]
-    buttons.extend([types.KeyboardButton(word.capitalize()) for word in others])
-    random.shuffle(buttons)
-    buttons.extend([types.KeyboardButton(Command.NEXT),
-                    types.KeyboardButton(Command.ADD_WORD),
-                    types.KeyboardButton(Command.DELETE_WORD)])
-
-    greeting = f"Выбери перевод слова:\n🇷🇺 {translate.capitalize()}"
-    bot.send_message(message.chat.id, greeting, reply_markup=create_markup(buttons))
-    bot.set_state(message.from_user.id, MyStates.target_word, message.chat.id)
-    with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
-        data['target_word'] = target_word.capitalize()
-        data['translate_word'] = translate.capitalize()
-        data['other_words'] = others.capitalize()
-
-
-@bot.message_handler(func=lambda message: message.text == Command.NEXT)
-def next_cards(message: types.Message) -> None:
-    """
-    Обработчик команды "Дальше ⏭"
-    """
-    word_list.pop(0) if len(word_list) > 4 else None
-    update_buttons(message)
+        self.update_buttons(message)
 
+    def update_buttons(self, message: types.Message) -> None:
+        """
+        Функция для обновления кнопок с новыми словами.
+        """
+        state, _ = self.chats.get(message.chat.id)
+        recent = state.recent_ids()
+        with self.Session() as session:
+            user_id = self.initialize_user(session, message.from_user.username)
+            card = self.prefetcher.take(user_id, recent) or build_card(session, user_id, recent)
+        word_id, target_word, translate, others = card
+        state.push_recent(word_id)
+
+        state.set_card(word_id, target_word.capitalize(), translate.capitalize(), card_options(target_word, others))
+
+        greeting = f"Выбери перевод слова:\n🇷🇺 {translate.capitalize()}"
+        self.outbox.send_message(message.chat.id, greeting, reply_markup=create_markup(card_buttons(state)))
+        self.bot.set_state(message.from_user.id, MyStates.target_word, message.chat.id)
+        with self.bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['word_id'] = word_id
+            data['target_word'] = target_word.capitalize()
+            data['translate_word'] = translate.capitalize()
+            # Перемешанные варианты сохраняются как есть, чтобы восстановленная карточка показала те же кнопки
+            data['card_options'] = list(state.buttons)
+        if self.prefetcher.depth:
+            self.prefetcher.schedule(user_id, state.recent_ids(), self.prefetch_card)
+
+    @instrument
+    def next_cards(self, message: types.Message) -> None:
+        """
+        Обработчик команды "Дальше ⏭"
+        """
+        self.update_buttons(message)
 
-@bot.message_handler(func=lambda message: message.text == Command.DELETE_WORD)
-def handle_delete_word(message: types.Message) -> None:
-    """
-    Обработчик команды "Удалить слово🔙". Запрашивает у пользователя слово которое планируем удалить.
-    """
-    bot.send_message(message.chat.id, f'{message.from_user.username}, введите слово которое хотите удалить')
-    bot.register_next_step_handler(message, process_delete_word)
+    @instrument
+    def handle_delete_word(self, message: types.Message) -> None:
+        """
+        Обработчик команды "Удалить слово🔙". Запрашивает у пользователя слово которое планируем удалить.
+        """
+        self.outbox.send_message(message.chat.id, f'{message.from_user.username}, введите слово которое хотите удалить '
+                                                  f'(или несколько слов через пробел)')
+        self.bot.register_next_step_handler(message, self.process_delete_word)
 
-def process_delete_word(message: types.Message) -> None:
-    """
-    Функция для обработки удаления слова
-    :param message: Сообщение пользователя, содержащее слово для удаления
-    """
-    try:
-        incoming_word: List[str] = message.text.strip().lower().split()
-        if len(incoming_word) != 1:
-            raise ValueError
-        word: str = incoming_word[0]
-        logger.info(word)
-        with Session() as session:
-            if session.query(Words).join(UserWord).join(Users).filter(and_(Words.target_word==word,Users.name==message.chat.username)).first():
-                delete_word(session, word, message.chat.username)
-                bot.send_message(message.chat.id, f'Слово <{word.capitalize()}> удалено!')
-            else:
-                bot.send_message(message.chat.id, f'{message.from_user.username}, нет такого слова в вашем словаре!!!')
-        update_buttons(message)
-    except ValueError:
-        bot.send_message(message.chat.id,f'Произошла ошибка!\n, Повторите ввод, указав слово которое хотите удалить.')
-        bot.register_next_step_handler(message, process_delete_word)
+    @instrument
+    def process_delete_word(self, message: types.Message) -> None:
+        """
+        Функция для обработки удаления слов
+        :param message: Сообщение пользователя, содержащее слово или несколько слов для удаления
+        """
+        try:
+            words: List[str] = split_words(message.text)
+            if not words:
+                raise ValueError
+            logger.info(words)
+            with self.Session() as session:
+                user_id = self.initialize_user(session, message.from_user.username)
+                deleted = delete_words(session, words, user_id)
+            missing = [word for word in words if word not in deleted]
+            self.outbox.send_message(message.chat.id, show_deleted(message.from_user.username, deleted, missing))
+            self.update_buttons(message)
+        except ValueError:
+            self.outbox.send_message(message.chat.id,f'Произошла ошибка!\n, Повторите ввод, указав слово которое хотите удалить.')
+            self.bot.register_next_step_handler(message, self.process_delete_word)
+
+    @instrument
+    def handle_add_word(self, message: types.Message) -> None:
+        """
+        Обработчик команды "Добавить слово ➕". Запрашивает у пользователя слово и его перевод.G
+        """
+        self.outbox.send_message(message.chat.id, f'{message.from_user.username}, введите слово и его перевод')
+        self.bot.register_next_step_handler(message, self.process_add_word)
 
+    @instrument
+    def process_add_word(self, message: types.Message) -> None:
+        """
+        Функция для обработки добавления пары слово-перевод
+        """
+        try:
+            income_words = message.text.strip().lower().split(' ', 1)
+            if len(income_words) != 2:
+                raise ValueError
+            word, translate= income_words
+            with self.Session() as session:
+                user_id = self.initialize_user(session, message.from_user.username)
+                result = add_word(session, word, translate, user_id)
+                if result is None:
+                    self.outbox.send_message(message.chat.id, f'Не удалось добавить слово <{word.capitalize()}>, попробуйте ещё раз.')
+                else:
+                    count, status = result
+                    if status:
+                        self.outbox.send_message(message.chat.id, f'Слово <{word.capitalize()}> и его перевод <{translate.capitalize()}> добавлены!')
+                        self.outbox.send_message(message.chat.id, f'Количество изучаемых пользователем слов: {count}')
+                    else:
+                        self.outbox.send_message(message.chat.id, f'Слово <{word.capitalize()}> уже есть!')
+            self.update_buttons(message)
+        except ValueError:
+            self.outbox.send_message(message.chat.id, f'Произошла ошибка!\n Повторите ввод, указав слово и его перевод снова через пробел.')
+            self.bot.register_next_step_handler(message, self.process_add_word)
+
+    @instrument
+    def handle_import(self, message: types.Message) -> None:
+        """
+        Обработчик загрузки словаря из CSV/TSV файла с парами слово-перевод.
+        """
+        document: types.Document = message.document
+        if not (document.file_name or '').lower().endswith(IMPORT_EXTENSIONS):
+            self.outbox.send_message(message.chat.id, f'Поддерживаются только файлы {", ".join(IMPORT_EXTENSIONS)}')
+            return
+        if document.file_size and document.file_size > IMPORT_MAX_SIZE:
+            self.outbox.send_message(message.chat.id, f'Файл слишком большой, максимум {IMPORT_MAX_SIZE // 2 ** 20} МБ')
+            return
+        content: bytes = self.bot.download_file(self.bot.get_file(document.file_id).file_path)
+        lines = io.StringIO(content.decode('utf-8-sig', errors='replace'), newline='')
+        with self.Session() as session:
+            user_id = self.initialize_user(session, message.from_user.username)
+            result = import_words(session, user_id, parse_rows(lines))
+            count = count_user_word(session, user_id)
+        self.outbox.send_message(message.chat.id, show_hint(f'Загружено строк: {result.rows}',
+                                                         f'Добавлено в словарь: {result.links_added}',
+                                                         f'Пропущено: {result.skipped}',
+                                                         f'Количество изучаемых пользователем слов: {count}'))
+        self.update_buttons(message)
+
+    @instrument
+    def help_command(self, message: types.Message) -> None:
+        """
+        Обработчик команды /help. Выводит справку по работе бота
+        """
+        self.outbox.send_message(message.chat.id, HELP_TEXT, parse_mode="Markdown")
+        self.update_buttons(message)
 
-@bot.message_handler(func=lambda message: message.text == Command.ADD_WORD)
-def handle_add_word(message: types.Message) -> None:
-    """
-    Обработчик команды "Добавить слово ➕". Запрашивает у пользователя слово и его перевод.G
-    """
-    bot.send_message(message.chat.id, f'{message.from_user.username}, введите слово и его перевод')
-    bot.register_next_step_handler(message, process_add_word)
+    @instrument
+    def stats_command(self, message: types.Message) -> None:
+        """
+        Обработчик команды /stats. Выводит статистику ответов и самые трудные слова
+        """
+        with self.Session() as session:
+            user_id = self.initialize_user(session, message.from_user.username)
+            hardest = hardest_words(session, user_id)
+        self.outbox.send_message(message.chat.id, show_stats(self.answer_log.stats(user_id), hardest))
 
-def process_add_word(message: types.Message) -> None:
-    """
-    Функция для обработки добавления пары слово-перевод
-    """
-    try:
-        income_words = message.text.strip().lower().split(' ', 1)
-        if len(income_words) != 2:
-            raise ValueError
-        word, translate= income_words
-        with Session() as session:
-            count, status = add_word(session, word, translate, message.from_user.username)
-            if status:
-                bot.send_message(message.chat.id, f'Слово <{word.capitalize()}> и его перевод <{translate.capitalize()}> добавлены!')
-                bot.send_message(message.chat.id, f'Количество изучаемых пользователем слов: {count}')
+    @instrument
+    def message_reply(self, message: types.Message) -> None:
+        """
+        Обработчик текстовых сообщений от пользователя. Проверяет правильность перевода слова.
+        """
+        text: str = message.text
+        valid: bool = False
+        state, _ = self.chats.get(message.chat.id)
+        if state.target_word is None:
+            # Состояние чата было вытеснено: восстанавливаем карточку из хранилища состояний бота
+            with self.bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+                state.set_card(data.get('word_id'), data['target_word'], data['translate_word'],
+                               tuple(data.get('card_options')
+                                     or card_options(data['target_word'], data.get('other_words', []))))
+        if text == state.target_word:
+            hint: str = show_target({'target_word': state.target_word, 'translate_word': state.translate})
+            hint_text: List[str] = ["Отлично!❤", hint]
+            hint: str = show_hint(*hint_text)
+            valid = True
+        else:
+            state.mark_wrong(text)
+            hint: str = show_hint("Допущена ошибка!", f"Попробуй ещё раз вспомнить слово 🇷🇺{state.translate.capitalize()}")
+        if state.word_id is not None:
+            quality = attempt_grade(valid, state.mistakes)
+            with self.Session() as session:
+                user_id = self.initialize_user(session, message.from_user.username)
+                self.answer_log.record(user_id, state.word_id, valid)
+                if quality is not None:
+                    record_answer(session, user_id, state.word_id, quality)
+        self.outbox.send_message(message.chat.id, hint, reply_markup=create_markup(card_buttons(state)))
+        if valid:
+            self.next_cards(message)
+
+    def run(self) -> None:
+        """
+        Подготавливает базу данных и запускает прием обновлений: опрос Telegram или вебхук.
+        Блокирует поток до остановки бота, после чего записывает состояния, ответы и очередь сообщений.
+        """
+        config = self.config
+        if config.BOT_MODE == 'async':
+            import async_main
+            async_main.create_app(config).run()
+            return
+        logger.info('Start telegram bot...')
+        bootstrap(self.engine, self.caches)
+        # Компоненты создаются до запуска потоков обработки
+        bot, outbox, answer_log = self.bot, self.outbox, self.answer_log
+        if config.BOT_TRANSPORT == 'webhook':
+            dispatcher = ChatDispatcher(lambda update: bot.process_new_updates([update]), config.BOT_WORKERS,
+                                        config.BOT_QUEUE_SIZE)
+        else:
+            dispatcher = attach(bot, workers=config.BOT_WORKERS, queue_size=config.BOT_QUEUE_SIZE)
+        Gauge('bot_outbox_depth', 'Сообщений в очереди отправки', lambda: outbox.stats()['depth'])
+        Gauge('bot_answer_log_pending', 'Ответов, ожидающих записи в историю', answer_log.pending)
+        Gauge('bot_dispatcher_pending', 'Обновлений в очередях обработки', dispatcher.pending)
+        if config.METRICS_PORT:
+            start_http_server(config.METRICS_PORT, config.METRICS_HOST)
+        if config.WORD_GC_INTERVAL:
+            threading.Thread(target=self.collect_garbage, name='word-gc', daemon=True).start()
+        try:
+            if config.BOT_TRANSPORT == 'webhook':
+                import webhook
+                # Обновление ставится в очередь без ожидания: при переполнении Telegram получит 503 и повторит доставку
+                webhook.serve(bot, lambda update: dispatcher.submit(update, block=False), config.WEBHOOK_HOST,
+                              config.WEBHOOK_PORT, config.WEBHOOK_PATH,
+                              webhook.resolve_secret(config.WEBHOOK_SECRET, config.WEBHOOK_URL), config.WEBHOOK_URL)
             else:
-                bot.send_message(message.chat.id, f'Слово <{word.capitalize()}> уже есть!')
-        update_buttons(message)
-    except ValueError:
-        bot.send_message(message.chat.id, f'Произошла ошибка!\n Повторите ввод, указав слово и его перевод снова через пробел.')
-        bot.register_next_step_handler(message, process_add_word)
-
-
-@bot.message_handler(commands=['help'])
-def help_command(message: types.Message) -> None:
-    """
-    Обработчик команды /help. Выводит справку по работе бота
-    """
-    help_text: str = """
-        🤖 **Описание программы:**
-        Этот бот помогает вам учить английские слова. Вы можете добавлять новые слова, удалять их и тренироваться в запоминании.
-
-        🛠 **Доступные команды:**
-        /start или /cards - Начать изучение слов.
-        /help - Показать это сообщение с инструкцией.
-
-        🎮 **Как пользоваться:**
-        1. Бот покажет вам слово на русском языке и несколько вариантов перевода на английский.
-        2. Выберите правильный перевод слова.
-        3. Если вы ошиблись, бот подскажет что перевод выбран неверно. Попробуйте еще раз.
-        4. Используйте кнопку "Дальше ⏭", чтобы перейти к следующему слову.
-
-        ➕ **Добавление слов:**
-        - Нажмите кнопку "Добавить слово ➕".
-        - Введите слово и его перевод через пробел (например, "cat кот").
-
-        🔙 **Удаление слов:**
-        - Нажмите кнопку "Удалить слово🔙".
-        - Введите слово, которое хотите удалить.
+                bot.infinity_polling(skip_pending=True)
+        finally:
+            dispatcher.stop()
+            self.close()
 
+    def close(self) -> None:
         """
-    bot.send_message(message.chat.id, help_text, parse_mode="Markdown")
-    update_buttons(message)
+        Останавливает созданные фоновые компоненты: сборку карточек, очередь сообщений,
+        запись истории ответов и состояний.
+        """
+        if self.created('prefetcher'):
+            self.prefetcher.stop()
+        if self.created('outbox'):
+            self.outbox.stop()
+        if self.created('answer_log'):
+            self.answer_log.close()
+        if self.created('state_storage') and isinstance(self.state_storage, StateDBStorage):
+            self.state_storage.close()
 
 
-@bot.message_handler(func=lambda message: True, content_types=['text'])
-def message_reply(message: types.Message) -> None:
+def create_app(config: ModuleType = settings) -> BotApp:
     """
-    Обработчик текстовых сообщений от пользователя. Проверяет правильность перевода слова.
+    Создает приложение бота. Ни движок базы данных, ни бот при этом не создаются, поэтому вызов
+    не обращается к базе данных и Telegram и подходит для тестов, замеров и рабочих процессов.
+    :param config: Настройки: модуль settings (окружение и файл BOT_CONFIG или config.py) или settings.load_config.
+    :return: Приложение; прием обновлений запускается методом run.
     """
-    text: str = message.text
-    valid: bool = False
-    with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
-        target_word: str = data['target_word']
-        if text == target_word:
-            hint: str = show_target(data)
-            hint_text: List[str] = ["Отлично!❤", hint]
-            hint: str = show_hint(*hint_text)
-            valid = True
-        else:
-            for btn in buttons:
-                if btn.text == text:
-                    btn.text = text + '❌'
-                    break
-            hint: str = show_hint("Допущена ошибка!", f"Попробуй ещё раз вспомнить слово 🇷🇺{data['translate_word'].capitalize()}")
-    bot.send_message(message.chat.id, hint, reply_markup=create_markup(buttons))
-    if valid:
-        next_cards(message)
-
+    return BotApp(config)
 
 
-bot.add_custom_filter(custom_filters.StateFilter(bot))
-bot.infinity_polling(skip_pending=True)
\ No newline at end of file
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    # При остановке сервиса выполняются блоки finally и обработчики atexit: состояния и очередь сообщений сохраняются
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    create_app().run()
@@ -0,0 +1,97 @@
+"""
+Административные команды бота.
+
+    python manage.py migrate
+    python manage.py import words.csv --user username
+    python manage.py check-counters --repair
+    python manage.py gc --batch-size 1000
+"""
+import argparse
+import time
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from db import bootstrap, collect_orphan_words, refresh_word_counts, upsert_user, word_count_mismatches
+from importer import import_words, parse_rows
+
+
+def migrate_command(args: argparse.Namespace, engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Создает схему базы данных, применяет миграции и заполняет начальные данные.
+    """
+    print(f'Версия схемы: {bootstrap(engine)}')
+
+
+def import_command(args: argparse.Namespace, engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Загружает словарь из CSV/TSV файла и печатает итоги.
+    Запущенный бот перечитывает пулы слов не позже чем через WORD_POOL_TTL секунд, перезапуск не нужен.
+    """
+    start = time.perf_counter()
+    with Session(engine) as session, open(args.file, encoding='utf-8-sig', newline='') as file:
+        user_id = upsert_user(session, args.user)
+        result = import_words(session, user_id, parse_rows(file, args.delimiter), args.chunk_size)
+    print(f'Строк: {result.rows}, новых слов: {result.words_added}, '
+          f'добавлено в словарь: {result.links_added}, пропущено: {result.skipped} '
+          f'за {time.perf_counter() - start:.2f} с')
+
+
+def check_counters_command(args: argparse.Namespace, engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Сверяет счетчики слов пользователей с таблицей связей и, с флагом --repair, исправляет расхождения.
+    """
+    with Session(engine) as session:
+        mismatches = word_count_mismatches(session)
+        for user_id, stored, actual in mismatches:
+            print(f'Пользователь {user_id}: сохранено {stored}, фактически {actual}')
+        if mismatches and args.repair:
+            refresh_word_counts(session, [user_id for user_id, _, _ in mismatches])
+            session.commit()
+    print(f'Расхождений: {len(mismatches)}' + (', исправлено' if mismatches and args.repair else ''))
+    if mismatches and not args.repair:
+        raise SystemExit(1)
+
+
+def gc_command(args: argparse.Namespace, engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Удаляет слова, на которые не ссылается ни один пользователь, и печатает их количество.
+    """
+    start = time.perf_counter()
+    with Session(engine) as session:
+        removed = collect_orphan_words(session, args.batch_size)
+    print(f'Удалено слов без ссылок: {removed} за {time.perf_counter() - start:.2f} с')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dsn', help='строка подключения к базе данных, по умолчанию из config.py')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = commands.add_parser('migrate', help='подготовить схему и начальные данные')
+    migrate_parser.set_defaults(handler=migrate_command)
+
+    import_parser = commands.add_parser('import', help='загрузить словарь из CSV/TSV файла')
+    import_parser.add_argument('file')
+    import_parser.add_argument('--user', required=True, help='имя пользователя Telegram')
+    import_parser.add_argument('--delimiter', help='разделитель столбцов, по умолчанию определяется автоматически')
+    import_parser.add_argument('--chunk-size', type=int, default=1000)
+    import_parser.set_defaults(handler=import_command)
+
+    counters_parser = commands.add_parser('check-counters', help='проверить счетчики слов пользователей')
+    counters_parser.add_argument('--repair', action='store_true', help='исправить найденные расхождения')
+    counters_parser.set_defaults(handler=check_counters_command)
+
+    gc_parser = commands.add_parser('gc', help='удалить слова, на которые не ссылается ни один пользователь')
+    gc_parser.add_argument('--batch-size', type=int, default=1000, help='слов в одной транзакции')
+    gc_parser.set_defaults(handler=gc_command)
+
+    args = parser.parse_args()
+    if args.dsn is None:
+        from settings import DSN
+        args.dsn = DSN
+    args.handler(args, sqlalchemy.create_engine(args.dsn))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Встроенные метрики бота в формате Prometheus: задержка обработчиков, запросы к базе данных по обработчикам,
+задержка отправки сообщений и размеры очередей. Метрики собираются в памяти процесса
+и отдаются HTTP-сервером по адресу /metrics.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import sqlalchemy as sq
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+DEFAULT_BUCKETS: Sequence[float] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Обработчик, выполняющийся в текущем потоке или задаче asyncio; к нему относятся запросы к базе данных
+current_handler: contextvars.ContextVar[str] = contextvars.ContextVar('current_handler', default='')
+
+
+# Все созданные метрики по имени в порядке создания; метрика с тем же именем заменяет прежнюю
+registry: Dict[str, 'Metric'] = {}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _quote(value) -> str:
+    return f'"{_escape(str(value))}"'
+
+
+class Metric:
+    """
+    Базовый класс метрики с необязательной меткой.
+    """
+    kind: str = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._lock = threading.Lock()
+        registry[name] = self
+
+    def _labels(self, value: str, extra: str = '') -> str:
+        labels = [f'{self.label}={_quote(value)}'] if self.label else []
+        if extra:
+            labels.append(extra)
+        return '{' + ','.join(labels) + '}' if labels else ''
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.kind}'
+        yield from self.samples()
+
+
+class Counter(Metric):
+    """
+    Монотонно растущий счетчик.
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None) -> None:
+        super().__init__(name, documentation, label)
+        self._values: Dict[str, float] = {}
+
+    def inc(self, label: str = '', amount: float = 1) -> None:
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for label, value in values:
+            yield f'{self.name}{self._labels(label)} {value}'
+
+
+class Gauge(Metric):
+    """
+    Текущее значение, которое вычисляется функцией в момент чтения метрик.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]) -> None:
+        super().__init__(name, documentation)
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        yield f'{self.name} {self.read()}'
+
+
+class Histogram(Metric):
+    """
+    Гистограмма с фиксированными границами корзин. Запись значения — поиск корзины и два сложения под блокировкой.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, label)
+        self.buckets = tuple(buckets)
+        # Для каждого значения метки: количество наблюдений по корзинам, последняя — больше всех границ, и сумма
+        self._series: Dict[str, List[float]] = {}
+
+    def observe(self, value: float, label: str = '') -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, label: str = '') -> int:
+        with self._lock:
+            series = self._series.get(label)
+            return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((label, list(values)) for label, values in self._series.items())
+        for label, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield f'{self.name}_bucket{self._labels(label, "le=" + _quote(bound))} {cumulative}'
+            total = cumulative + values[-2]
+            yield f'{self.name}_bucket{self._labels(label, "le=" + _quote("+Inf"))} {total}'
+            yield f'{self.name}_sum{self._labels(label)} {values[-1]}'
+            yield f'{self.name}_count{self._labels(label)} {total}'
+
+
+handler_seconds: Histogram = Histogram('bot_handler_seconds', 'Время обработки обновления', 'handler')
+handler_errors: Counter = Counter('bot_handler_errors_total', 'Ошибки в обработчиках', 'handler')
+query_seconds: Histogram = Histogram('bot_db_query_seconds', 'Время запросов к базе данных по обработчикам', 'handler')
+slow_queries: Counter = Counter('bot_db_slow_queries_total', 'Запросы дольше порога медленных запросов', 'handler')
+send_seconds: Histogram = Histogram('bot_send_seconds', 'Время запроса sendMessage к Bot API')
+send_errors: Counter = Counter('bot_send_errors_total', 'Ошибки запросов sendMessage к Bot API')
+
+
+def render() -> str:
+    """
+    :return: Все метрики в текстовом формате Prometheus.
+    """
+    return '\n'.join(line for metric in list(registry.values()) for line in metric.render()) + '\n'
+
+
+def instrument(handler: Callable) -> Callable:
+    """
+    Декоратор обработчика: записывает время выполнения и ошибки, а запросы к базе данных внутри обработчика
+    относит к нему. Вложенные вызовы обработчиков учитываются в обработчике верхнего уровня.
+    Поддерживает как обычные функции, так и корутины.
+    """
+    name = handler.__name__
+
+    if asyncio.iscoroutinefunction(handler):
+        @functools.wraps(handler)
+        async def async_wrapper(*args, **kwargs):
+            if current_handler.get():
+                return await handler(*args, **kwargs)
+            token = current_handler.set(name)
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(name)
+                raise
+            finally:
+                handler_seconds.observe(time.perf_counter() - start, name)
+                current_handler.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if current_handler.get():
+            return handler(*args, **kwargs)
+        token = current_handler.set(name)
+        start = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, name)
+            current_handler.reset(token)
+
+    return wrapper
+
+
+def timed_send(send: Callable) -> Callable:
+    """
+    Оборачивает функцию отправки сообщения, записывая время запроса к Bot API и ошибки.
+    """
+    if asyncio.iscoroutinefunction(send):
+        @functools.wraps(send)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await send(*args, **kwargs)
+            except Exception:
+                send_errors.inc()
+                raise
+            finally:
+                send_seconds.observe(time.perf_counter() - start)
+
+        return async_wrapper
+
+    @functools.wraps(send)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send(*args, **kwargs)
+        except Exception:
+            send_errors.inc()
+            raise
+        finally:
+            send_seconds.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def instrument_engine(engine: sq.engine.Engine, slow_query: float = 0.0) -> None:
+    """
+    Подключает учет запросов к движку SQLAlchemy. Для асинхронного движка передается engine.sync_engine.
+    :param engine: Движок SQLAlchemy.
+    :param slow_query: Порог в секундах, начиная с которого запрос записывается в журнал; 0 — не записывать.
+    """
+    @sq.event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        context._metrics_start = time.perf_counter()
+
+    @sq.event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        elapsed = time.perf_counter() - context._metrics_start
+        handler = current_handler.get()
+        query_seconds.observe(elapsed, handler)
+        if slow_query and elapsed >= slow_query:
+            slow_queries.inc(handler)
+            logger.warning('Медленный запрос %.1f мс в %s: %s', elapsed * 1000, handler or '-', statement)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """
+    Запускает в фоновом потоке HTTP-сервер, отдающий метрики по адресу /metrics.
+    :param port: Порт, 0 — выбрать свободный.
+    :param host: Адрес для прослушивания.
+    :return: Сервер; server.server_address содержит фактический адрес.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info('Метрики доступны на http://%s:%s/metrics', host, server.server_address[1])
+    return server
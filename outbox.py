@@ -0,0 +1,416 @@
+"""
+Очереди исходящих сообщений Telegram с ограничением частоты отправки: Outbox для TeleBot и AsyncOutbox для AsyncTeleBot.
+Соблюдает общий лимит бота и лимит на чат, склеивает идущие подряд тексты одному чату
+и повторяет отправку после ответа 429 Too Many Requests.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from telebot import asyncio_helper
+from telebot.apihelper import ApiTelegramException
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+MAX_MESSAGE_LENGTH: int = 4096
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate токенов в секунду, не больше capacity накопленных токенов.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        :return: Через сколько секунд будет доступен токен, 0 — доступен сейчас.
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutgoingMessage:
+    """
+    Сообщение, ожидающее отправки.
+    """
+    __slots__ = ('chat_id', 'text', 'kwargs', 'parts')
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any]) -> None:
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.parts = 1
+
+    def merge(self, text: str, kwargs: Dict[str, Any]) -> bool:
+        """
+        Дописывает текст следующего сообщения к этому, если их можно отправить одним сообщением.
+        Клавиатура берется у последнего сообщения, у которого она есть.
+        :return: True, если сообщения склеены.
+        """
+        if kwargs.get('parse_mode') != self.kwargs.get('parse_mode'):
+            return False
+        if set(kwargs) - {'parse_mode', 'reply_markup'} or set(self.kwargs) - {'parse_mode', 'reply_markup'}:
+            return False
+        if len(self.text) + 1 + len(text) > MAX_MESSAGE_LENGTH:
+            return False
+        self.text = f'{self.text}\n{text}'
+        if kwargs.get('reply_markup') is not None:
+            self.kwargs['reply_markup'] = kwargs['reply_markup']
+        self.parts += 1
+        return True
+
+
+class _ChatQueue:
+    __slots__ = ('messages', 'bucket', 'in_flight')
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.messages: Deque[OutgoingMessage] = deque()
+        self.bucket = bucket
+        self.in_flight = False
+
+
+class _OutboxQueue:
+    """
+    Общая часть очередей: сообщения по чатам, лимиты и склеивание. Синхронизацию обеспечивают наследники.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, max_retries: int,
+                 backoff: float) -> None:
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._chats: Dict[int, _ChatQueue] = {}
+        self._ready: Deque[int] = deque()
+        self._depth = 0
+        self._stopped = False
+        self._paused_until = 0.0
+        # Чат с пустой очередью забывается, когда его лимит полностью восстановится; проверяется не чаще раза в интервал
+        self._sweep_interval = max(1.0, chat_burst / chat_rate)
+        self._swept_at = time.monotonic()
+        self.sent = self.coalesced = self.retried = self.failed = 0
+
+    def _enqueue(self, chat_id: int, text: str, kwargs: Dict[str, Any]) -> bool:
+        """
+        Ставит сообщение в очередь чата или дописывает его к ожидающему.
+        :return: True, если чат стал готов к отправке и нужно разбудить отправителя.
+        """
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatQueue(TokenBucket(self._chat_rate, self._chat_burst))
+        if chat.messages and chat.messages[-1].merge(text, kwargs):
+            self.coalesced += 1
+            return False
+        chat.messages.append(OutgoingMessage(chat_id, text, kwargs))
+        self._depth += 1
+        if len(chat.messages) == 1 and not chat.in_flight:
+            self._ready.append(chat_id)
+            return True
+        return False
+
+    def _stats(self) -> Dict[str, int]:
+        return {
+            'depth': self._depth,
+            'chats_waiting': len(self._ready),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    def _pick(self, now: float) -> Tuple[Optional[OutgoingMessage], Optional[float]]:
+        """
+        Выбирает следующее сообщение, которое можно отправить с учетом лимитов.
+        :return: Сообщение либо None и время до появления следующего, None — ждать новых сообщений.
+        """
+        self._sweep(now)
+        wait = self._paused_until - now
+        if wait > 0:
+            return None, wait
+        wait = None
+        for _ in range(len(self._ready)):
+            chat_id = self._ready.popleft()
+            chat = self._chats[chat_id]
+            delay = max(chat.bucket.delay(now), self._global.delay(now))
+            if delay == 0:
+                chat.bucket.take(now)
+                self._global.take(now)
+                chat.in_flight = True
+                return chat.messages.popleft(), None
+            self._ready.append(chat_id)
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _sweep(self, now: float) -> None:
+        """
+        Удаляет чаты без ожидающих сообщений, лимит которых уже восстановился.
+        """
+        if now - self._swept_at < self._sweep_interval:
+            return
+        self._swept_at = now
+        idle = [chat_id for chat_id, chat in self._chats.items()
+                if not chat.messages and not chat.in_flight and chat.bucket.full(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+    def _finish(self, message: OutgoingMessage) -> None:
+        self._depth -= 1
+        chat = self._chats[message.chat_id]
+        chat.in_flight = False
+        if chat.messages:
+            self._ready.append(message.chat_id)
+        elif chat.bucket.full(time.monotonic()):
+            del self._chats[message.chat_id]
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Считает паузу перед повтором отправки. После ответа 429 приостанавливает всю очередь.
+        :param error: Ошибка отправки.
+        :param attempt: Номер попытки, начиная с 0.
+        :return: Пауза в секундах.
+        :raises: Исходную ошибку, если отправку повторять не нужно.
+        """
+        if attempt == self._max_retries:
+            raise error
+        delay = self._backoff * 2 ** attempt
+        if isinstance(error, (ApiTelegramException, asyncio_helper.ApiTelegramException)):
+            if error.error_code != 429:
+                raise error
+            retry_after = (error.result_json or {}).get('parameters', {}).get('retry_after', 0)
+            delay = max(retry_after, delay)
+            # Лимит превышен для всего бота: приостанавливаем всех отправителей
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.retried += 1
+        return delay
+
+
+class Outbox(_OutboxQueue):
+    """
+    Очередь исходящих сообщений. send_message возвращается сразу, отправку выполняют фоновые потоки.
+    Сообщения одного чата отправляются строго по порядку и не параллельно.
+    """
+
+    def __init__(self, send: Callable[..., Any], global_rate: float = 30.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, senders: int = 4, max_retries: int = 5, backoff: float = 0.5) -> None:
+        """
+        :param send: Функция отправки, обычно TeleBot.send_message.
+        :param global_rate: Общий лимит сообщений в секунду.
+        :param chat_rate: Лимит сообщений в секунду для одного чата.
+        :param chat_burst: Сколько сообщений подряд можно отправить в чат без ожидания.
+        :param senders: Количество потоков отправки.
+        :param max_retries: Количество повторов после ответа 429 или сетевой ошибки.
+        :param backoff: Начальная пауза перед повтором в секундах, удваивается с каждой попыткой.
+        """
+        super().__init__(global_rate, chat_rate, chat_burst, max_retries, backoff)
+        self._send = send
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f'outbox-{i}', daemon=True) for i in range(senders)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def send_message(self, chat_id: int, text: str, **kwargs: Any) -> None:
+        """
+        Ставит сообщение в очередь. Если в очереди чата уже ждет текст, новый текст дописывается к нему.
+        Параметры совпадают с TeleBot.send_message.
+        """
+        with self._cond:
+            if self._enqueue(chat_id, text, kwargs):
+                self._cond.notify()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Текущие показатели очереди: глубина, количество отправленных, склеенных, повторенных и потерянных.
+        """
+        with self._cond:
+            return self._stats()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждет отправки всех сообщений из очереди.
+        :return: True, если очередь опустела до истечения времени ожидания.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._depth == 0, timeout)
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Отправляет оставшиеся сообщения и останавливает потоки отправки.
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _next(self) -> Optional[OutgoingMessage]:
+        """
+        Выбирает следующее сообщение, которое можно отправить с учетом лимитов, либо ждет его появления.
+        Вызывается под блокировкой.
+        """
+        while not self._stopped:
+            message, wait = self._pick(time.monotonic())
+            if message is not None:
+                return message
+            self._cond.wait(wait)
+        return None
+
+    def _done(self, message: OutgoingMessage) -> None:
+        with self._cond:
+            self._finish(message)
+            self._cond.notify_all()
+
+    def _deliver(self, message: OutgoingMessage) -> None:
+        for attempt in range(self._max_retries + 1):
+            try:
+                self._send(message.chat_id, message.text, **message.kwargs)
+                with self._cond:
+                    self.sent += 1
+                return
+            except (ApiTelegramException, ConnectionError, TimeoutError, OSError) as e:
+                with self._cond:
+                    delay = self._retry_delay(e, attempt)
+                time.sleep(delay)
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                message = self._next()
+            if message is None:
+                return
+            try:
+                self._deliver(message)
+            except Exception:
+                with self._cond:
+                    self.failed += 1
+                logger.exception('Не удалось отправить сообщение в чат %s', message.chat_id)
+            finally:
+                self._done(message)
+
+
+class AsyncOutbox(_OutboxQueue):
+    """
+    Очередь исходящих сообщений для AsyncTeleBot с теми же лимитами, склеиванием и повторами, что и Outbox.
+    send_message возвращается сразу, отправку выполняют задачи asyncio, запускаемые при первом сообщении.
+    """
+
+    def __init__(self, send: Callable[..., Awaitable[Any]], global_rate: float = 30.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, senders: int = 4, max_retries: int = 5, backoff: float = 0.5) -> None:
+        """
+        :param send: Корутина отправки, обычно AsyncTeleBot.send_message.
+        :param senders: Количество задач отправки.
+        Остальные параметры совпадают с Outbox.
+        """
+        super().__init__(global_rate, chat_rate, chat_burst, max_retries, backoff)
+        self._send = send
+        self._senders = senders
+        self._tasks: List[asyncio.Task] = []
+        # Будит задачи отправки: появилось сообщение или освободился чат
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def send_message(self, chat_id: int, text: str, **kwargs: Any) -> None:
+        """
+        Ставит сообщение в очередь. Если в очереди чата уже ждет текст, новый текст дописывается к нему.
+        Параметры совпадают с AsyncTeleBot.send_message. Вызывается из цикла событий.
+        """
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self._senders)]
+        if self._enqueue(chat_id, text, kwargs):
+            self._wakeup.set()
+        if self._depth:
+            self._drained.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Текущие показатели очереди: глубина, количество отправленных, склеенных, повторенных и потерянных.
+        """
+        return self._stats()
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждет отправки всех сообщений из очереди.
+        :return: True, если очередь опустела до истечения времени ожидания.
+        """
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Отправляет оставшиеся сообщения и останавливает задачи отправки.
+        """
+        await self.flush(timeout)
+        self._stopped = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _next(self) -> Optional[OutgoingMessage]:
+        """
+        Выбирает следующее сообщение, которое можно отправить с учетом лимитов, либо ждет его появления.
+        """
+        while not self._stopped:
+            message, wait = self._pick(time.monotonic())
+            if message is not None:
+                return message
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+    async def _deliver(self, message: OutgoingMessage) -> None:
+        for attempt in range(self._max_retries + 1):
+            try:
+                await self._send(message.chat_id, message.text, **message.kwargs)
+                self.sent += 1
+                return
+            except (asyncio_helper.ApiTelegramException, asyncio_helper.RequestTimeout, ConnectionError,
+                    TimeoutError, OSError) as e:
+                await asyncio.sleep(self._retry_delay(e, attempt))
+
+    async def _work(self) -> None:
+        while True:
+            message = await self._next()
+            if message is None:
+                return
+            try:
+                await self._deliver(message)
+            except Exception:
+                self.failed += 1
+                logger.exception('Не удалось отправить сообщение в чат %s', message.chat_id)
+            finally:
+                self._finish(message)
+                self._wakeup.set()
+                if not self._depth:
+                    self._drained.set()
@@ -0,0 +1,171 @@
+"""
+Заранее собранные карточки. Пока пользователь отвечает на текущую карточку, в фоне собираются следующие,
+и очередная карточка отправляется из памяти без обращения к базе данных.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Collection, Deque, Dict, Hashable, Optional, Set, Tuple
+
+from cache import LRUCache
+from db import Card
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+# Заранее собранная карточка: версия словаря на момент сборки, время сборки и сама карточка
+Prefetched = Tuple[Hashable, float, Card]
+
+
+class CardPrefetcher:
+    """
+    Очереди заранее собранных карточек по пользователям.
+    Карточка выдается, только если словарь пользователя не менялся с момента ее сборки (версия из WordSampler),
+    она не старше max_age и ее слово не показывалось недавно; иначе карточка отбрасывается.
+    """
+
+    def __init__(self, version: Callable[[int], Hashable], depth: int = 2, max_age: float = 60.0,
+                 workers: int = 2, max_users: int = 100_000) -> None:
+        """
+        :param version: Функция, возвращающая текущую версию словаря пользователя.
+        :param depth: Количество карточек, собираемых заранее для одного пользователя.
+        :param max_age: Время в секундах, после которого карточка считается устаревшей:
+            за это время у пользователя могут наступить сроки повторения других слов.
+        :param workers: Количество фоновых потоков сборки (синхронный режим).
+        :param max_users: Максимальное количество пользователей с очередями карточек.
+        """
+        self.version = version
+        self.depth = depth
+        self.max_age = max_age
+        self._workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queues: LRUCache[Deque[Prefetched]] = LRUCache(maxsize=max_users, ttl=max_age)
+        self._building: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'stale': 0, 'built': 0}
+
+    def take(self, user_id: int, recent: Collection[int]) -> Optional[Card]:
+        """
+        Возвращает следующую заранее собранную карточку пользователя.
+        :param user_id: Идентификатор пользователя.
+        :param recent: Идентификаторы последних показанных слов.
+        :return: Карточка или None, если подходящей карточки нет.
+        """
+        version = self.version(user_id)
+        now = time.monotonic()
+        with self._lock:
+            cards = self._queues.get(user_id)
+            while cards:
+                built_version, built_at, card = cards.popleft()
+                if built_version == version and now - built_at <= self.max_age and card.word_id not in recent:
+                    self._stats['hits'] += 1
+                    return card
+                self._stats['stale'] += 1
+            self._stats['misses'] += 1
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        """
+        :return: Количество выданных карточек, промахов, отброшенных и собранных карточек.
+        """
+        with self._lock:
+            return dict(self._stats, users=len(self._queues))
+
+    def _start(self, user_id: int) -> bool:
+        with self._lock:
+            if user_id in self._building:
+                return False
+            self._building.add(user_id)
+            return True
+
+    def _next(self, user_id: int, recent: Collection[int]) -> Optional[Tuple[Hashable, Set[int]]]:
+        """
+        :return: Версия словаря и слова, которые не должны попасть в следующую карточку, или None, если очередь полна.
+        """
+        version = self.version(user_id)
+        with self._lock:
+            cards = self._queues.get(user_id)
+            if cards is None:
+                cards = deque()
+                self._queues.set(user_id, cards)
+            elif cards and cards[0][0] != version:
+                cards.clear()
+            if len(cards) >= self.depth:
+                return None
+            return version, {*recent, *(card.word_id for _, _, card in cards)}
+
+    def _put(self, user_id: int, version: Hashable, card: Card) -> None:
+        with self._lock:
+            cards = self._queues.get(user_id)
+            if cards is None:
+                cards = deque()
+            cards.append((version, time.monotonic(), card))
+            # Запись продлевается, чтобы очередь не вытеснялась раньше своих карточек
+            self._queues.set(user_id, cards)
+            self._stats['built'] += 1
+
+    def _finish(self, user_id: int) -> None:
+        with self._lock:
+            self._building.discard(user_id)
+
+    def _fill(self, user_id: int, recent: Collection[int], build: Callable[[int, Collection[int]], Optional[Card]]) -> None:
+        try:
+            while (step := self._next(user_id, recent)) is not None:
+                version, exclude = step
+                card = build(user_id, exclude)
+                if card is None:
+                    break
+                self._put(user_id, version, card)
+        except Exception:
+            logger.exception('Не удалось заранее собрать карточку для пользователя %s', user_id)
+        finally:
+            self._finish(user_id)
+
+    def schedule(self, user_id: int, recent: Collection[int],
+                 build: Callable[[int, Collection[int]], Optional[Card]]) -> None:
+        """
+        Дополняет очередь карточек пользователя в фоновом потоке. Если сборка для пользователя уже идет,
+        ничего не делает.
+        :param user_id: Идентификатор пользователя.
+        :param recent: Идентификаторы последних показанных слов, включая текущую карточку.
+        :param build: Функция, собирающая карточку пользователя без указанных слов.
+        """
+        if not self._start(user_id):
+            return
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix='prefetch')
+        self._executor.submit(self._fill, user_id, set(recent), build)
+
+    async def fill_async(self, user_id: int, recent: Collection[int],
+                         build: Callable[[int, Collection[int]], Awaitable[Optional[Card]]]) -> None:
+        """
+        Асинхронный вариант schedule: дополняет очередь карточек; вызывается в отдельной задаче asyncio.
+        """
+        if not self._start(user_id):
+            return
+        try:
+            recent = set(recent)
+            while (step := self._next(user_id, recent)) is not None:
+                version, exclude = step
+                card = await build(user_id, exclude)
+                if card is None:
+                    break
+                self._put(user_id, version, card)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Не удалось заранее собрать карточку для пользователя %s', user_id)
+        finally:
+            self._finish(user_id)
+
+    def stop(self) -> None:
+        """
+        Останавливает фоновые потоки сборки, не дожидаясь незавершенных карточек.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
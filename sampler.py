@@ -0,0 +1,244 @@
+import itertools
+import random
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Collection, Hashable, Tuple
+
+
+class WordPool:
+    """
+    Плотный массив идентификаторов слов с индексом позиций.
+    Добавление, удаление и выбор случайного элемента выполняются за O(1).
+    """
+    __slots__ = ('ids', 'pos', 'expires', 'stamp')
+
+    def __init__(self, ids: Iterable[int] = (), expires: float = float('inf'), stamp: Optional[int] = None) -> None:
+        self.ids: List[int] = []
+        self.pos: Dict[int, int] = {}
+        # Момент time.monotonic(), после которого пул нужно перечитать из базы данных
+        self.expires = expires
+        # Отметка изменений словаря в базе данных на момент загрузки: пока она не изменилась, пул не перечитывается
+        self.stamp = stamp
+        for word_id in ids:
+            self.add(word_id)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, word_id: int) -> bool:
+        return word_id in self.pos
+
+    def add(self, word_id: int) -> None:
+        """
+        Добавляет идентификатор слова в пул.
+        :param word_id: Идентификатор слова.
+        """
+        if word_id not in self.pos:
+            self.pos[word_id] = len(self.ids)
+            self.ids.append(word_id)
+
+    def remove(self, word_id: int) -> None:
+        """
+        Удаляет идентификатор слова из пула, перенося последний элемент на его место.
+        :param word_id: Идентификатор слова.
+        """
+        index = self.pos.pop(word_id, None)
+        if index is None:
+            return
+        last = self.ids.pop()
+        if index < len(self.ids):
+            self.ids[index] = last
+            self.pos[last] = index
+
+
+class WordSampler:
+    """
+    Выборка случайных слов пользователя без сортировки всего словаря в базе данных.
+    Хранит в памяти процесса общий пул слов (Initial User) и пулы слов отдельных пользователей.
+    Пулы заполняются лениво и поддерживаются в актуальном состоянии функциями add_word/delete_word.
+    Пулы давно не обращавшихся пользователей вытесняются и при следующем обращении загружаются заново.
+    Через ttl секунд после загрузки пул считается устаревшим: если отметка изменений словаря в базе данных
+    с тех пор сдвинулась, пул перечитывается, иначе продлевается. Так изменения, сделанные другими процессами
+    (например, manage.py import), доходят до бота без перезапуска.
+    Каждое изменение набора слов присваивает словарю пользователя новую версию (или увеличивает общую версию),
+    по которой заранее собранные карточки признаются устаревшими.
+    """
+
+    def __init__(self, max_users: int = 10_000, ttl: Optional[float] = 300.0) -> None:
+        """
+        :param max_users: Максимальное количество пулов пользователей в памяти.
+        :param ttl: Время в секундах, через которое пул перечитывается из базы данных, None — без ограничения.
+        """
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._shared: Optional[WordPool] = None
+        self._users: 'OrderedDict[Hashable, WordPool]' = OrderedDict()
+        self._shared_version: int = 0
+        # Версии берутся из общего счетчика и хранятся для ограниченного числа пользователей. Пользователь без
+        # сохраненной версии получает версию последнего вытеснения, которая отличается от всех его прежних версий
+        self._counter = itertools.count(1)
+        self._versions: 'OrderedDict[Hashable, int]' = OrderedDict()
+        self._evicted_version: int = 0
+
+    def version(self, user: Hashable) -> Tuple[int, int]:
+        """
+        :return: Версия словаря пользователя: общая версия и версия пула пользователя.
+        """
+        with self._lock:
+            return self._shared_version, self._versions.get(user, self._evicted_version)
+
+    def _changed(self, user: Hashable) -> None:
+        self._versions[user] = next(self._counter)
+        self._versions.move_to_end(user)
+        while len(self._versions) > 10 * self.max_users:
+            self._versions.popitem(last=False)
+            self._evicted_version = next(self._counter)
+
+    def _pool(self, user: Hashable) -> Optional[WordPool]:
+        pool = self._users.get(user)
+        if pool is not None:
+            self._users.move_to_end(user)
+        return pool
+
+    def _expires(self) -> float:
+        return time.monotonic() + self.ttl if self.ttl is not None else float('inf')
+
+    def has_shared(self) -> bool:
+        """
+        :return: True, если общий пул загружен и не устарел.
+        """
+        shared = self._shared
+        return shared is not None and shared.expires > time.monotonic()
+
+    def has_user(self, user: Hashable) -> bool:
+        """
+        :return: True, если пул пользователя загружен и не устарел.
+        """
+        with self._lock:
+            pool = self._pool(user)
+            return pool is not None and pool.expires > time.monotonic()
+
+    def renew_shared(self, stamp: Optional[int]) -> bool:
+        """
+        Продлевает срок общего пула, если его отметка изменений совпадает с текущей.
+        :param stamp: Текущая отметка изменений общего набора в базе данных.
+        :return: True, если пул продлен и перечитывать его не нужно.
+        """
+        with self._lock:
+            shared = self._shared
+            if shared is None or stamp is None or shared.stamp != stamp:
+                return False
+            shared.expires = self._expires()
+            return True
+
+    def renew_user(self, user: Hashable, stamp: Optional[int]) -> bool:
+        """
+        Продлевает срок пула пользователя, если его отметка изменений совпадает с текущей.
+        :param user: Ключ пользователя.
+        :param stamp: Текущая отметка изменений словаря пользователя в базе данных.
+        :return: True, если пул продлен и перечитывать его не нужно.
+        """
+        with self._lock:
+            pool = self._pool(user)
+            if pool is None or stamp is None or pool.stamp != stamp:
+                return False
+            pool.expires = self._expires()
+            return True
+
+    def load_shared(self, ids: Iterable[int], stamp: Optional[int] = None) -> None:
+        """
+        Заполняет общий пул слов. Если перечитанный пул отличается от прежнего, увеличивается общая версия.
+        :param ids: Идентификаторы общих слов.
+        :param stamp: Отметка изменений общего набора, прочитанная до загрузки слов.
+        """
+        pool = WordPool(ids, self._expires(), stamp)
+        with self._lock:
+            if self._shared is not None and self._shared.pos.keys() != pool.pos.keys():
+                self._shared_version += 1
+            self._shared = pool
+
+    def load_user(self, user: Hashable, ids: Iterable[int], stamp: Optional[int] = None) -> None:
+        """
+        Заполняет пул слов пользователя. Если перечитанный пул отличается от прежнего, меняется версия пользователя.
+        :param user: Ключ пользователя.
+        :param ids: Идентификаторы слов пользователя.
+        :param stamp: Отметка изменений словаря пользователя, прочитанная до загрузки слов.
+        """
+        pool = WordPool(ids, self._expires(), stamp)
+        with self._lock:
+            previous = self._users.get(user)
+            if previous is not None and previous.pos.keys() != pool.pos.keys():
+                self._changed(user)
+            self._users[user] = pool
+            self._users.move_to_end(user)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def add(self, user: Hashable, word_id: int) -> None:
+        """
+        Добавляет слово в пул пользователя, если пул уже загружен.
+        """
+        with self._lock:
+            pool = self._pool(user)
+            if pool is not None and word_id not in pool:
+                # Слово из общего пула, привязанное к пользователю, набор доступных слов не меняет
+                if self._shared is None or word_id not in self._shared:
+                    self._changed(user)
+                pool.add(word_id)
+
+    def remove(self, user: Hashable, word_id: int) -> None:
+        """
+        Удаляет слово из пула пользователя.
+        """
+        with self._lock:
+            pool = self._pool(user)
+            if pool is not None and word_id in pool:
+                self._changed(user)
+                pool.remove(word_id)
+
+    def invalidate(self, user: Optional[Hashable] = None) -> None:
+        """
+        Сбрасывает пул пользователя, либо все пулы, если пользователь не указан.
+        """
+        with self._lock:
+            if user is None:
+                self._shared_version += 1
+                self._shared = None
+                self._users.clear()
+            else:
+                self._changed(user)
+                self._users.pop(user, None)
+
+    def sample(self, user: Hashable, k: int, exclude: Collection[int] = ()) -> List[int]:
+        """
+        Возвращает до k различных случайных идентификаторов слов из общего пула и пула пользователя.
+        :param user: Ключ пользователя.
+        :param k: Количество слов.
+        :param exclude: Идентификаторы, которые не должны попасть в выборку.
+        :return: Список идентификаторов в случайном порядке.
+        """
+        with self._lock:
+            shared = self._shared.ids if self._shared is not None else []
+            pool = self._pool(user)
+            own = pool.ids if pool is not None else []
+            total = len(shared) + len(own)
+
+            # Для маленьких словарей дешевле перебрать все слова целиком
+            if total <= 2 * (k + len(exclude)):
+                candidates = [word_id for word_id in dict.fromkeys(shared + own) if word_id not in exclude]
+                return random.sample(candidates, min(k, len(candidates)))
+
+            result: List[int] = []
+            seen = set(exclude)
+            attempts = 4 * (k + len(exclude)) + 8
+            while len(result) < k and attempts:
+                attempts -= 1
+                index = random.randrange(total)
+                word_id = shared[index] if index < len(shared) else own[index - len(shared)]
+                if word_id not in seen:
+                    seen.add(word_id)
+                    result.append(word_id)
+            return result
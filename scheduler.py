@@ -0,0 +1,78 @@
+"""
+Планировщик интервальных повторений по алгоритму SM-2.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+DEFAULT_EASE: float = 2.5
+MIN_EASE: float = 1.3
+MAX_QUALITY: int = 5
+# Оценка карточки, в которой пользователь ошибся: слово считается забытым
+FORGOTTEN_QUALITY: int = 1
+# Срок повторения слова, которое еще ни разу не повторялось: такие слова выбираются случайно, а не по сроку
+NEW_WORD_DUE: datetime = datetime(1970, 1, 1)
+
+
+class Schedule(NamedTuple):
+    """
+    Состояние повторения слова: коэффициент легкости, интервал в днях, число успешных повторений подряд
+    и момент следующего повторения.
+    """
+    ease: float
+    interval: int
+    repetitions: int
+    due_at: datetime
+
+
+def utcnow() -> datetime:
+    """
+    :return: Текущее время UTC без часового пояса, в том виде, в котором оно хранится в базе данных.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def grade(mistakes: int) -> int:
+    """
+    Переводит количество ошибок до правильного ответа в оценку SM-2 от 0 до 5.
+    :param mistakes: Количество неверных попыток.
+    :return: Оценка качества ответа.
+    """
+    return max(MAX_QUALITY - 2 * mistakes, 0)
+
+
+def attempt_grade(valid: bool, mistakes: int) -> Optional[int]:
+    """
+    Оценивает карточку один раз, по первому исходу: верный ответ без ошибок или первая ошибка.
+    Карточку с ошибкой пользователь может пропустить, так и не ответив верно, поэтому ошибка оценивается сразу,
+    а верный ответ после ошибок повторно не оценивается.
+    :param valid: Верен ли ответ.
+    :param mistakes: Количество неверных попыток в карточке с учетом текущего ответа.
+    :return: Оценка качества ответа или None, если карточка уже оценена.
+    """
+    if valid:
+        return None if mistakes else grade(mistakes)
+    return FORGOTTEN_QUALITY if mistakes == 1 else None
+
+
+def review(ease: float, interval: int, repetitions: int, quality: int, now: datetime) -> Schedule:
+    """
+    Вычисляет новое расписание слова после ответа.
+    :param ease: Текущий коэффициент легкости.
+    :param interval: Текущий интервал в днях.
+    :param repetitions: Количество успешных повторений подряд.
+    :param quality: Оценка ответа от 0 до 5.
+    :param now: Момент ответа.
+    :return: Новое расписание.
+    """
+    if quality < 3:
+        repetitions, interval = 0, 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+    ease = max(MIN_EASE, ease + 0.1 - (MAX_QUALITY - quality) * (0.08 + (MAX_QUALITY - quality) * 0.02))
+    return Schedule(ease, interval, repetitions, now + timedelta(days=interval))
@@ -0,0 +1,155 @@
+import importlib.util
+import os
+
+from types import ModuleType
+from typing import Any, Callable, Dict, Optional
+
+
+def _load_file(path: str) -> ModuleType:
+    """
+    Загружает файл настроек в формате config.py.
+    :param path: Путь к файлу.
+    """
+    spec = importlib.util.spec_from_file_location('config', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Файл настроек в формате config.py: путь из load_config или переменной BOT_CONFIG, иначе модуль config
+CONFIG_FILE: Optional[str] = globals().get('CONFIG_FILE') or os.environ.get('BOT_CONFIG')
+if CONFIG_FILE:
+    config = _load_file(CONFIG_FILE)
+else:
+    try:
+        import config
+    except ImportError:
+        config = None
+
+
+def _setting(name: str, default: Any = None, cast: Callable[[str], Any] = str) -> Any:
+    """
+    Возвращает значение настройки: из переменной окружения, затем из файла настроек, иначе значение по умолчанию.
+    :param name: Имя настройки.
+    :param default: Значение по умолчанию.
+    :param cast: Функция приведения строкового значения из окружения к нужному типу.
+    :return: Значение настройки.
+    """
+    value = os.environ.get(name)
+    if value is not None:
+        return cast(value)
+    return getattr(config, name, default)
+
+
+def _async_url(url: str) -> str:
+    """
+    Подставляет асинхронный драйвер в строку подключения.
+    """
+    for sync_prefix, async_prefix in (('postgresql://', 'postgresql+asyncpg://'),
+                                      ('postgresql+psycopg2://', 'postgresql+asyncpg://'),
+                                      ('sqlite://', 'sqlite+aiosqlite://')):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+DB_USER: Optional[str] = _setting('DB_USER')
+DB_PASSWORD: Optional[str] = _setting('DB_PASSWORD')
+DB_HOST: Optional[str] = _setting('DB_HOST', 'localhost')
+DB_PORT: Optional[str] = _setting('DB_PORT', '5432')
+DB_NAME: Optional[str] = _setting('DB_NAME')
+TG_TOKEN: Optional[str] = _setting('TG_TOKEN')
+# Адрес Bot API, например локального сервера telegram-bot-api; по умолчанию api.telegram.org
+TG_API_URL: Optional[str] = _setting('TG_API_URL')
+
+# Строка подключения к базе данных, общая для бота и административных команд
+DSN: str = _setting('DATABASE_URL', f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+ASYNC_DSN: str = _setting('ASYNC_DATABASE_URL', _async_url(DSN))
+
+# Режим работы бота: 'sync' — TeleBot и синхронный движок, 'async' — AsyncTeleBot и асинхронный движок
+BOT_MODE: str = _setting('BOT_MODE', 'sync')
+
+# Количество потоков обработки обновлений и длина очереди каждого потока в синхронном режиме
+BOT_WORKERS: int = _setting('BOT_WORKERS', 8, int)
+BOT_QUEUE_SIZE: int = _setting('BOT_QUEUE_SIZE', 100, int)
+
+# Лимиты исходящих сообщений: общий лимит бота и лимит одного чата в сообщениях в секунду
+OUTBOX_GLOBAL_RATE: float = _setting('OUTBOX_GLOBAL_RATE', 30.0, float)
+OUTBOX_CHAT_RATE: float = _setting('OUTBOX_CHAT_RATE', 1.0, float)
+OUTBOX_CHAT_BURST: float = _setting('OUTBOX_CHAT_BURST', 3.0, float)
+OUTBOX_SENDERS: int = _setting('OUTBOX_SENDERS', 4, int)
+
+# Способ получения обновлений: 'polling' — опрос getUpdates, 'webhook' — встроенный HTTP-сервер
+BOT_TRANSPORT: str = _setting('BOT_TRANSPORT', 'polling')
+# Публичный адрес вебхука; если задан, вебхук регистрируется в Telegram при запуске
+WEBHOOK_URL: Optional[str] = _setting('WEBHOOK_URL')
+WEBHOOK_HOST: str = _setting('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT: int = _setting('WEBHOOK_PORT', 8080, int)
+WEBHOOK_PATH: str = _setting('WEBHOOK_PATH', '/telegram')
+# Секретный токен, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET: Optional[str] = _setting('WEBHOOK_SECRET')
+
+# Хранилище состояний диалогов: 'db' — таблица bot_states с отложенной записью, 'memory' — только в памяти процесса
+BOT_STATE_STORAGE: str = _setting('BOT_STATE_STORAGE', 'db')
+# Интервал записи изменений состояний в базу данных в секундах
+STATE_FLUSH_INTERVAL: float = _setting('STATE_FLUSH_INTERVAL', 1.0, float)
+
+# История ответов записывается пачками: при накоплении ANSWER_FLUSH_SIZE ответов или раз в ANSWER_FLUSH_INTERVAL секунд
+ANSWER_FLUSH_SIZE: int = _setting('ANSWER_FLUSH_SIZE', 500, int)
+ANSWER_FLUSH_INTERVAL: float = _setting('ANSWER_FLUSH_INTERVAL', 0.5, float)
+
+# Слова, на которые не ссылается ни один пользователь, удаляются раз в WORD_GC_INTERVAL секунд пачками
+# по WORD_GC_BATCH слов; 0 — не удалять в фоне
+WORD_GC_INTERVAL: float = _setting('WORD_GC_INTERVAL', 3600.0, float)
+WORD_GC_BATCH: int = _setting('WORD_GC_BATCH', 1000, int)
+
+# Количество карточек, заранее собираемых для пользователя, пока он отвечает на текущую; 0 — не собирать
+PREFETCH_DEPTH: int = _setting('PREFETCH_DEPTH', 2, int)
+# Время в секундах, после которого заранее собранная карточка отбрасывается
+PREFETCH_MAX_AGE: float = _setting('PREFETCH_MAX_AGE', 60.0, float)
+# Время в секундах, через которое словари пользователей в памяти сверяются с базой данных и перечитываются,
+# если изменились: так до бота доходят изменения, сделанные другими процессами, например manage.py import
+WORD_POOL_TTL: float = _setting('WORD_POOL_TTL', 300.0, float)
+
+# Порт HTTP-сервера метрик Prometheus, 0 — сервер не запускается
+METRICS_PORT: int = _setting('METRICS_PORT', 0, int)
+METRICS_HOST: str = _setting('METRICS_HOST', '0.0.0.0')
+# Запросы к базе данных дольше порога в миллисекундах записываются в журнал, 0 — не записываются
+SLOW_QUERY_MS: float = _setting('SLOW_QUERY_MS', 0.0, float)
+
+DB_POOL_SIZE: int = _setting('DB_POOL_SIZE', 5, int)
+DB_MAX_OVERFLOW: int = _setting('DB_MAX_OVERFLOW', 10, int)
+DB_POOL_TIMEOUT: float = _setting('DB_POOL_TIMEOUT', 30.0, float)
+DB_POOL_RECYCLE: int = _setting('DB_POOL_RECYCLE', 1800, int)
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    Возвращает параметры пула соединений для create_engine/create_async_engine.
+    :param url: Строка подключения.
+    :return: Именованные аргументы для создания движка.
+    """
+    if url.startswith('sqlite') and (url.endswith('://') or ':memory:' in url):
+        # База в памяти работает через один общий пул без ограничений на размер
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def load_config(path: Optional[str] = None) -> ModuleType:
+    """
+    Читает настройки заново, не изменяя этот модуль: из переменных окружения, затем из файла path
+    (если не указан — из BOT_CONFIG или config.py), иначе значения по умолчанию.
+    :param path: Путь к файлу настроек в формате config.py.
+    :return: Модуль с теми же настройками и функциями, что и settings; передается в main.create_app.
+    """
+    spec = importlib.util.spec_from_file_location(__name__, __file__)
+    module = importlib.util.module_from_spec(spec)
+    module.CONFIG_FILE = path
+    spec.loader.exec_module(module)
+    return module
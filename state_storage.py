@@ -0,0 +1,312 @@
+"""
+Хранилище состояний диалогов бота в базе данных с кэшем в памяти и отложенной записью.
+Чтение выполняется из кэша, изменения копятся в памяти и записываются в таблицу bot_states пачками
+в фоновом потоке, поэтому set_state и retrieve_data на каждой карточке не ждут базу данных.
+При сбое процесса теряются только изменения за последний интервал записи.
+"""
+import asyncio
+import atexit
+import json
+import logging
+import threading
+
+from typing import Any, Callable, Dict, Optional
+
+import sqlalchemy as sq
+from sqlalchemy.orm import Session
+from telebot.asyncio_storage import StateStorageBase as AsyncStateStorageBase
+from telebot.asyncio_storage.base_storage import StateDataContext as AsyncStateDataContext
+from telebot.storage import StateStorageBase
+from telebot.storage.base_storage import StateDataContext
+
+from cache import LRUCache
+from db import BotState, dialect_insert
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+# Отметка в кэше о том, что записи в базе данных нет
+_ABSENT: Dict[str, Any] = {}
+
+
+class StateDBStorage(StateStorageBase):
+    """
+    Хранилище состояний для TeleBot поверх таблицы bot_states.
+    Изменяющие методы загружают запись до взятия блокировки, чтобы запрос к базе данных
+    при промахе кэша не задерживал остальные потоки.
+    """
+
+    def __init__(self, engine: sq.engine.Engine, flush_interval: float = 1.0, batch_size: int = 500,
+                 cache_size: int = 100_000, separator: str = ':', prefix: str = 'telebot') -> None:
+        """
+        :param engine: Движок SQLAlchemy.
+        :param flush_interval: Интервал записи изменений в базу данных в секундах.
+        :param batch_size: Количество измененных записей, при котором запись начинается досрочно.
+        :param cache_size: Максимальное количество записей в кэше.
+        :param separator: Разделитель частей ключа.
+        :param prefix: Префикс ключа.
+        """
+        super().__init__()
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.separator = separator
+        self.prefix = prefix
+        self._cache: LRUCache[Dict[str, Any]] = LRUCache(maxsize=cache_size, ttl=None)
+        # Измененные записи, ожидающие записи, и записи, которые пишутся прямо сейчас; None — удаление
+        self._dirty: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._flushing: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='state-storage', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def key(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+            message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> str:
+        return self._get_key(chat_id, user_id, self.prefix, self.separator,
+                             business_connection_id, message_thread_id, bot_id)
+
+    def cached(self, key: str) -> bool:
+        """
+        :return: True, если запись можно прочитать без обращения к базе данных.
+        """
+        with self._lock:
+            return key in self._dirty or key in self._flushing or self._cache.get(key) is not None
+
+    def _record(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает запись состояния из памяти, при промахе загружая её из базы данных.
+        """
+        with self._lock:
+            if key in self._dirty:
+                return self._dirty[key]
+            if key in self._flushing:
+                return self._flushing[key]
+            record = self._cache.get(key)
+        if record is None:
+            with Session(self.engine) as session:
+                row = session.execute(sq.select(BotState.state, BotState.data).where(BotState.key == key)).first()
+            loaded = {'state': row.state, 'data': json.loads(row.data)} if row else _ABSENT
+            with self._lock:
+                # Пока шло чтение, запись могла измениться в другом потоке
+                if key in self._dirty or key in self._flushing or self._cache.get(key) is not None:
+                    return self._record(key)
+                self._cache.set(key, loaded)
+                record = loaded
+        return None if record is _ABSENT else record
+
+    def _mark(self, key: str, record: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._dirty[key] = record
+            self._cache.set(key, _ABSENT if record is None else record)
+            if len(self._dirty) >= self.batch_size:
+                self._wakeup.set()
+
+    def set_state(self, chat_id: int, user_id: int, state, business_connection_id: Optional[str] = None,
+                  message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        if hasattr(state, 'name'):
+            state = state.name
+        key = self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        self._record(key)
+        with self._lock:
+            record = self._record(key)
+            if record is None:
+                record = {'state': state, 'data': {}}
+            else:
+                record['state'] = state
+            self._mark(key, record)
+        return True
+
+    def get_state(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                  message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> Optional[str]:
+        record = self._record(self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id))
+        return record['state'] if record else None
+
+    def delete_state(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                     message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        key = self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        self._record(key)
+        with self._lock:
+            if self._record(key) is None:
+                return False
+            self._mark(key, None)
+        return True
+
+    def set_data(self, chat_id: int, user_id: int, key: str, value: Any, business_connection_id: Optional[str] = None,
+                 message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        state_key = self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        self._record(state_key)
+        with self._lock:
+            record = self._record(state_key)
+            if record is None:
+                raise RuntimeError(f'StateDBStorage: key {state_key} does not exist.')
+            record['data'][key] = value
+            self._mark(state_key, record)
+        return True
+
+    def get_data(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                 message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> Dict[str, Any]:
+        record = self._record(self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id))
+        return record['data'] if record else {}
+
+    def reset_data(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                   message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        key = self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        self._record(key)
+        with self._lock:
+            record = self._record(key)
+            if record is None:
+                return False
+            record['data'] = {}
+            self._mark(key, record)
+        return True
+
+    def get_interactive_data(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                             message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> StateDataContext:
+        return StateDataContext(self, chat_id=chat_id, user_id=user_id, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    def save(self, chat_id: int, user_id: int, data: Dict[str, Any], business_connection_id: Optional[str] = None,
+             message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        key = self.key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        self._record(key)
+        with self._lock:
+            record = self._record(key)
+            if record is None:
+                return False
+            record['data'] = data
+            self._mark(key, record)
+        return True
+
+    def pending(self) -> int:
+        """
+        :return: Количество измененных записей, еще не записанных в базу данных.
+        """
+        with self._lock:
+            return len(self._dirty) + len(self._flushing)
+
+    def flush(self) -> int:
+        """
+        Записывает накопленные изменения в базу данных одной транзакцией.
+        При ошибке изменения возвращаются в очередь и будут записаны при следующей попытке.
+        :return: Количество записанных изменений.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                self._flushing, self._dirty = self._dirty, {}
+                # Снимок данных делается под блокировкой: после неё записи можно снова изменять
+                rows = [{'key': key, 'state': record['state'], 'data': json.dumps(record['data'], ensure_ascii=False)}
+                        for key, record in self._flushing.items() if record is not None]
+                deleted = [key for key, record in self._flushing.items() if record is None]
+            try:
+                with Session(self.engine) as session, session.begin():
+                    if rows:
+                        insert = dialect_insert(session, BotState.__table__)
+                        session.execute(insert.on_conflict_do_update(
+                            index_elements=['key'],
+                            set_={'state': insert.excluded.state, 'data': insert.excluded.data,
+                                  'updated_at': sq.func.now()},
+                        ), rows)
+                    if deleted:
+                        session.execute(sq.delete(BotState).where(BotState.key.in_(deleted)))
+            except Exception:
+                with self._lock:
+                    for key, record in self._flushing.items():
+                        self._dirty.setdefault(key, record)
+                raise
+            finally:
+                with self._lock:
+                    count = len(self._flushing)
+                    self._flushing = {}
+            return count
+
+    def close(self) -> None:
+        """
+        Останавливает фоновую запись и записывает оставшиеся изменения.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать состояния диалогов')
+
+    def __str__(self) -> str:
+        return f'<StateDBStorage: {self.engine.url!r}, pending={self.pending()}>'
+
+
+class AsyncStateDBStorage(AsyncStateStorageBase):
+    """
+    Хранилище состояний для AsyncTeleBot поверх StateDBStorage. Операции над записями в кэше выполняются
+    сразу, а загрузка записи из базы данных при промахе выполняется в отдельном потоке.
+    """
+
+    def __init__(self, storage: StateDBStorage) -> None:
+        super().__init__()
+        self.storage = storage
+
+    async def _call(self, method: Callable, chat_id: int, user_id: int, *args, business_connection_id=None,
+                    message_thread_id=None, bot_id=None):
+        ids = {'business_connection_id': business_connection_id, 'message_thread_id': message_thread_id,
+               'bot_id': bot_id}
+        if self.storage.cached(self.storage.key(chat_id, user_id, **ids)):
+            return method(chat_id, user_id, *args, **ids)
+        return await asyncio.to_thread(method, chat_id, user_id, *args, **ids)
+
+    async def set_state(self, chat_id: int, user_id: int, state, business_connection_id: Optional[str] = None,
+                        message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        return await self._call(self.storage.set_state, chat_id, user_id, state, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def get_state(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                        message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> Optional[str]:
+        return await self._call(self.storage.get_state, chat_id, user_id, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def delete_state(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                           message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        return await self._call(self.storage.delete_state, chat_id, user_id, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def set_data(self, chat_id: int, user_id: int, key: str, value: Any, business_connection_id: Optional[str] = None,
+                       message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        return await self._call(self.storage.set_data, chat_id, user_id, key, value,
+                                business_connection_id=business_connection_id, message_thread_id=message_thread_id,
+                                bot_id=bot_id)
+
+    async def get_data(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                       message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> Dict[str, Any]:
+        return await self._call(self.storage.get_data, chat_id, user_id, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def reset_data(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                         message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        return await self._call(self.storage.reset_data, chat_id, user_id, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    def get_interactive_data(self, chat_id: int, user_id: int, business_connection_id: Optional[str] = None,
+                             message_thread_id: Optional[int] = None,
+                             bot_id: Optional[int] = None) -> AsyncStateDataContext:
+        return AsyncStateDataContext(self, chat_id=chat_id, user_id=user_id, business_connection_id=business_connection_id,
+                                     message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def save(self, chat_id: int, user_id: int, data: Dict[str, Any], business_connection_id: Optional[str] = None,
+                   message_thread_id: Optional[int] = None, bot_id: Optional[int] = None) -> bool:
+        return await self._call(self.storage.save, chat_id, user_id, data, business_connection_id=business_connection_id,
+                                message_thread_id=message_thread_id, bot_id=bot_id)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.storage.close)
@@ -0,0 +1,108 @@
+"""
+Количество запросов при сборке карточки db.build_card на базе SQLite в памяти.
+"""
+import pytest
+import sqlalchemy as sq
+
+from sqlalchemy.orm import Session, sessionmaker
+
+import db
+
+MAX_QUERIES_PER_CARD: int = 1
+
+
+@pytest.fixture
+def engine() -> sq.engine.Engine:
+    engine = sq.create_engine('sqlite://')
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine: sq.engine.Engine) -> Session:
+    caches = db.Caches()
+    db.bootstrap(engine, caches)
+    with sessionmaker(bind=engine, info={'caches': caches})() as session:
+        yield session
+
+
+@pytest.fixture
+def queries(engine: sq.engine.Engine) -> list:
+    statements = []
+    sq.event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *_: statements.append(statement))
+    return statements
+
+
+def add_words(session: Session, user_id: int, words: list) -> None:
+    for word in words:
+        assert db.add_word(session, word, f'перевод {word}', user_id)[1]
+
+
+def test_warm_build_card_runs_one_query(session: Session, queries: list) -> None:
+    user_id = db.upsert_user(session, 'alice')
+    add_words(session, user_id, ['cart', 'cast', 'catch', 'elegant', 'relevant'])
+    recent = []
+    db.build_card(session, user_id, recent)
+    for _ in range(50):
+        queries.clear()
+        card = db.build_card(session, user_id, recent)
+        assert len(queries) <= MAX_QUERIES_PER_CARD, queries
+        recent = (recent + [card.word_id])[-5:]
+
+
+def test_warm_build_card_with_due_words_runs_one_query(session: Session, queries: list) -> None:
+    user_id = db.upsert_user(session, 'bob')
+    add_words(session, user_id, ['apple', 'apply'])
+    for word_id in session.scalars(sq.select(db.UserWord.word_id).where(db.UserWord.user_id == user_id)):
+        db.record_answer(session, user_id, word_id, 0)
+    session.execute(sq.update(db.UserWord).where(db.UserWord.user_id == user_id).values(due_at=db.utcnow()))
+    session.commit()
+    db.build_card(session, user_id, [])
+    queries.clear()
+    card = db.build_card(session, user_id, [])
+    assert len(queries) <= MAX_QUERIES_PER_CARD, queries
+    assert card.target_word in ('apple', 'apply')
+
+
+def test_distractors_come_from_users_vocabulary(session: Session) -> None:
+    alice, bob = db.upsert_user(session, 'alice'), db.upsert_user(session, 'bob')
+    add_words(session, alice, ['cart', 'cast'])
+    add_words(session, bob, ['cats', 'catty'])
+    vocabulary = {word for word, in session.execute(
+        sq.select(db.Words.target_word).join(db.UserWord)
+        .where(db.UserWord.user_id.in_([alice, db.INITIAL_USER_ID]))
+    )}
+    for _ in range(20):
+        card = db.build_card(session, alice, [])
+        assert set(card.others) <= vocabulary
+
+
+def test_new_words_are_sampled_randomly(session: Session) -> None:
+    user_id = db.upsert_user(session, 'carol')
+    add_words(session, user_id, [f'w{i:03}' for i in range(100)])
+    recent = []
+    targets = set()
+    for _ in range(30):
+        card = db.build_card(session, user_id, recent)
+        targets.add(card.word_id)
+        recent = (recent + [card.word_id])[-5:]
+    assert len(targets) > 10
+
+
+def test_expired_pools_are_reloaded_only_after_changes(engine: sq.engine.Engine, session: Session,
+                                                       queries: list) -> None:
+    user_id = db.upsert_user(session, 'dave')
+    add_words(session, user_id, ['cart', 'cast'])
+    sampler = db.session_caches(session).sampler
+    sampler.ttl = 0
+    db.build_card(session, user_id, [])
+    queries.clear()
+    db.build_card(session, user_id, [])
+    # Пулы устарели, но отметки изменений не сдвинулись: сверка отметок и сама карточка
+    assert len(queries) <= MAX_QUERIES_PER_CARD + 1, queries
+
+    # Слово добавляет другой процесс со своими кэшами
+    with sessionmaker(bind=engine, info={'caches': db.Caches()})() as other:
+        add_words(other, user_id, ['catch'])
+    db.build_card(session, user_id, [])
+    assert len(sampler.sample(user_id, 100)) == len(db.INITIAL_DATA) + 3
@@ -0,0 +1,161 @@
+import random
+import re
+
+from typing import Dict, List, Tuple
+
+from telebot import types
+from telebot.states import StatesGroup, State
+
+from chat_state import ChatState
+from db import AnswerStats
+
+IMPORT_EXTENSIONS: Tuple[str, ...] = ('.csv', '.tsv', '.txt')
+IMPORT_MAX_SIZE: int = 20 * 2 ** 20
+
+HELP_TEXT: str = """
+        🤖 **Описание программы:**
+        Этот бот помогает вам учить английские слова. Вы можете добавлять новые слова, удалять их и тренироваться в запоминании.
+
+        🛠 **Доступные команды:**
+        /start или /cards - Начать изучение слов.
+        /help - Показать это сообщение с инструкцией.
+        /stats - Показать статистику ответов и самые трудные слова.
+
+        🎮 **Как пользоваться:**
+        1. Бот покажет вам слово на русском языке и несколько вариантов перевода на английский.
+        2. Выберите правильный перевод слова.
+        3. Если вы ошиблись, бот подскажет что перевод выбран неверно. Попробуйте еще раз.
+        4. Используйте кнопку "Дальше ⏭", чтобы перейти к следующему слову.
+
+        ➕ **Добавление слов:**
+        - Нажмите кнопку "Добавить слово ➕".
+        - Введите слово и его перевод через пробел (например, "cat кот").
+        - Или отправьте CSV/TSV файл, где в каждой строке слово и его перевод.
+
+        🔙 **Удаление слов:**
+        - Нажмите кнопку "Удалить слово🔙".
+        - Введите слово, которое хотите удалить, или несколько слов через пробел или запятую.
+
+        """
+
+
+def show_hint(*lines: str) -> str:
+    """
+    Функция для отображения подсказки пользовтелю
+    :param lines: Произвольное количество строк, которые будут объединены в одну подсказку.
+    :return: Объединненая строка подсказки
+    """
+    return '\n'.join(lines)
+
+
+def split_words(text: str) -> List[str]:
+    """
+    Функция для разбора списка слов, введенных через пробел или запятую.
+    :param text: Текст сообщения
+    :return: Слова в нижнем регистре без повторов
+    """
+    return list(dict.fromkeys(word for word in re.split(r'[\s,;]+', text.strip().lower()) if word))
+
+
+def show_deleted(username: str, deleted: List[str], missing: List[str]) -> str:
+    """
+    Функция для отображения результата удаления слов.
+    :param username: Имя пользователя
+    :param deleted: Удаленные слова
+    :param missing: Слова, которых не было в словаре
+    :return: Текст сообщения
+    """
+    lines: List[str] = []
+    if len(deleted) == 1:
+        lines.append(f'Слово <{deleted[0].capitalize()}> удалено!')
+    elif deleted:
+        lines.append('Удалены слова: ' + ', '.join(f'<{word.capitalize()}>' for word in deleted))
+    if len(missing) == 1:
+        lines.append(f'{username}, нет такого слова в вашем словаре!!!' if not deleted
+                     else f'Слова <{missing[0].capitalize()}> нет в вашем словаре')
+    elif missing:
+        lines.append(f'{username}, этих слов нет в вашем словаре: ' + ', '.join(f'<{word.capitalize()}>' for word in missing))
+    return show_hint(*lines)
+
+
+def show_target(data: Dict[str, str]) -> str:
+    """
+    Функция для отображения целевого слова и его перевода.
+    :param data: Словарь содержащий целевое слово и его перевод
+    :return: Строка с целевым словом и переводом
+    """
+    return f"{data['target_word']} -> {data['translate_word']}"
+
+
+def show_stats(stats: AnswerStats, hardest: List[Tuple[str, str, float]]) -> str:
+    """
+    Функция для отображения статистики ответов пользователя.
+    :param stats: Сводная статистика ответов
+    :param hardest: Самые трудные слова с переводами
+    :return: Текст статистики
+    """
+    accuracy: float = 100 * stats.correct / stats.answers if stats.answers else 0.0
+    lines: List[str] = ["📊 Статистика",
+                        f"Ответов: {stats.answers}, верных: {stats.correct} ({accuracy:.0f}%)",
+                        f"Серия верных ответов: {stats.streak}, лучшая: {stats.best_streak}"]
+    if hardest:
+        lines.append("Самые трудные слова:")
+        lines.extend(f"🇬🇧 {word.capitalize()} -> 🇷🇺 {translate.capitalize()}" for word, translate, _ in hardest)
+    return show_hint(*lines)
+
+
+class Command:
+    """
+    Класс, содержащий команды для взаимодействия с пользователем
+    """
+    ADD_WORD: str = 'Добавить слово ➕'
+    DELETE_WORD: str = 'Удалить слово🔙'
+    NEXT: str = 'Дальше ⏭'
+
+
+class MyStates(StatesGroup):
+    """
+    Класс для упарвления состоянием бота
+    """
+    target_word: State  = State()
+    translate_word: State  = State()
+    another_words: State  = State()
+    # Используются асинхронным режимом вместо register_next_step_handler
+    adding_word: State = State()
+    deleting_word: State = State()
+
+
+def create_markup(buttons: List[types.KeyboardButton]) -> types.ReplyKeyboardMarkup:
+    """
+    Функция для создания клавиатуры с кнопками.
+    :param buttons: Список кнопок клавиатуры
+    :return:Клавиатура
+    """
+    markup: types.ReplyKeyboardMarkup = types.ReplyKeyboardMarkup(row_width=2)
+    markup.add(*buttons)
+    return markup
+
+
+def card_buttons(state: ChatState) -> List[types.KeyboardButton]:
+    """
+    Функция для создания кнопок текущей карточки чата вместе с командными кнопками.
+    :param state: Состояние чата
+    :return: Список кнопок клавиатуры
+    """
+    buttons: List[types.KeyboardButton] = [types.KeyboardButton(text) for text in state.buttons]
+    buttons.extend([types.KeyboardButton(Command.NEXT),
+                    types.KeyboardButton(Command.ADD_WORD),
+                    types.KeyboardButton(Command.DELETE_WORD)])
+    return buttons
+
+
+def card_options(target_word: str, others: List[str]) -> Tuple[str, ...]:
+    """
+    Функция для получения перемешанных подписей кнопок с вариантами ответа.
+    :param target_word: Целевое слово
+    :param others: Неверные варианты ответа
+    :return: Подписи кнопок
+    """
+    options: List[str] = [target_word.capitalize()] + [word.capitalize() for word in others]
+    random.shuffle(options)
+    return tuple(options)
@@ -0,0 +1,166 @@
+"""
+Прием обновлений Telegram через вебхук встроенным HTTP-сервером.
+Сервер проверяет секретный токен, разбирает обновление и сразу отвечает Telegram,
+а обработка выполняется отдельно: в потоках диспетчера (режим sync) или в задачах чатов asyncio (режим async).
+Сервер рассчитан на работу за обратным прокси, который завершает TLS.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+import telebot
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+logger: logging.Logger = logging.getLogger("__BOT__")
+
+SECRET_HEADER: str = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE: int = 1 << 20
+
+
+def check_secret(received: Optional[str], secret: str) -> bool:
+    """
+    Сравнивает секретный токен из заголовка запроса с ожидаемым за постоянное время.
+    """
+    return hmac.compare_digest((received or '').encode(), secret.encode())
+
+
+def resolve_secret(secret: Optional[str], url: Optional[str]) -> str:
+    """
+    Возвращает секретный токен вебхука. Если токен не задан, а вебхук регистрируется при запуске,
+    создается случайный токен; иначе проверить подлинность запросов невозможно.
+    """
+    if secret:
+        return secret
+    if url:
+        return secrets.token_urlsafe(32)
+    raise RuntimeError('Для приема обновлений через вебхук задайте WEBHOOK_SECRET или WEBHOOK_URL')
+
+
+def parse_update(body: bytes) -> Optional[types.Update]:
+    """
+    :return: Обновление Telegram или None, если тело запроса не является обновлением.
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'update_id' not in data:
+        return None
+    return types.Update.de_json(data)
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """
+    HTTP-сервер вебхука для синхронного режима. Обновление передается в submit без ожидания,
+    при переполнении очереди Telegram получает 503 и повторит доставку позже.
+    """
+    daemon_threads = True
+
+    def __init__(self, host: str, port: int, path: str, secret: str,
+                 submit: Callable[[types.Update], bool]) -> None:
+        """
+        :param host: Адрес для прослушивания.
+        :param port: Порт, 0 — выбрать свободный.
+        :param path: Путь, на который Telegram отправляет обновления.
+        :param secret: Секретный токен, переданный в setWebhook.
+        :param submit: Функция, ставящая обновление в очередь обработки; возвращает False, если очередь переполнена.
+        """
+        self.webhook_path = path
+        self.secret = secret
+        self.submit = submit
+        super().__init__((host, port), _WebhookHandler)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _reply(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        if self.path != self.server.webhook_path:
+            return self._reply(404)
+        if not check_secret(self.headers.get(SECRET_HEADER), self.server.secret):
+            return self._reply(403)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_SIZE:
+            return self._reply(413)
+        update = parse_update(self.rfile.read(length))
+        if update is None:
+            return self._reply(400)
+        self._reply(200 if self.server.submit(update) else 503)
+
+
+def set_webhook(bot, url: str, secret: str, max_connections: int):
+    """
+    Регистрирует вебхук в Telegram. Для AsyncTeleBot возвращает корутину.
+    """
+    return bot.set_webhook(url=url, secret_token=secret, max_connections=max_connections,
+                           drop_pending_updates=True)
+
+
+def serve(bot: telebot.TeleBot, submit: Callable[[types.Update], bool], host: str, port: int, path: str,
+          secret: str, url: Optional[str] = None, max_connections: int = 40) -> None:
+    """
+    Принимает обновления через вебхук до остановки процесса.
+    :param bot: Экземпляр TeleBot.
+    :param submit: Функция, ставящая обновление в очередь обработки, например ChatDispatcher.submit с block=False.
+    :param host: Адрес для прослушивания.
+    :param port: Порт.
+    :param path: Путь вебхука.
+    :param secret: Секретный токен.
+    :param url: Публичный адрес вебхука; если задан, вебхук регистрируется в Telegram при запуске.
+    :param max_connections: Максимальное количество одновременных соединений Telegram с сервером.
+    """
+    server = WebhookServer(host, port, path, secret, submit)
+    if url:
+        set_webhook(bot, url, secret, max_connections)
+    logger.info('Вебхук принимает обновления на %s:%s%s', host, server.server_address[1], path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+async def serve_async(bot: AsyncTeleBot, submit: Callable[[types.Update], bool], host: str, port: int, path: str,
+                      secret: str, url: Optional[str] = None, max_connections: int = 40) -> None:
+    """
+    Принимает обновления через вебхук в асинхронном режиме. Обновление передается в submit без ожидания,
+    при переполнении очереди Telegram получает 503 и повторит доставку позже.
+    Параметры совпадают с serve; submit — например AsyncChatDispatcher.submit.
+    """
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        if not check_secret(request.headers.get(SECRET_HEADER), secret):
+            return web.Response(status=403)
+        if (request.content_length or 0) > MAX_BODY_SIZE:
+            return web.Response(status=413)
+        update = parse_update(await request.read())
+        if update is None:
+            return web.Response(status=400)
+        return web.Response(status=200 if submit(update) else 503)
+
+    app = web.Application(client_max_size=MAX_BODY_SIZE)
+    app.router.add_post(path, handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if url:
+        await set_webhook(bot, url, secret, max_connections)
+    logger.info('Вебхук принимает обновления на %s:%s%s', host, port, path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()